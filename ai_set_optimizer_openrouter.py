@@ -12,6 +12,11 @@ import time
 from collections import Counter, defaultdict
 
 from set_file_updater import update_parameters
+from prompt_compactor import DEFAULT_TOKEN_BUDGET, build_budgeted_prompt
+from file_cache import cached_file_result
+
+OPENROUTER_API_URL_DEFAULT = "https://openrouter.ai/api/v1/chat/completions"
+OPENROUTER_API_URL_ENV = "OPENROUTER_API_URL"
 
 # --- Logging Setup ---
 # class FlushFileHandler(logging.FileHandler):
@@ -82,41 +87,25 @@ def read_file_head(path, max_chars=8000):
     try:
         with open(path, encoding='utf-8') as f:
             result = f.read(max_chars)
-        logger.info(f"Read {min(len(result), max_chars)} characters from {path}")
+        logger.info(f"Read {len(result)} characters from {path}")
         return result
     except Exception as e:
         logger.error(f"Failed to read file head from {path}: {e}")
         return ""
 
+def _read_text(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
 def load_prompt_template(template_path):
     try:
-        with open(template_path, encoding="utf-8") as f:
-            content = f.read()
+        content = cached_file_result("prompt_template", template_path, _read_text)
         logger.info(f"Loaded prompt template from {template_path}")
         return content
     except Exception as e:
         logger.error(f"Failed to load prompt template from {template_path}: {e}")
         return ""
 
-def build_ancestry_chain(conn, start_set_file_name):
-    cur = conn.cursor()
-    cur.execute("SELECT set_file_name, input_set_file FROM test_metrics")
-    file_map = {row[0]: row[1] for row in cur.fetchall()}
-    ancestry = []
-    current = start_set_file_name
-    while current and current not in ancestry:
-        ancestry.append(current)
-        input_file = file_map.get(current)
-        if input_file:
-            parent = os.path.basename(input_file)
-            if parent == current:
-                break
-            current = parent
-        else:
-            break
-    logger.info(f"Ancestry chain for {start_set_file_name}: {ancestry}")
-    return ancestry
-
 def parse_param_to_section(spec_content):
     param_to_section = {}
     lines = [l.strip() for l in spec_content.splitlines() if l.strip()]
@@ -139,44 +128,141 @@ def parse_param_to_section(spec_content):
     logger.info(f"Parsed {len(param_to_section)} param-to-section mappings.")
     return param_to_section
 
-def fetch_suggestions_for_ancestry_sections(conn, ancestry, param_to_section=None):
-    if not ancestry:
-        return []
-    placeholders = ','.join(['?'] * len(ancestry))
-    sql = f"""
-    SELECT p.parameter_name
-    FROM set_file_steps AS s
-    JOIN optimization_suggestion AS sug ON s.id = sug.step_id
+def load_param_to_section(spec_path):
+    """
+    parse_param_to_section for a spec file, memoized by file identity (path, mtime, size).
+    A missing or unreadable spec gives {} (no section filtering), as read_file_head degrades to "".
+    """
+    try:
+        return cached_file_result(
+            "param_to_section", spec_path, lambda path: parse_param_to_section(_read_text(path))
+        )
+    except (OSError, UnicodeDecodeError) as e:
+        logger.error(f"Failed to read spec file {spec_path}: {e}")
+        return {}
+
+def _walk_lineage(get_parent, start_set_file_name):
+    """Follows input_set_file links from start_set_file_name; returns the chain (start first)."""
+    chain = []
+    current = start_set_file_name
+    while current and current not in chain:
+        chain.append(current)
+        input_file = get_parent(current)
+        if input_file:
+            parent = os.path.basename(input_file)
+            if parent == current:
+                break
+            current = parent
+        else:
+            break
+    return chain
+
+def find_lineage_root(conn, set_file_name):
+    """
+    Returns the oldest ancestor of set_file_name (the lineage root).
+    Walks test_metrics one indexed lookup per generation instead of loading the whole table.
+    """
+    cur = conn.cursor()
+
+    def get_parent(name):
+        row = cur.execute(
+            "SELECT input_set_file FROM test_metrics WHERE set_file_name = ? ORDER BY id DESC LIMIT 1",
+            (name,)
+        ).fetchone()
+        return row[0] if row else None
+
+    chain = _walk_lineage(get_parent, set_file_name)
+    return chain[-1] if chain else set_file_name
+
+def rebuild_suggestion_param_counts(conn):
+    """Recomputes suggestion_param_counts from optimization_suggestion/optimization_parameter."""
+    cur = conn.cursor()
+    cur.execute("SELECT set_file_name, input_set_file FROM test_metrics")
+    file_map = {row[0]: row[1] for row in cur.fetchall()}
+    cur.execute("""
+    SELECT tm.set_file_name, p.parameter_name
+    FROM optimization_suggestion AS sug
     JOIN optimization_parameter AS p ON sug.id = p.suggestion_id
-    JOIN test_metrics AS tm ON tm.step_id = s.id
-    WHERE tm.set_file_name IN ({placeholders})
+    JOIN test_metrics AS tm ON tm.step_id = sug.step_id
+    """)
+    counts = Counter()
+    roots = {}
+    for set_file_name, pname in cur.fetchall():
+        if set_file_name not in roots:
+            chain = _walk_lineage(file_map.get, set_file_name)
+            roots[set_file_name] = chain[-1] if chain else set_file_name
+        counts[(roots[set_file_name], pname)] += 1
+    cur.execute("DELETE FROM suggestion_param_counts")
+    cur.executemany(
+        "INSERT INTO suggestion_param_counts (lineage_root, parameter_name, suggestion_count) VALUES (?, ?, ?)",
+        [(root, pname, count) for (root, pname), count in counts.items()]
+    )
+    logger.info(f"Rebuilt suggestion_param_counts: {len(counts)} rows.")
+
+SUGGESTION_PARAM_COUNTS_SCHEMA = ("suggestion_param_counts", "idx_test_metrics_set_file_name", "idx_test_metrics_step_id")
+
+def ensure_suggestion_param_counts_table(conn):
+    """
+    Creates the materialized suggestion_param_counts table (and the test_metrics lookup indexes).
+    Backfills it from the existing suggestion tables the first time it is created.
+    Call once per connection, before using the table; when everything already exists this is one
+    sqlite_master read, with no DDL and no commit.
     """
     cur = conn.cursor()
-    cur.execute(sql, ancestry)
-    rows = [row[0] for row in cur.fetchall()]
-    if param_to_section is not None:
-        result = [(param_to_section.get(p, "Unknown Section"), p) for p in rows]
-    else:
-        result = [("Unknown Section", p) for p in rows]
-    logger.info(f"Fetched {len(result)} suggestions for ancestry sections.")
-    return result
+    placeholders = ",".join("?" * len(SUGGESTION_PARAM_COUNTS_SCHEMA))
+    present = {row[0] for row in cur.execute(
+        f"SELECT name FROM sqlite_master WHERE name IN ({placeholders})", SUGGESTION_PARAM_COUNTS_SCHEMA
+    )}
+    if present.issuperset(SUGGESTION_PARAM_COUNTS_SCHEMA):
+        return
+    exists = "suggestion_param_counts" in present
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS suggestion_param_counts (
+        lineage_root TEXT NOT NULL,
+        parameter_name TEXT NOT NULL,
+        suggestion_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (lineage_root, parameter_name)
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_test_metrics_set_file_name ON test_metrics (set_file_name)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_test_metrics_step_id ON test_metrics (step_id)")
+    if not exists:
+        rebuild_suggestion_param_counts(conn)
+    conn.commit()
 
-def make_suggestion_history_summary_block(conn, set_file_name, spec_content=None):
-    param_to_section = None
-    if spec_content:
+def increment_suggestion_param_counts(conn, lineage_root, parameter_names):
+    """Adds one suggestion per parameter name to the lineage's counters (caller commits)."""
+    conn.executemany(
+        """
+        INSERT INTO suggestion_param_counts (lineage_root, parameter_name, suggestion_count)
+        VALUES (?, ?, 1)
+        ON CONFLICT (lineage_root, parameter_name)
+        DO UPDATE SET suggestion_count = suggestion_count + 1
+        """,
+        [(lineage_root, pname) for pname in parameter_names]
+    )
+
+def make_suggestion_history_summary_block(conn, set_file_name, spec_content=None, param_to_section=None):
+    """Per-section counts of the parameters suggested in the set's lineage (conn has had ensure_suggestion_param_counts_table)."""
+    if param_to_section is None and spec_content:
         param_to_section = parse_param_to_section(spec_content)
-    ancestry = build_ancestry_chain(conn, set_file_name)
-    section_param_pairs = fetch_suggestions_for_ancestry_sections(conn, ancestry, param_to_section)
+    lineage_root = find_lineage_root(conn, set_file_name)
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT parameter_name, suggestion_count FROM suggestion_param_counts WHERE lineage_root = ?",
+        (lineage_root,)
+    )
     section_param_counter = defaultdict(Counter)
-    for section, pname in section_param_pairs:
-        section_param_counter[section][pname] += 1
+    for pname, count in cur.fetchall():
+        section = param_to_section.get(pname, "Unknown Section") if param_to_section is not None else "Unknown Section"
+        section_param_counter[section][pname] += count
     lines = []
     for section in sorted(section_param_counter):
         lines.append(f"Section: {section}")
         for pname, count in sorted(section_param_counter[section].items(), key=lambda x: (-x[1], x[0])):
             lines.append(f"  {pname}: {count}   # times previously suggested")
         lines.append("")  # Blank line for separation
-    logger.info(f"Suggestion history summary block built for {set_file_name}.")
+    logger.info(f"Suggestion history summary block built for {set_file_name} (lineage root {lineage_root}).")
     return "\n".join(lines).strip()
 
 def build_prompt_with_history(
@@ -201,62 +287,135 @@ def build_prompt_with_history(
     logger.info("Prompt with history built.")
     return prompt
 
+class SuggestionAlreadySaved(Exception):
+    """Raised by an on_saved hook when the suggestion was already saved (e.g. by an earlier attempt of a queued job)."""
+
+    def __init__(self, suggestion_id):
+        super().__init__(f"suggestion already saved as suggestion_id={suggestion_id}")
+        self.suggestion_id = suggestion_id
+
 def save_optimization_suggestion_to_db(
-    db_path, step_id, mode_sections_obj, param_array
+    db_path, step_id, mode_sections_obj, param_array, set_file_name=None, on_saved=None
 ):
+    """
+    Saves the suggestion and counts its parameters in one transaction; returns the suggestion_id.
+    on_saved(conn, suggestion_id) runs inside that transaction before the commit (the queue records
+    the id on its job row there); anything it raises rolls the whole save back.
+    """
     conn = sqlite3.connect(db_path)
     #conn.execute("PRAGMA key = 'Kh78784bt!'")
-    c = conn.cursor()
-    c.execute(
-        "INSERT INTO optimization_suggestion (step_id, mode) VALUES (?, ?)",
-        (step_id, mode_sections_obj['mode'])
-    )
-    suggestion_id = c.lastrowid
-    for section in mode_sections_obj['sections']:
+    try:
+        ensure_suggestion_param_counts_table(conn)
+        c = conn.cursor()
+        if set_file_name is None:
+            row = c.execute(
+                "SELECT set_file_name FROM test_metrics WHERE step_id = ? ORDER BY id DESC LIMIT 1",
+                (step_id,)
+            ).fetchone()
+            set_file_name = row[0] if row else None
         c.execute(
-            "INSERT INTO optimization_section (suggestion_id, section_name, explanation) VALUES (?, ?, ?)",
-            (suggestion_id, section['name'], section['explanation'])
+            "INSERT INTO optimization_suggestion (step_id, mode) VALUES (?, ?)",
+            (step_id, mode_sections_obj['mode'])
         )
-    for param in param_array:
-        c.execute(
-            "INSERT INTO optimization_parameter (suggestion_id, parameter_name, start, end, step, reason) VALUES (?, ?, ?, ?, ?, ?)",
-            (
-                suggestion_id,
-                param['name'],
-                param.get('start'),
-                param.get('end'),
-                param.get('step'),
-                param.get('reason')
+        suggestion_id = c.lastrowid
+        for section in mode_sections_obj['sections']:
+            c.execute(
+                "INSERT INTO optimization_section (suggestion_id, section_name, explanation) VALUES (?, ?, ?)",
+                (suggestion_id, section['name'], section['explanation'])
             )
-        )
-    conn.commit()
-    conn.close()
+        for param in param_array:
+            c.execute(
+                "INSERT INTO optimization_parameter (suggestion_id, parameter_name, start, end, step, reason) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    suggestion_id,
+                    param['name'],
+                    param.get('start'),
+                    param.get('end'),
+                    param.get('step'),
+                    param.get('reason')
+                )
+            )
+        if set_file_name:
+            increment_suggestion_param_counts(
+                conn, find_lineage_root(conn, set_file_name), [param['name'] for param in param_array]
+            )
+        else:
+            logger.warning(f"No test_metrics row for step_id={step_id}; suggestion_param_counts not updated.")
+        if on_saved is not None:
+            on_saved(conn, suggestion_id)
+        conn.commit()
+    except Exception:
+        # Release the write lock right away (queue workers share the database)
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
     logger.info(f"Saved optimization suggestion to DB with suggestion_id={suggestion_id}")
     return suggestion_id
 
+def load_optimization_suggestion(db_path, suggestion_id):
+    """(mode_sections_obj, param_array) of a saved suggestion, as save_optimization_suggestion_to_db received them."""
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        row = conn.execute("SELECT mode FROM optimization_suggestion WHERE id = ?", (suggestion_id,)).fetchone()
+        if row is None:
+            raise ValueError(f"No optimization_suggestion with id={suggestion_id}")
+        sections = conn.execute(
+            "SELECT section_name, explanation FROM optimization_section WHERE suggestion_id = ? ORDER BY id",
+            (suggestion_id,)
+        ).fetchall()
+        params = conn.execute(
+            "SELECT parameter_name, start, end, step, reason FROM optimization_parameter WHERE suggestion_id = ? ORDER BY id",
+            (suggestion_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    mode_sections_obj = {
+        "mode": row[0],
+        "sections": [{"name": name, "explanation": explanation} for name, explanation in sections],
+    }
+    param_array = [
+        {"name": name, "start": start, "end": end, "step": step, "reason": reason}
+        for name, start, end, step, reason in params
+    ]
+    return mode_sections_obj, param_array
+
 import openpyxl
 
+def _read_performance_metrics_block(config_xlsx_path, sheet_name):
+    wb = openpyxl.load_workbook(config_xlsx_path, data_only=True)
+    ws = wb[sheet_name]
+    rows = list(ws.iter_rows(min_row=2, values_only=True))
+    lines = []
+    for row in rows:
+        if row and row[0]:
+            key = str(row[0])
+            value = str(row[1]) if len(row) > 1 and row[1] is not None else ""
+            explanation = str(row[2]) if len(row) > 2 and row[2] is not None else ""
+            lines.append(f"{key}: {value}   # {explanation}")
+    return "\n".join(lines)
+
 def get_performance_metrics_block(config_xlsx_path, sheet_name="performance_criteria"):
     try:
-        wb = openpyxl.load_workbook(config_xlsx_path, data_only=True)
-        ws = wb[sheet_name]
-        headers = [cell.value for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-        rows = list(ws.iter_rows(min_row=2, values_only=True))
-        lines = []
-        for row in rows:
-            if row and row[0]:
-                key = str(row[0])
-                value = str(row[1]) if len(row) > 1 and row[1] is not None else ""
-                explanation = str(row[2]) if len(row) > 2 and row[2] is not None else ""
-                lines.append(f"{key}: {value}   # {explanation}")
+        block = cached_file_result(
+            "performance_metrics_block", config_xlsx_path,
+            lambda path: _read_performance_metrics_block(path, sheet_name),
+            extra_key=sheet_name
+        )
         logger.info(f"Performance metrics block loaded from {config_xlsx_path}.")
-        return "\n".join(lines)
+        return block
     except Exception as e:
         logger.warning(f"Failed to load performance metrics block: {e}")
         return ""
 
-def call_openrouter(prompt, model, api_key):
-    url = "https://openrouter.ai/api/v1/chat/completions"
+def call_openrouter(prompt, model, api_key, api_url=None):
+    """
+    Sends the prompt to an OpenRouter-compatible chat completions endpoint.
+    api_url defaults to $OPENROUTER_API_URL, then OPENROUTER_API_URL_DEFAULT
+    (point it at mock_llm_server.py for offline load tests).
+    """
+    url = api_url or os.environ.get(OPENROUTER_API_URL_ENV) or OPENROUTER_API_URL_DEFAULT
     headers = {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
@@ -307,6 +466,36 @@ def coverage_voting(all_param_arrays):
     logger.info(f"Coverage voting merged {len(merged)} parameter ranges.")
     return merged
 
+def _write_suggestion_outputs(set_path, output_path, suggestion_json_path, mode_sections_obj, param_array, prompt=None):
+    """Writes the suggestion JSON, the prompt (when given) and the suggested .set file."""
+    # Optionally write to files for backup/debugging
+    suggestion_json_save_path = suggestion_json_path if suggestion_json_path else output_path + ".suggestions.json"
+    try:
+        with open(suggestion_json_save_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "mode_sections": mode_sections_obj,
+                "parameters": param_array
+            }, f, indent=2)
+        logger.info(f"Suggestion JSON written to {suggestion_json_save_path}")
+    except Exception as e:
+        logger.error(f"Failed to write suggestion JSON: {e}")
+
+    prompt_save_path = suggestion_json_path.replace(".json", ".prompt.txt") if suggestion_json_path else output_path + ".prompt.txt"
+    # --- Save prompt to file if path given ---
+    if prompt is not None:
+        try:
+            with open(prompt_save_path, "w", encoding="utf-8") as f:
+                f.write(prompt)
+            logger.info(f"Prompt saved to {prompt_save_path}")
+        except Exception as e:
+            logger.error(f"Failed to write prompt.txt: {e}")
+
+    try:
+        update_parameters(set_path, param_array, output_path)
+        logger.info(f"Updated .set file written to: {output_path}")
+    except Exception as e:
+        logger.error(f"Failed to update .set file: {e}")
+
 def suggest_mode_and_sections_and_params_openrouter(
     template_path,
     base_parameters,
@@ -320,10 +509,26 @@ def suggest_mode_and_sections_and_params_openrouter(
     config_xlsx_path=None,
     suggestion_json_path=None,
     models=None,
-    wave_analysis_block=None
+    wave_analysis_block=None,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    call_ai=None,
+    on_saved=None,
+    saved_suggestion_id=None
 ):
+    """
+    Builds the prompt, queries every model, merges the suggestions and writes the suggested .set.
+    call_ai(prompt, model, api_key): optional replacement for call_openrouter
+    (e.g. the rate-limited caller used by ai_suggestion_queue).
+    on_saved: passed to save_optimization_suggestion_to_db; when it raises SuggestionAlreadySaved
+    the new suggestion is discarded and the saved one is used.
+    saved_suggestion_id: a suggestion saved by an earlier attempt; its files are rewritten from
+    the database without querying the models or saving again.
+    Returns output_path, or None when no model produced a valid suggestion.
+    """
     import os
 
+    call_ai = call_ai or call_openrouter
+
     # Defensive: Ensure models is a list, even if passed as a string.
     if models is None:
         models = ["openai/gpt-4o"]
@@ -342,10 +547,17 @@ def suggest_mode_and_sections_and_params_openrouter(
             logger.error(f"{label} does not exist: {fpath}")
             return None
 
+    if saved_suggestion_id:
+        logger.info(f"Reusing saved suggestion_id={saved_suggestion_id}; models are not queried again.")
+        mode_sections_obj, param_array = load_optimization_suggestion(db_path, saved_suggestion_id)
+        _write_suggestion_outputs(set_path, output_path, suggestion_json_path, mode_sections_obj, param_array)
+        return output_path
+
     prompt_template = load_prompt_template(template_path)
-    set_content = read_file_head(set_path, 8000)
-    phoenix_spec_content = read_file_head(spec_path, 8000)
-    summary_csv_content = read_file_head(summary_path, 8000)
+    # Read whole files; build_budgeted_prompt compacts them instead of cutting at a character count
+    set_content = read_file_head(set_path, None)
+    phoenix_spec_content = read_file_head(spec_path, None)
+    summary_csv_content = read_file_head(summary_path, None)
     base_parameters_list = [s.strip() for s in base_parameters.split(",") if s.strip()]
     if config_xlsx_path:
         performance_metrics_block = get_performance_metrics_block(config_xlsx_path)
@@ -354,30 +566,33 @@ def suggest_mode_and_sections_and_params_openrouter(
     set_file_name = os.path.basename(set_path)
     conn = sqlite3.connect(db_path)
     #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    ensure_suggestion_param_counts_table(conn)
     suggestion_history_summary_block = make_suggestion_history_summary_block(
-        conn, set_file_name, spec_content=phoenix_spec_content
+        conn, set_file_name, param_to_section=load_param_to_section(spec_path)
     )
     conn.close()
-    prompt = build_prompt_with_history(
-        prompt_template,
-        base_parameters_list,
+    prompt, token_count = build_budgeted_prompt(
+        lambda set_part, spec_part, summary_part, history_part: build_prompt_with_history(
+            prompt_template,
+            base_parameters_list,
+            set_part,
+            spec_part,
+            summary_part,
+            performance_metrics_block,
+            history_part,
+            wave_analysis_block
+        ),
         set_content,
         phoenix_spec_content,
         summary_csv_content,
-        performance_metrics_block,
         suggestion_history_summary_block,
-        wave_analysis_block  # <--- NEW: pass here
+        base_parameters=base_parameters_list,
+        models=models,
+        token_budget=token_budget
     )
 
     logger.info(f"Models: {models}")
-    logger.info(f"Prompt size: {len(prompt)} chars")
-    # try:
-    #     import tiktoken
-    #     enc = tiktoken.encoding_for_model("gpt-4o")
-    #     token_count = len(enc.encode(prompt))
-    #     logger.info(f"Prompt token count: {token_count}")
-    # except Exception as e:
-    #     logger.warning(f"Could not count prompt tokens: {e}")
+    logger.info(f"Prompt size: {len(prompt)} chars, {token_count} tokens (budget {token_budget})")
 
     all_mode_sections = []
     all_param_arrays = []
@@ -387,7 +602,7 @@ def suggest_mode_and_sections_and_params_openrouter(
             # Use the robust retry logic for valid JSON extraction
             debug_path = output_path + f".{model.replace('/','_')}.suggestions.txt"
             valid_jsons = get_valid_json_from_ai(
-                lambda p, m=model: call_openrouter(p, m, openrouter_api_key),
+                lambda p, m=model: call_ai(p, m, openrouter_api_key),
                 prompt,
                 model=model,
                 max_attempts=3,
@@ -408,36 +623,19 @@ def suggest_mode_and_sections_and_params_openrouter(
     merged_param_array = coverage_voting(all_param_arrays)
     final_mode_sections_obj = all_mode_sections[0] if all_mode_sections else {"mode": "", "sections": []}
 
-    suggestion_id = save_optimization_suggestion_to_db(
-        db_path, step_id, final_mode_sections_obj, merged_param_array
-    )
-
-    # Optionally write to files for backup/debugging
-    suggestion_json_save_path = suggestion_json_path if suggestion_json_path else output_path + ".suggestions.json"
     try:
-        with open(suggestion_json_save_path, "w", encoding="utf-8") as f:
-            json.dump({
-                "mode_sections": final_mode_sections_obj,
-                "parameters": merged_param_array
-            }, f, indent=2)
-        logger.info(f"Suggestion JSON written to {suggestion_json_save_path}")
-    except Exception as e:
-        logger.error(f"Failed to write suggestion JSON: {e}")
-
-    prompt_save_path = suggestion_json_path.replace(".json", ".prompt.txt") if suggestion_json_path else output_path + ".prompt.txt"
-    # --- Save prompt to file if path given ---
-    try:
-        with open(prompt_save_path, "w", encoding="utf-8") as f:
-            f.write(prompt)
-        logger.info(f"Prompt saved to {prompt_save_path}")
-    except Exception as e:
-        logger.error(f"Failed to write prompt.txt: {e}")
+        suggestion_id = save_optimization_suggestion_to_db(
+            db_path, step_id, final_mode_sections_obj, merged_param_array, set_file_name=set_file_name,
+            on_saved=on_saved
+        )
+    except SuggestionAlreadySaved as e:
+        logger.warning(f"{e}; using the saved suggestion instead of this one.")
+        suggestion_id = e.suggestion_id
+        final_mode_sections_obj, merged_param_array = load_optimization_suggestion(db_path, suggestion_id)
 
-    try:
-        update_parameters(set_path, merged_param_array, output_path)
-        logger.info(f"Updated .set file written to: {output_path}")
-    except Exception as e:
-        logger.error(f"Failed to update .set file: {e}")
+    _write_suggestion_outputs(
+        set_path, output_path, suggestion_json_path, final_mode_sections_obj, merged_param_array, prompt
+    )
 
     logger.info(f"DB: suggestion_id={suggestion_id}. Updated .set file written to: {output_path}")
 
@@ -457,6 +655,7 @@ def main():
     parser.add_argument("--config_xlsx_path", required=False, help="Config.xlsx for performance metrics (optional, for performance criteria)")
     parser.add_argument("--suggestion-json", required=False, help="Output path for suggestion JSON file (default: output.suggestions.json)")
     parser.add_argument("--models", required=False, help="Comma-separated list of OpenRouter model names (e.g. openai/gpt-4o,anthropic/claude-3-opus)")
+    parser.add_argument("--token-budget", required=False, type=int, default=DEFAULT_TOKEN_BUDGET, help="Maximum prompt tokens (default: %(default)s)")
     args = parser.parse_args()
 
     models = None
@@ -476,6 +675,7 @@ def main():
         config_xlsx_path=args.config_xlsx_path,
         suggestion_json_path=args.suggestion_json,
         models=models,
+        token_budget=args.token_budget,
     )
 
     if output_path:
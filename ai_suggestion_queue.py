@@ -0,0 +1,510 @@
+import argparse
+import json
+import random
+import sqlite3
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Job statuses: pending -> running -> done, or back to pending (retry) until max_attempts, then dead
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_DEAD = "dead"
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_WORKERS = 4
+DEFAULT_PROVIDER_CONCURRENCY = 2
+DEFAULT_PROVIDER_RPM = 20
+DEFAULT_LEASE_SEC = 1800
+BACKOFF_BASE_SEC = 30
+BACKOFF_MAX_SEC = 1800
+MAX_RATE_LIMIT_RETRIES = 5
+
+def _connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    return conn
+
+def ensure_suggestion_queue_table(conn):
+    """Creates the ai_suggestion_jobs table used as the suggestion work queue."""
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ai_suggestion_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        step_id INTEGER NOT NULL,
+        test_metrics_id INTEGER,
+        set_path TEXT NOT NULL,
+        summary_path TEXT NOT NULL,
+        output_path TEXT NOT NULL,
+        suggestion_json_path TEXT,
+        config_xlsx_path TEXT NOT NULL,
+        wave_analysis_block TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 4,
+        next_attempt_at REAL NOT NULL DEFAULT 0,
+        lease_expires_at REAL,
+        last_error TEXT,
+        result_path TEXT,
+        suggestion_id INTEGER,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    columns = [row[1] for row in cur.execute("PRAGMA table_info(ai_suggestion_jobs)")]
+    if "suggestion_id" not in columns:
+        cur.execute("ALTER TABLE ai_suggestion_jobs ADD COLUMN suggestion_id INTEGER")
+    cur.execute(
+        "CREATE INDEX IF NOT EXISTS idx_ai_suggestion_jobs_status ON ai_suggestion_jobs (status, next_attempt_at)"
+    )
+
+def enqueue_suggestion_job(
+    db_path,
+    step_id,
+    set_path,
+    summary_path,
+    output_path,
+    config_xlsx_path,
+    suggestion_json_path=None,
+    wave_analysis_block=None,
+    test_metrics_id=None,
+    max_attempts=DEFAULT_MAX_ATTEMPTS
+):
+    """
+    Adds an AI suggestion job to the queue and returns its id.
+    The worker reads template/spec/api key/models from the ai_optimizer sheet of config_xlsx_path.
+    """
+    conn = _connect(db_path)
+    try:
+        ensure_suggestion_queue_table(conn)
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO ai_suggestion_jobs (
+                step_id, test_metrics_id, set_path, summary_path, output_path, suggestion_json_path,
+                config_xlsx_path, wave_analysis_block, max_attempts
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (
+            step_id, test_metrics_id, set_path, summary_path, output_path, suggestion_json_path,
+            config_xlsx_path, wave_analysis_block, max_attempts
+        ))
+        conn.commit()
+        job_id = cur.lastrowid
+    finally:
+        conn.close()
+    logger.info(f"Enqueued AI suggestion job {job_id} for step_id={step_id}: {set_path}")
+    return job_id
+
+def claim_next_job(db_path, lease_sec=DEFAULT_LEASE_SEC):
+    """
+    Atomically claims the oldest due job (pending, or running with an expired lease).
+    Returns the job as a dict, or None when nothing is due.
+    """
+    now = time.time()
+    conn = _connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute("""
+            SELECT * FROM ai_suggestion_jobs
+            WHERE (status = ? AND next_attempt_at <= ?)
+               OR (status = ? AND lease_expires_at < ?)
+            ORDER BY next_attempt_at, id
+            LIMIT 1
+        """, (STATUS_PENDING, now, STATUS_RUNNING, now)).fetchone()
+        if row is None:
+            conn.rollback()
+            return None
+        conn.execute("""
+            UPDATE ai_suggestion_jobs
+            SET status = ?, attempts = attempts + 1, lease_expires_at = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+        """, (STATUS_RUNNING, now + lease_sec, row["id"]))
+        conn.commit()
+        job = dict(row)
+        job["attempts"] += 1
+        return job
+    finally:
+        conn.close()
+
+def complete_job(db_path, job_id, result_path, attempt=None):
+    """
+    Marks the job done. With attempt (the claim's attempt number) the update only applies while
+    that claim still owns the job, so a worker whose lease expired cannot overwrite a newer attempt.
+    """
+    sql = """
+        UPDATE ai_suggestion_jobs
+        SET status = ?, result_path = ?, last_error = NULL, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    """
+    params = [STATUS_DONE, result_path, job_id]
+    if attempt is not None:
+        sql += " AND attempts = ?"
+        params.append(attempt)
+    conn = _connect(db_path)
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+def next_pending_at(db_path):
+    """Earliest next_attempt_at of the pending jobs (due or scheduled for retry), or None when there are none."""
+    conn = _connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT MIN(next_attempt_at) FROM ai_suggestion_jobs WHERE status = ?", (STATUS_PENDING,)
+        ).fetchone()
+    finally:
+        conn.close()
+    return row[0] if row else None
+
+def record_suggestion_hook(job_id):
+    """
+    on_saved hook for save_optimization_suggestion_to_db: stores the new suggestion_id on the job
+    row in the same transaction as the suggestion. If an earlier attempt of the job already saved
+    one, raises SuggestionAlreadySaved so this save is rolled back.
+    """
+    from ai_set_optimizer_openrouter import SuggestionAlreadySaved
+
+    def on_saved(conn, suggestion_id):
+        updated = conn.execute(
+            "UPDATE ai_suggestion_jobs SET suggestion_id = ? WHERE id = ? AND suggestion_id IS NULL",
+            (suggestion_id, job_id)
+        ).rowcount
+        if not updated:
+            row = conn.execute("SELECT suggestion_id FROM ai_suggestion_jobs WHERE id = ?", (job_id,)).fetchone()
+            if row and row[0] is not None:
+                raise SuggestionAlreadySaved(row[0])
+    return on_saved
+
+def backoff_delay(attempts, base=BACKOFF_BASE_SEC, cap=BACKOFF_MAX_SEC):
+    """Exponential backoff with full jitter for the given (1-based) attempt number."""
+    return random.uniform(0, min(cap, base * (2 ** max(attempts - 1, 0))))
+
+def fail_job(db_path, job, error):
+    """
+    Records a failed attempt: reschedules the job with backoff, or dead-letters it
+    once max_attempts is reached. Returns the new status.
+    """
+    if job["attempts"] >= job["max_attempts"]:
+        status, next_attempt_at = STATUS_DEAD, 0
+    else:
+        status, next_attempt_at = STATUS_PENDING, time.time() + backoff_delay(job["attempts"])
+    conn = _connect(db_path)
+    try:
+        # Only while this claim still owns the job (see complete_job)
+        updated = conn.execute("""
+            UPDATE ai_suggestion_jobs
+            SET status = ?, next_attempt_at = ?, last_error = ?, lease_expires_at = NULL, updated_at = CURRENT_TIMESTAMP
+            WHERE id = ? AND attempts = ?
+        """, (status, next_attempt_at, str(error)[:2000], job["id"], job["attempts"])).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    if not updated:
+        logger.warning(f"AI suggestion job {job['id']} attempt {job['attempts']} failed after losing its lease: {error}")
+        return STATUS_RUNNING
+    if status == STATUS_DEAD:
+        logger.error(f"AI suggestion job {job['id']} dead-lettered after {job['attempts']} attempts: {error}")
+    else:
+        logger.warning(f"AI suggestion job {job['id']} attempt {job['attempts']} failed, will retry: {error}")
+    return status
+
+def retry_dead_jobs(db_path, job_ids=None):
+    """Moves dead-lettered jobs (all, or job_ids) back to pending with a fresh attempt count."""
+    conn = _connect(db_path)
+    try:
+        ensure_suggestion_queue_table(conn)
+        sql = """
+            UPDATE ai_suggestion_jobs
+            SET status = ?, attempts = 0, next_attempt_at = 0, updated_at = CURRENT_TIMESTAMP
+            WHERE status = ?
+        """
+        params = [STATUS_PENDING, STATUS_DEAD]
+        if job_ids:
+            sql += f" AND id IN ({','.join(['?'] * len(job_ids))})"
+            params.extend(job_ids)
+        count = conn.execute(sql, params).rowcount
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(f"Re-queued {count} dead-lettered AI suggestion jobs.")
+    return count
+
+def queue_status(db_path):
+    """Returns {status: job count} for the suggestion queue."""
+    conn = _connect(db_path)
+    try:
+        ensure_suggestion_queue_table(conn)
+        rows = conn.execute("SELECT status, COUNT(*) FROM ai_suggestion_jobs GROUP BY status").fetchall()
+    finally:
+        conn.close()
+    return {status: count for status, count in rows}
+
+class TokenBucket:
+    """Thread-safe token bucket: refills rate_per_minute tokens per minute (> 0) up to capacity."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        if not rate_per_minute or rate_per_minute <= 0:
+            raise ValueError(f"rate_per_minute must be > 0, got {rate_per_minute!r}")
+        self.rate = float(rate_per_minute) / 60.0
+        self.capacity = float(capacity or max(1, rate_per_minute))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self):
+        """Empties the bucket (after a 429 the provider budget is clearly used up)."""
+        with self.lock:
+            self.tokens = 0
+            self.updated = time.monotonic()
+
+def provider_of(model):
+    """Provider part of an OpenRouter model name, e.g. "openai" for "openai/gpt-4o"."""
+    return model.split("/")[0] if "/" in model else model
+
+class ProviderRateLimiter:
+    """
+    Limits model calls per provider: at most `concurrency` calls in flight and
+    `rate_per_minute` calls started per minute. HTTP 429 responses are retried
+    after Retry-After (or exponential backoff) up to max_rate_limit_retries times.
+    """
+
+    def __init__(self, concurrency=DEFAULT_PROVIDER_CONCURRENCY, rate_per_minute=DEFAULT_PROVIDER_RPM,
+                 max_rate_limit_retries=MAX_RATE_LIMIT_RETRIES, call_ai=None):
+        if call_ai is None:
+            from ai_set_optimizer_openrouter import call_openrouter
+            call_ai = call_openrouter
+        if not rate_per_minute or rate_per_minute <= 0:
+            # Checked here too: buckets are created lazily, inside the workers
+            raise ValueError(f"provider rate_per_minute must be > 0, got {rate_per_minute!r}")
+        self.call_ai = call_ai
+        self.concurrency = concurrency
+        self.rate_per_minute = rate_per_minute
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.providers = {}
+        self.lock = threading.Lock()
+        self.rate_limited = 0
+
+    def _limits(self, provider):
+        with self.lock:
+            if provider not in self.providers:
+                self.providers[provider] = (
+                    threading.BoundedSemaphore(self.concurrency),
+                    TokenBucket(self.rate_per_minute),
+                )
+            return self.providers[provider]
+
+    def __call__(self, prompt, model, api_key):
+        semaphore, bucket = self._limits(provider_of(model))
+        for attempt in range(self.max_rate_limit_retries + 1):
+            bucket.acquire()
+            with semaphore:
+                try:
+                    return self.call_ai(prompt, model, api_key)
+                except requests.HTTPError as e:
+                    response = e.response
+                    if response is None or response.status_code != 429 or attempt == self.max_rate_limit_retries:
+                        raise
+                    retry_after = response.headers.get("Retry-After")
+            with self.lock:
+                self.rate_limited += 1
+            bucket.drain()
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = backoff_delay(attempt + 1, base=2, cap=60)
+            logger.warning(f"Rate limited by {provider_of(model)} ({model}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+def process_job(db_path, job, config, call_ai):
+    """
+    Runs one suggestion job and records its AI artifacts. Returns the suggested .set path.
+    The suggestion is saved at most once per job: a retry after the save reuses it (job suggestion_id).
+    """
+    from ai_set_optimizer_openrouter import suggest_mode_and_sections_and_params_openrouter
+    from extract_mt4_report_v2 import insert_artifact_files
+
+    token_budget = int(float(config["token_budget"])) if config.get("token_budget") else None
+    output_path = suggest_mode_and_sections_and_params_openrouter(
+        template_path=config.get("template_path"),
+        base_parameters=config.get("base_parameters", ""),
+        set_path=job["set_path"],
+        spec_path=config.get("spec_path"),
+        summary_path=job["summary_path"],
+        openrouter_api_key=config.get("api_key"),
+        output_path=job["output_path"],
+        db_path=db_path,
+        step_id=job["step_id"],
+        config_xlsx_path=job["config_xlsx_path"],
+        suggestion_json_path=job["suggestion_json_path"],
+        models=config.get("models"),
+        wave_analysis_block=job["wave_analysis_block"],
+        call_ai=call_ai,
+        on_saved=record_suggestion_hook(job["id"]),
+        saved_suggestion_id=job.get("suggestion_id"),
+        **({"token_budget": token_budget} if token_budget else {})
+    )
+    if not output_path:
+        raise Exception("No valid parameter suggestions from any model.")
+
+    suggestion_json_path = job["suggestion_json_path"]
+    artifact_files = [{"artifact_type": "ai_set", "file_path": output_path}]
+    if suggestion_json_path:
+        artifact_files.extend([
+            {"artifact_type": "ai_json", "file_path": suggestion_json_path},
+            {"artifact_type": "ai_prompt", "file_path": suggestion_json_path.replace(".json", ".prompt.txt")},
+        ])
+    insert_artifact_files(db_path, job["step_id"], artifact_files, link_id=job["test_metrics_id"])
+    return output_path
+
+def run_suggestion_workers(
+    db_path,
+    workers=DEFAULT_WORKERS,
+    provider_concurrency=DEFAULT_PROVIDER_CONCURRENCY,
+    provider_rpm=DEFAULT_PROVIDER_RPM,
+    max_jobs=None,
+    wait=False,
+    poll_interval=5.0,
+    lease_sec=DEFAULT_LEASE_SEC,
+    call_ai=None,
+    on_job_finished=None
+):
+    """
+    Drains the suggestion queue with a pool of worker threads sharing one ProviderRateLimiter.
+    wait=False: stop once no job is pending (retries scheduled for later included) and no worker
+    of this pool is still running one; wait=True: keep polling (service mode).
+    max_jobs: stop after this many jobs were processed (done or failed); never more are started.
+    on_job_finished(job, outcome, elapsed_sec): optional callback, e.g. for benchmarks.
+    Returns a dict of counters: done, retried, dead, rate_limited.
+    """
+    from extract_mt4_report_v2 import read_config_xlsx
+
+    conn = _connect(db_path)
+    try:
+        ensure_suggestion_queue_table(conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+    limiter = ProviderRateLimiter(provider_concurrency, provider_rpm, call_ai=call_ai)
+    configs = {}
+    counters = {"done": 0, "retried": 0, "dead": 0}
+    # reserved: jobs started or about to be claimed (counts against max_jobs); active: jobs being processed
+    slots = {"reserved": 0, "active": 0}
+    lock = threading.Lock()
+
+    def get_config(path):
+        with lock:
+            if path not in configs:
+                configs[path] = read_config_xlsx(path)
+            return configs[path]
+
+    def take_slot():
+        with lock:
+            if max_jobs is not None and slots["reserved"] >= max_jobs:
+                return False
+            slots["reserved"] += 1
+            return True
+
+    def idle_delay():
+        """Seconds to sleep before polling again, or None when a wait=False run is finished."""
+        due = next_pending_at(db_path)
+        with lock:
+            active = slots["active"]
+        if not wait and due is None and not active:
+            return None
+        if due is None:
+            return poll_interval
+        return min(poll_interval, max(due - time.time(), 0.05))
+
+    def worker():
+        while take_slot():
+            job = claim_next_job(db_path, lease_sec)
+            if job is None:
+                with lock:
+                    slots["reserved"] -= 1
+                delay = idle_delay()
+                if delay is None:
+                    return
+                time.sleep(delay)
+                continue
+            with lock:
+                slots["active"] += 1
+            logger.info(f"Processing AI suggestion job {job['id']} (attempt {job['attempts']}): {job['set_path']}")
+            started = time.monotonic()
+            try:
+                result_path = process_job(db_path, job, get_config(job["config_xlsx_path"]), limiter)
+                complete_job(db_path, job["id"], result_path, attempt=job["attempts"])
+                outcome = "done"
+            except Exception as e:
+                logger.exception(f"AI suggestion job {job['id']} failed: {e}")
+                outcome = "dead" if fail_job(db_path, job, e) == STATUS_DEAD else "retried"
+            with lock:
+                counters[outcome] += 1
+                slots["active"] -= 1
+            if on_job_finished:
+                on_job_finished(job, outcome, time.monotonic() - started)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for future in [pool.submit(worker) for _ in range(workers)]:
+            future.result()
+
+    counters["rate_limited"] = limiter.rate_limited
+    logger.info(f"AI suggestion workers finished: {counters}")
+    return counters
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue-backed AI suggestion workers (rate-limited per provider, with retries and dead-lettering).")
+    parser.add_argument("command", choices=["run", "status", "retry-dead"], help="run: drain the queue; status: job counts; retry-dead: re-queue dead jobs")
+    parser.add_argument("--db-path", required=True, help="Path to the SQLite database")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Worker threads (default: %(default)s)")
+    parser.add_argument("--provider-concurrency", type=int, default=DEFAULT_PROVIDER_CONCURRENCY, help="Max in-flight calls per provider (default: %(default)s)")
+    parser.add_argument("--provider-rpm", type=float, default=DEFAULT_PROVIDER_RPM, help="Max calls per minute per provider, > 0 (default: %(default)s)")
+    parser.add_argument("--max-jobs", type=int, help="Stop after processing this many jobs")
+    parser.add_argument("--wait", action="store_true", help="Keep polling for new jobs instead of exiting when the queue is empty")
+    parser.add_argument("--job-ids", help="Comma-separated job ids for retry-dead (default: all dead jobs)")
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        if args.command == "run":
+            output.update(run_suggestion_workers(
+                args.db_path,
+                workers=args.workers,
+                provider_concurrency=args.provider_concurrency,
+                provider_rpm=args.provider_rpm,
+                max_jobs=args.max_jobs,
+                wait=args.wait,
+            ))
+        elif args.command == "retry-dead":
+            job_ids = [int(x) for x in args.job_ids.split(",") if x.strip()] if args.job_ids else None
+            output["requeued"] = retry_dead_jobs(args.db_path, job_ids)
+        output["queue"] = queue_status(args.db_path)
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import logging
+
+from set_lineage_store import load_set_version
+
+logger = logging.getLogger(__name__)
+
+BLOB_CHUNK_SIZE = 1024 * 1024
+
+def ensure_artifact_blob_tables(conn):
+    """
+    Creates artifact_blobs (one row per distinct content, keyed by SHA-256, with a reference count),
+    artifact_blob_data (the content) and adds set_file_artifacts.blob_sha256 when
+    set_file_artifacts exists without it.
+    The content has its own table because SQLite rewrites a whole row, blob included,
+    on every UPDATE: a refcount change must not copy the file.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS artifact_blobs (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS artifact_blob_data (
+        sha256 TEXT PRIMARY KEY,
+        data BLOB NOT NULL
+    )
+    """)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(set_file_artifacts)")]
+    if columns and "blob_sha256" not in columns:
+        conn.execute("ALTER TABLE set_file_artifacts ADD COLUMN blob_sha256 TEXT")
+    if columns:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_set_file_artifacts_blob_sha256 ON set_file_artifacts (blob_sha256)")
+
+def sha256_file(file_path, chunk_size=BLOB_CHUNK_SIZE):
+    """(hex sha256, size) of a file, read in chunks."""
+    h = hashlib.sha256()
+    size = 0
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+            size += len(chunk)
+    return h.hexdigest(), size
+
+def put_blob_file(conn, file_path):
+    """
+    Adds one reference to the content of file_path and returns its sha256.
+    Known content only gets its refcount bumped. New content is written with
+    incremental blob I/O in BLOB_CHUNK_SIZE pieces, so memory does not grow with the file.
+    Does not commit.
+    """
+    sha, size = sha256_file(file_path)
+    cur = conn.execute("UPDATE artifact_blobs SET refcount = refcount + 1 WHERE sha256 = ?", (sha,))
+    if cur.rowcount:
+        return sha
+
+    if not hasattr(conn, "blobopen"):
+        # Python < 3.11: no incremental blob I/O
+        with open(file_path, "rb") as f:
+            data = f.read()
+        if hashlib.sha256(data).hexdigest() != sha:
+            raise ValueError(f"{file_path} changed while it was being stored")
+        conn.execute("INSERT INTO artifact_blobs (sha256, size, refcount) VALUES (?, ?, 1)", (sha, size))
+        conn.execute("INSERT INTO artifact_blob_data (sha256, data) VALUES (?, ?)", (sha, data))
+        return sha
+
+    conn.execute("INSERT INTO artifact_blobs (sha256, size, refcount) VALUES (?, ?, 1)", (sha, size))
+    cur = conn.execute("INSERT INTO artifact_blob_data (sha256, data) VALUES (?, zeroblob(?))", (sha, size))
+    if size:
+        h = hashlib.sha256()
+        with open(file_path, "rb") as f, conn.blobopen("artifact_blob_data", "data", cur.lastrowid) as blob:
+            for chunk in iter(lambda: f.read(BLOB_CHUNK_SIZE), b""):
+                h.update(chunk)
+                blob.write(chunk)
+        if h.hexdigest() != sha:
+            raise ValueError(f"{file_path} changed while it was being stored")
+    logger.info(f"Stored blob {sha[:12]} ({size} bytes) from {file_path}")
+    return sha
+
+def release_blob(conn, sha):
+    """Drops one reference; the content is deleted with its last reference. Does not commit."""
+    conn.execute("UPDATE artifact_blobs SET refcount = refcount - 1 WHERE sha256 = ?", (sha,))
+    cur = conn.execute("DELETE FROM artifact_blobs WHERE sha256 = ? AND refcount <= 0", (sha,))
+    if cur.rowcount:
+        conn.execute("DELETE FROM artifact_blob_data WHERE sha256 = ?", (sha,))
+
+def iter_blob(conn, sha, chunk_size=BLOB_CHUNK_SIZE):
+    """Yields the content of a blob in chunks."""
+    row = conn.execute("SELECT rowid, length(data) FROM artifact_blob_data WHERE sha256 = ?", (sha,)).fetchone()
+    if row is None:
+        raise KeyError(f"artifact blob {sha} not found")
+    rowid, size = row
+    if not size:
+        return
+    if not hasattr(conn, "blobopen"):
+        yield conn.execute("SELECT data FROM artifact_blob_data WHERE rowid = ?", (rowid,)).fetchone()[0]
+        return
+    with conn.blobopen("artifact_blob_data", "data", rowid, readonly=True) as blob:
+        for chunk in iter(lambda: blob.read(chunk_size), b""):
+            yield chunk
+
+def read_blob(conn, sha):
+    return b"".join(iter_blob(conn, sha))
+
+def insert_artifact_row(conn, step_id, artifact_type, file_path, meta_json=None, link_type=None, link_id=None, blob_sha256=None):
+    """
+    Inserts a set_file_artifacts row holding only the content hash (file_blob stays NULL).
+    The file is added to the blob store unless blob_sha256 is given or the file is missing.
+    Returns the row id. Does not commit.
+    """
+    if blob_sha256 is None and file_path and os.path.isfile(file_path):
+        blob_sha256 = put_blob_file(conn, file_path)
+    cur = conn.execute("""
+        INSERT INTO set_file_artifacts (
+            step_id, artifact_type, file_path, meta_json, file_blob, link_type, link_id, blob_sha256
+        ) VALUES (?, ?, ?, ?, NULL, ?, ?, ?)
+    """, (step_id, artifact_type, file_path, meta_json, link_type, link_id, blob_sha256))
+    return cur.lastrowid
+
+def delete_artifact_row(conn, artifact_id):
+    """Deletes a set_file_artifacts row and releases its blob. Does not commit."""
+    row = conn.execute("SELECT blob_sha256 FROM set_file_artifacts WHERE id = ?", (artifact_id,)).fetchone()
+    if row is None:
+        return
+    conn.execute("DELETE FROM set_file_artifacts WHERE id = ?", (artifact_id,))
+    if row[0]:
+        release_blob(conn, row[0])
+
+def read_artifact_bytes(conn, artifact_id):
+    """
+    Content of a set_file_artifacts row, wherever it lives: the blob store (blob_sha256),
+    the .set lineage store (meta_json set_version_id) or a legacy inline file_blob.
+    """
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(set_file_artifacts)")]
+    select = "file_blob, meta_json" + (", blob_sha256" if "blob_sha256" in columns else ", NULL")
+    row = conn.execute(f"SELECT {select} FROM set_file_artifacts WHERE id = ?", (artifact_id,)).fetchone()
+    if row is None:
+        raise KeyError(f"set_file_artifacts id {artifact_id} not found")
+    blob, meta_json, sha = row
+    if blob is not None:
+        return blob
+    if sha:
+        return read_blob(conn, sha)
+    version_id = json.loads(meta_json).get("set_version_id") if meta_json else None
+    return load_set_version(conn, version_id) if version_id is not None else None
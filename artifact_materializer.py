@@ -0,0 +1,111 @@
+import os
+import re
+import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated override of the strategies tried, e.g. "copy" to always write real copies.
+# "hardlink" is opt-in ("reflink,hardlink,copy"): the two names then share one file, so an
+# in-place rewrite of the source (MT4 reusing its output name) changes the archived copy too.
+LINK_MODES_ENV = "MT4_ARTIFACT_LINK_MODES"
+DEFAULT_LINK_MODES = ("reflink", "copy")
+
+# Linux FICLONE ioctl (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+STREAM_BLOCK_SIZE = 1024 * 1024
+# Longest <img src="..."> tag expected; a tag is never split across blocks when shorter than this
+MAX_TAG_BYTES = 4096
+
+IMG_GIF_RE = re.compile(rb'(<img\s+src=")([^"]+\.gif)(")', re.IGNORECASE)
+
+def _link_modes(modes=None):
+    if modes:
+        return modes
+    env = os.environ.get(LINK_MODES_ENV, "").strip()
+    if env:
+        return tuple(m.strip().lower() for m in env.split(",") if m.strip())
+    return DEFAULT_LINK_MODES
+
+def _reflink(src, dst):
+    """Copy-on-write clone: shares the blocks until either file changes."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflink is not supported on this platform")
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+def _copy(src, dst):
+    shutil.copyfile(src, dst)
+
+_STRATEGIES = {"reflink": _reflink, "hardlink": _hardlink, "copy": _copy}
+
+def materialize_file(src, dst, modes=None):
+    """
+    Makes dst have the same content as src without a byte copy when the filesystem allows:
+    reflink (copy-on-write, independent of later writes to src), else a plain copy.
+    An existing dst is replaced. "hardlink" can be added to modes (or MT4_ARTIFACT_LINK_MODES)
+    for sources that are never edited in place, since a hardlink shares edits.
+    Returns the strategy used.
+    """
+    src, dst = str(src), str(dst)
+    if os.path.exists(dst):
+        if os.path.samefile(src, dst):
+            return "same"
+        os.remove(dst)
+    last_error = None
+    for mode in _link_modes(modes):
+        strategy = _STRATEGIES.get(mode)
+        if strategy is None:
+            raise ValueError(f"Unknown link mode: {mode}")
+        try:
+            strategy(src, dst)
+            logger.info(f"Materialized {dst} from {src} ({mode})")
+            return mode
+        except OSError as e:
+            last_error = e
+            logger.debug(f"{mode} {src} -> {dst} failed: {e}")
+    raise last_error if last_error else OSError(f"Could not materialize {dst}")
+
+def stream_rewrite_gif_src(src_html, dst_html, new_gif_name):
+    """
+    Copies an MT4 report to dst_html, pointing every <img src="*.gif"> at new_gif_name.
+    Works block by block on bytes: the file is never held in memory nor decoded, and
+    blocks without an image tag (the whole trade table) are written through unchanged.
+    Returns the first original GIF name, or None when there is none.
+    """
+    replacement = new_gif_name.encode("utf-8")
+    first_gif = None
+    with open(src_html, "rb") as fin, open(dst_html, "wb") as fout:
+        carry = b""
+        while True:
+            block = fin.read(STREAM_BLOCK_SIZE)
+            buf = carry + block
+            if not block:
+                cut = len(buf)
+            else:
+                # Hold back a trailing, possibly incomplete tag for the next block
+                cut = buf.rfind(b"<", max(0, len(buf) - MAX_TAG_BYTES))
+                if cut < 0:
+                    cut = len(buf)
+            chunk, carry = buf[:cut], buf[cut:]
+            if b"<" in chunk:
+                if first_gif is None:
+                    m = IMG_GIF_RE.search(chunk)
+                    if m:
+                        first_gif = m.group(2).decode("utf-8", errors="replace")
+                chunk = IMG_GIF_RE.sub(lambda m: m.group(1) + replacement + m.group(3), chunk)
+            fout.write(chunk)
+            if not block:
+                break
+    return first_gif
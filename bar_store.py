@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import logging
+
+import numpy as np
+import pandas as pd
+
+from file_cache import default_cache_dir, file_identity
+
+logger = logging.getLogger(__name__)
+
+BAR_COLUMNS = ["datetime", "open", "high", "low", "close", "volume"]
+# Bump when the stored layout or the parsing rules change
+BAR_STORE_VERSION = 4
+
+def _entry_names(identity):
+    path_key = hashlib.sha256(identity[0].encode("utf-8")).hexdigest()[:16]
+    version_key = hashlib.sha256(json.dumps([BAR_STORE_VERSION] + list(identity)).encode("utf-8")).hexdigest()[:16]
+    return path_key, f"{path_key}_{version_key}"
+
+def parse_bar_source(path):
+    """Parses a bar history (MT4 .hst, or a CSV read_mt4_csv understands) into a DataFrame."""
+    if path.lower().endswith(".hst"):
+        from mt4_hst_reader import read_hst
+        return read_hst(path)
+    from wave_analysis import read_mt4_csv
+    return read_mt4_csv(path)
+
+def _time_order(df):
+    """None when df is already sorted by datetime, else the stable sorting permutation."""
+    times = df["datetime"].to_numpy().astype("datetime64[ns]")
+    if len(times) < 2 or not (times[1:] < times[:-1]).any():
+        return None
+    return np.argsort(times, kind="stable")
+
+def _write_entry(bars_dir, path_key, entry, df):
+    os.makedirs(bars_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=bars_dir, prefix=".tmp_")
+    order = _time_order(df)
+    try:
+        for col in BAR_COLUMNS:
+            values = df[col].to_numpy()
+            if order is not None:
+                values = values[order]
+            if col == "datetime":
+                values = values.astype("datetime64[ns]")
+            elif values.dtype.kind not in "iuf":
+                values = values.astype(np.float64)
+            np.save(os.path.join(tmp_dir, col + ".npy"), np.ascontiguousarray(values))
+        target = os.path.join(bars_dir, entry)
+        try:
+            os.replace(tmp_dir, target)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    # Entries of older versions of the same source are stale now
+    for name in os.listdir(bars_dir):
+        if name.startswith(path_key + "_") and name != entry:
+            shutil.rmtree(os.path.join(bars_dir, name), ignore_errors=True)
+
+def load_bar_columns(path, cache_dir=None, use_cache=True):
+    """
+    {column: array} of a bar history. The first call parses the source and stores one .npy
+    per column under <cache_dir>/bars, keyed by (path, mtime, size). Later calls memory-map
+    those files read-only, with no parsing and no copy. Bars are always in time order.
+    """
+    if not use_cache:
+        df = parse_bar_source(path)
+        order = _time_order(df)
+        return {col: df[col].to_numpy() if order is None else df[col].to_numpy()[order] for col in BAR_COLUMNS}
+    identity = file_identity(path)
+    bars_dir = os.path.join(cache_dir or default_cache_dir(), "bars")
+    path_key, entry = _entry_names(identity)
+    entry_dir = os.path.join(bars_dir, entry)
+    if not os.path.isdir(entry_dir):
+        df = parse_bar_source(path)
+        try:
+            _write_entry(bars_dir, path_key, entry, df)
+            logger.info(f"Bar store entry written for {path} ({len(df)} bars)")
+        except OSError as e:
+            logger.warning(f"Could not write bar store entry for {path}: {e}")
+            return load_bar_columns(path, use_cache=False)
+    try:
+        return {col: np.load(os.path.join(entry_dir, col + ".npy"), mmap_mode="r") for col in BAR_COLUMNS}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable bar store entry {entry_dir}: {e}")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return load_bar_columns(path, use_cache=False)
+
+def _frame(columns, i=0, j=None):
+    return pd.DataFrame({col: values[i:j] for col, values in columns.items()}, copy=False)
+
+def load_bars(path, cache_dir=None, use_cache=True):
+    """Bar history as the DataFrame read_mt4_csv returns, backed by the bar store (see load_bar_columns)."""
+    columns = load_bar_columns(path, cache_dir=cache_dir, use_cache=use_cache)
+    return _frame({col: columns[col] for col in BAR_COLUMNS})
+
+def _datetime64(value):
+    return np.datetime64(pd.Timestamp(value).to_datetime64(), "ns")
+
+def time_slice(times, start=None, end=None, inclusive_end=True):
+    """
+    (i, j) such that times[i:j] are the bars from start to end (end included unless
+    inclusive_end is False), by binary search: times must be sorted. None leaves a side open.
+    """
+    i = 0 if start is None else int(np.searchsorted(times, _datetime64(start), side="left"))
+    if end is None:
+        j = len(times)
+    else:
+        j = int(np.searchsorted(times, _datetime64(end), side="right" if inclusive_end else "left"))
+    return i, max(i, j)
+
+def frame_view(bars, i, j):
+    """Rows i:j of bars as a DataFrame with a fresh RangeIndex that shares the column arrays (no copy)."""
+    return pd.DataFrame({col: bars[col].to_numpy()[i:j] for col in bars.columns}, copy=False)
+
+def is_sorted_by_time(bars):
+    times = bars["datetime"].to_numpy()
+    return len(times) < 2 or not (times[1:] < times[:-1]).any()
+
+class BarSeries:
+    """
+    One bar history, loaded once, serving any number of time windows. Windows are found by
+    binary search on the sorted datetime column and returned as views on the same arrays,
+    so rolling and walk-forward analyses cost O(log n) per window instead of a mask and a copy.
+    """
+
+    def __init__(self, columns):
+        self.columns = {col: np.asarray(values) for col, values in columns.items()}
+        self.times = self.columns["datetime"].astype("datetime64[ns]", copy=False)
+        if len(self.times) > 1 and (self.times[1:] < self.times[:-1]).any():
+            raise ValueError("BarSeries needs bars sorted by datetime")
+
+    @classmethod
+    def load(cls, path, cache_dir=None, use_cache=True):
+        return cls(load_bar_columns(path, cache_dir=cache_dir, use_cache=use_cache))
+
+    @classmethod
+    def from_frame(cls, bars):
+        return cls({col: bars[col].to_numpy() for col in bars.columns})
+
+    def __len__(self):
+        return len(self.times)
+
+    def frame(self, i=0, j=None):
+        """Bars i:j as a DataFrame view."""
+        return _frame(self.columns, i, j)
+
+    def between(self, start=None, end=None, inclusive_end=True):
+        """Bars from start to end (both included by default) as a DataFrame view."""
+        return self.frame(*time_slice(self.times, start, end, inclusive_end=inclusive_end))
+
+    def window_bounds(self, starts, length):
+        """(i, j) index arrays of the half-open windows [start, start + length), all in two searchsorted calls."""
+        starts = np.asarray(starts, dtype="datetime64[ns]")
+        ends = starts + pd.Timedelta(length).to_timedelta64()
+        return np.searchsorted(self.times, starts, side="left"), np.searchsorted(self.times, ends, side="left")
+
+    def _starts(self, step, span, start=None, end=None):
+        """Window starts every step from start while the window (span long) ends by end."""
+        if not len(self.times):
+            return np.empty(0, dtype="datetime64[ns]")
+        first = _datetime64(start) if start is not None else self.times[0]
+        # Default end: just past the last bar, so a window may include it
+        stop = _datetime64(end) if end is not None else self.times[-1] + np.timedelta64(1, "ns")
+        step = pd.Timedelta(step).to_timedelta64()
+        span = pd.Timedelta(span).to_timedelta64()
+        if step <= np.timedelta64(0, "ns"):
+            raise ValueError("step must be positive")
+        count = (stop - first - span) // step + 1 if stop - first >= span else 0
+        return first + step * np.arange(max(int(count), 0))
+
+    def rolling_windows(self, length, step, start=None, end=None):
+        """Yields (window start, bars) for [t, t + length) every step from start; windows past end are skipped."""
+        starts = self._starts(step, length, start, end)
+        lo, hi = self.window_bounds(starts, length)
+        for t, i, j in zip(starts, lo.tolist(), hi.tolist()):
+            yield t, self.frame(i, j)
+
+    def walk_forward(self, train, test, step=None, start=None, end=None):
+        """
+        Yields (train start, train bars, test bars): train is [t, t + train), test the following
+        [t + train, t + train + test). step defaults to test (back-to-back test periods).
+        """
+        starts = self._starts(step or test, pd.Timedelta(train) + pd.Timedelta(test), start, end)
+        train_lo, train_hi = self.window_bounds(starts, train)
+        test_lo, test_hi = self.window_bounds(starts + pd.Timedelta(train).to_timedelta64(), test)
+        for t, a, b, c, d in zip(starts, train_lo.tolist(), train_hi.tolist(), test_lo.tolist(), test_hi.tolist()):
+            yield t, self.frame(a, b), self.frame(c, d)
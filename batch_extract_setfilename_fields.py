@@ -1,7 +1,15 @@
 import sys
+import os
 import csv
+import json
+import argparse
+import itertools
+import multiprocessing
 from extract_setfilename_fields import load_symbol_list, extract_fields
 
+FIELDS = ["EA","Symbol","Timeframe","InitialDeposit","ProfitAmount","DrawDown","StartDate","EndDate","Stoploss","WinRate","ProfitFactor","NumTrade","SetVersion","Step"]
+DEFAULT_CHUNK_SIZE = 5000
+
 def main(symbol_csv, filename_txt, output_txt):
     symbol_list = load_symbol_list(symbol_csv)
     with open(filename_txt, encoding="utf-8") as fin, open(output_txt, "w", encoding="utf-8") as fout:
@@ -12,12 +20,75 @@ def main(symbol_csv, filename_txt, output_txt):
             fields = extract_fields(line, symbol_list)
             # Write in tab-separated format, one line per file
             fout.write(f"Filename: {line}\n")
-            for k in ["EA","Symbol","Timeframe","InitialDeposit","ProfitAmount","DrawDown","StartDate","EndDate","Stoploss","WinRate","ProfitFactor","NumTrade","SetVersion","Step"]:
+            for k in FIELDS:
                 fout.write(f"{k}: {fields.get(k,'')}\n")
             fout.write("\n")
 
+_worker_symbols = None
+
+def _init_worker(symbol_csv):
+    global _worker_symbols
+    _worker_symbols = load_symbol_list(symbol_csv)
+
+def _extract_chunk(filenames):
+    return [(name, extract_fields(name, _worker_symbols)) for name in filenames]
+
+def _read_chunks(filename_txt, chunk_size):
+    with open(filename_txt, encoding="utf-8") as fin:
+        names = (line.strip() for line in fin)
+        names = (n for n in names if n and n.lower().endswith(".set"))
+        while True:
+            chunk = list(itertools.islice(names, chunk_size))
+            if not chunk:
+                return
+            yield chunk
+
+def extract_batch(symbol_csv, filename_txt, output_path, fmt="jsonl", workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Streams filenames from filename_txt through a process pool in chunks and writes one
+    record per .set name (input order kept) as JSONL or CSV. Memory stays bounded by
+    a few chunks in flight, so millions of names are fine. Returns the number of records.
+    """
+    if fmt not in ("jsonl", "csv"):
+        raise ValueError(f"Unsupported format: {fmt}")
+    workers = workers or os.cpu_count() or 1
+    count = 0
+    with open(output_path, "w", encoding="utf-8", newline="") as fout:
+        writer = None
+        if fmt == "csv":
+            writer = csv.writer(fout)
+            writer.writerow(["Filename"] + FIELDS)
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(symbol_csv,)) as pool:
+            for results in pool.imap(_extract_chunk, _read_chunks(filename_txt, chunk_size)):
+                for name, fields in results:
+                    if writer is not None:
+                        writer.writerow([name] + [fields.get(k, "") for k in FIELDS])
+                    else:
+                        fout.write(json.dumps(dict(Filename=name, **fields)) + "\n")
+                count += len(results)
+    return count
+
 if __name__ == "__main__":
-    if len(sys.argv) < 4:
-        print("Usage: python batch_extract_setfilename_fields.py SymbolList.csv setfilename.txt result.txt")
-        sys.exit(1)
-    main(sys.argv[1], sys.argv[2], sys.argv[3])
\ No newline at end of file
+    multiprocessing.freeze_support()
+    parser = argparse.ArgumentParser(description="Extract filename fields for a list of .set file names.")
+    parser.add_argument("symbol_csv", help="SymbolList.csv")
+    parser.add_argument("filename_txt", help="Text file with one .set file name per line")
+    parser.add_argument("output", help="Result file; .jsonl/.csv select the parallel batch mode")
+    parser.add_argument("--format", choices=["txt", "jsonl", "csv"], help="Output format (default: from the output extension, else txt)")
+    parser.add_argument("--workers", type=int, help="Worker processes for jsonl/csv (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="File names per worker task")
+    args = parser.parse_args()
+
+    fmt = args.format or {".jsonl": "jsonl", ".csv": "csv"}.get(os.path.splitext(args.output)[1].lower(), "txt")
+    if fmt == "txt":
+        main(args.symbol_csv, args.filename_txt, args.output)
+    else:
+        output = {}
+        try:
+            output["count"] = extract_batch(args.symbol_csv, args.filename_txt, args.output, fmt, args.workers, args.chunk_size)
+            output["success"] = True
+            output["error"] = ""
+        except Exception as e:
+            output["success"] = False
+            output["error"] = str(e)
+        print(json.dumps(output))
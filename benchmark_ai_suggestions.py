@@ -0,0 +1,306 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import logging
+
+import openpyxl
+import requests
+
+import ai_set_optimizer_openrouter as ai_optimizer
+import ai_suggestion_queue
+from mock_llm_server import start_mock_server
+
+logger = logging.getLogger(__name__)
+
+# Minimal tables the suggestion path touches, for runs without --db-path
+SCRATCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS set_file_steps (id INTEGER PRIMARY KEY, job_id INTEGER);
+CREATE TABLE IF NOT EXISTS test_metrics (id INTEGER PRIMARY KEY, step_id INTEGER, set_file_name TEXT, input_set_file TEXT, magic_number INTEGER);
+CREATE TABLE IF NOT EXISTS optimization_suggestion (id INTEGER PRIMARY KEY, step_id INTEGER, mode TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE IF NOT EXISTS optimization_section (id INTEGER PRIMARY KEY, suggestion_id INTEGER, section_name TEXT, explanation TEXT);
+CREATE TABLE IF NOT EXISTS optimization_parameter (id INTEGER PRIMARY KEY, suggestion_id INTEGER, parameter_name TEXT, start REAL, end REAL, step REAL, reason TEXT);
+CREATE TABLE IF NOT EXISTS set_file_artifacts (id INTEGER PRIMARY KEY, step_id INTEGER, artifact_type TEXT, file_path TEXT, meta_json TEXT, file_blob BLOB, link_type TEXT, link_id INTEGER, created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+"""
+
+BENCH_STEP_ID_BASE = 900000
+
+def percentile(values, pct):
+    """Nearest-rank percentile of values (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+def latency_summary(values):
+    return {
+        "p50_sec": percentile(values, 50),
+        "p95_sec": percentile(values, 95),
+        "max_sec": max(values) if values else None,
+    }
+
+class CallRecorder:
+    """call_openrouter wrapper recording latency and outcome of every LLM call."""
+
+    def __init__(self, api_url):
+        self.api_url = api_url
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.rate_limited = 0
+        self.http_errors = 0
+        self.malformed = 0
+
+    def __call__(self, prompt, model, api_key):
+        started = time.monotonic()
+        try:
+            content = ai_optimizer.call_openrouter(prompt, model, api_key, api_url=self.api_url)
+        except requests.HTTPError as e:
+            with self.lock:
+                if e.response is not None and e.response.status_code == 429:
+                    self.rate_limited += 1
+                else:
+                    self.http_errors += 1
+            raise
+        finally:
+            with self.lock:
+                self.latencies.append(time.monotonic() - started)
+        if len(ai_optimizer.parse_json_blocks(ai_optimizer.extract_json_code_blocks(content))) != 2:
+            with self.lock:
+                self.malformed += 1
+        return content
+
+    def summary(self):
+        with self.lock:
+            return {
+                "llm_calls": len(self.latencies),
+                "call_latency": latency_summary(self.latencies),
+                "rate_limited_429": self.rate_limited,
+                "http_errors": self.http_errors,
+                "malformed_responses": self.malformed,
+            }
+
+def prepare_workspace(work_dir, set_path, summary_path, jobs, db_path=None):
+    """
+    Copies the .set/summary pair once per job (distinct names, so lineage counts stay separate)
+    and prepares a database copy. Returns (db_path, [(step_id, set_path, summary_path), ...]).
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    bench_db = os.path.join(work_dir, "benchmark.db")
+    if db_path:
+        shutil.copy(db_path, bench_db)
+    conn = sqlite3.connect(bench_db)
+    try:
+        conn.executescript(SCRATCH_SCHEMA)
+        items = []
+        for i in range(jobs):
+            step_id = BENCH_STEP_ID_BASE + i
+            name = f"bench_{i:04d}"
+            job_set = os.path.join(work_dir, f"{name}.set")
+            job_summary = os.path.join(work_dir, f"{name}_summary_metrics.csv")
+            shutil.copy(set_path, job_set)
+            shutil.copy(summary_path, job_summary)
+            conn.execute(
+                "INSERT INTO test_metrics (step_id, set_file_name, input_set_file) VALUES (?, ?, ?)",
+                (step_id, os.path.basename(job_set), os.path.basename(set_path))
+            )
+            items.append((step_id, job_set, job_summary))
+        conn.commit()
+    finally:
+        conn.close()
+    return bench_db, items
+
+def write_benchmark_config(path, template_path, spec_path, models, base_parameters, token_budget=None):
+    """Writes the ai_optimizer config sheet the queue workers read."""
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "ai_optimizer"
+    ws.append(["key", "value"])
+    for key, value in [
+        ("template_path", template_path),
+        ("spec_path", spec_path),
+        ("api_key", "mock-key"),
+        ("models", ",".join(models)),
+        ("base_parameters", base_parameters),
+        ("token_budget", token_budget or ""),
+    ]:
+        ws.append([key, value])
+    wb.save(path)
+
+def run_sync_benchmark(items, template_path, spec_path, models, base_parameters, db_path, api_url, token_budget=None):
+    """Runs suggestions one after another, like process_mt4_report does today."""
+    recorder = CallRecorder(api_url)
+    job_latencies = []
+    succeeded = 0
+    started = time.monotonic()
+    for step_id, set_path, summary_path in items:
+        job_started = time.monotonic()
+        output_path = ai_optimizer.suggest_mode_and_sections_and_params_openrouter(
+            template_path=template_path,
+            base_parameters=base_parameters,
+            set_path=set_path,
+            spec_path=spec_path,
+            summary_path=summary_path,
+            openrouter_api_key="mock-key",
+            output_path=set_path.replace(".set", "-AI-Suggest-Opt.set"),
+            db_path=db_path,
+            step_id=step_id,
+            suggestion_json_path=set_path.replace(".set", "-AI-Suggestion.json"),
+            models=models,
+            call_ai=recorder,
+            **({"token_budget": token_budget} if token_budget else {})
+        )
+        job_latencies.append(time.monotonic() - job_started)
+        if output_path:
+            succeeded += 1
+    wall = time.monotonic() - started
+    report = {
+        "mode": "sync",
+        "jobs": len(items),
+        "succeeded": succeeded,
+        "failed": len(items) - succeeded,
+        "wall_sec": wall,
+        "throughput_jobs_per_min": succeeded / wall * 60 if wall > 0 else None,
+        "job_latency": latency_summary(job_latencies),
+    }
+    report.update(recorder.summary())
+    return report
+
+def run_batch_benchmark(items, config_path, db_path, api_url, workers, provider_concurrency, provider_rpm):
+    """Enqueues every item and drains the queue with ai_suggestion_queue workers."""
+    recorder = CallRecorder(api_url)
+    job_latencies = []
+    lock = threading.Lock()
+
+    def on_job_finished(job, outcome, elapsed):
+        with lock:
+            job_latencies.append(elapsed)
+
+    for step_id, set_path, summary_path in items:
+        ai_suggestion_queue.enqueue_suggestion_job(
+            db_path=db_path,
+            step_id=step_id,
+            set_path=set_path,
+            summary_path=summary_path,
+            output_path=set_path.replace(".set", "-AI-Suggest-Opt.set"),
+            config_xlsx_path=config_path,
+            suggestion_json_path=set_path.replace(".set", "-AI-Suggestion.json"),
+        )
+    started = time.monotonic()
+    counters = ai_suggestion_queue.run_suggestion_workers(
+        db_path,
+        workers=workers,
+        provider_concurrency=provider_concurrency,
+        provider_rpm=provider_rpm,
+        call_ai=recorder,
+        on_job_finished=on_job_finished,
+    )
+    wall = time.monotonic() - started
+    report = {
+        "mode": "batch",
+        "jobs": len(items),
+        "succeeded": counters["done"],
+        "retry_pending": counters["retried"],
+        "dead": counters["dead"],
+        "wall_sec": wall,
+        "throughput_jobs_per_min": counters["done"] / wall * 60 if wall > 0 else None,
+        "job_latency": latency_summary(job_latencies),
+        "limiter_429_retries": counters["rate_limited"],
+        "workers": workers,
+        "provider_concurrency": provider_concurrency,
+        "provider_rpm": provider_rpm,
+    }
+    report.update(recorder.summary())
+    return report
+
+def fetch_server_stats(api_url, reset=False):
+    base = api_url.split("/api/v1/")[0].split("/v1/")[0]
+    try:
+        stats = requests.get(base + "/stats", timeout=5).json()
+        if reset:
+            requests.post(base + "/reset", timeout=5)
+        return stats
+    except Exception as e:
+        logger.warning(f"Could not read mock server stats from {base}: {e}")
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput benchmark of the AI suggestion pipeline (sync and queue/batch paths) against mock_llm_server.")
+    parser.add_argument("--template", required=True, help="Prompt template (Markdown)")
+    parser.add_argument("--spec", required=True, help="PhoenixSpec.csv file path")
+    parser.add_argument("--set", required=True, help=".set file used for every job")
+    parser.add_argument("--summary", required=True, help="Summary metrics CSV used for every job")
+    parser.add_argument("--base-parameters", default="", help="Comma-separated base parameters")
+    parser.add_argument("--models", default="openai/gpt-4o,anthropic/claude-3-opus", help="Comma-separated model names")
+    parser.add_argument("--jobs", type=int, default=20, help="Number of suggestion jobs per mode")
+    parser.add_argument("--mode", choices=["sync", "batch", "both"], default="both")
+    parser.add_argument("--db-path", help="Database to copy into the work dir (default: scratch tables)")
+    parser.add_argument("--work-dir", help="Work directory (default: a new temp dir)")
+    parser.add_argument("--token-budget", type=int, help="Prompt token budget")
+    parser.add_argument("--workers", type=int, default=ai_suggestion_queue.DEFAULT_WORKERS)
+    parser.add_argument("--provider-concurrency", type=int, default=ai_suggestion_queue.DEFAULT_PROVIDER_CONCURRENCY)
+    parser.add_argument("--provider-rpm", type=float, default=600)
+    parser.add_argument("--url", help="Use an already running mock/real endpoint instead of starting mock_llm_server")
+    parser.add_argument("--seed", type=int, default=42, help="Mock server seed")
+    parser.add_argument("--latency-dist", default="lognormal", help="Mock server latency distribution")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Mock server latency (ms)")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Mock server: 429 burst every N requests")
+    parser.add_argument("--rate-limit-burst", type=int, default=0, help="Mock server: 429s per burst")
+    parser.add_argument("--retry-after", type=float, default=0.5, help="Mock server: Retry-After seconds")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Mock server: malformed response probability")
+    parser.add_argument("--output", help="Write the JSON report to this file as well")
+    args = parser.parse_args()
+
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="ai_suggestion_benchmark_")
+    server = None
+    if args.url:
+        api_url = args.url
+    else:
+        server = start_mock_server(
+            seed=args.seed,
+            latency_dist=args.latency_dist,
+            latency_ms=args.latency_ms,
+            rate_limit_every=args.rate_limit_every,
+            rate_limit_burst=args.rate_limit_burst,
+            retry_after=args.retry_after,
+            malformed_rate=args.malformed_rate,
+        )
+        api_url = server.url
+
+    report = {"api_url": api_url, "work_dir": work_dir, "models": models, "runs": []}
+    try:
+        modes = ["sync", "batch"] if args.mode == "both" else [args.mode]
+        for mode in modes:
+            mode_dir = os.path.join(work_dir, mode)
+            db_path, items = prepare_workspace(mode_dir, args.set, args.summary, args.jobs, args.db_path)
+            fetch_server_stats(api_url, reset=True)
+            if mode == "sync":
+                run = run_sync_benchmark(
+                    items, args.template, args.spec, models, args.base_parameters, db_path, api_url, args.token_budget
+                )
+            else:
+                config_path = os.path.join(mode_dir, "benchmark_config.xlsx")
+                write_benchmark_config(config_path, args.template, args.spec, models, args.base_parameters, args.token_budget)
+                run = run_batch_benchmark(
+                    items, config_path, db_path, api_url, args.workers, args.provider_concurrency, args.provider_rpm
+                )
+            run["server_stats"] = fetch_server_stats(api_url)
+            report["runs"].append(run)
+    finally:
+        if server:
+            server.shutdown()
+            server.server_close()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    print(text)
+
+if __name__ == "__main__":
+    main()
@@ -9,7 +9,7 @@ REM 2. Package run_sqlite_query.py
 pyinstaller --onefile run_sqlite_query.py
 
 REM 3. Package extract_mt4_report_v2.py (with dependencies)
-pyinstaller --onefile extract_mt4_report_v2.py --hidden-import=argparse --hidden-import=collections --hidden-import=datetime --hidden-import=hashlib --hidden-import=io --hidden-import=json --hidden-import=logging --hidden-import=numpy --hidden-import=openpyxl --hidden-import=os --hidden-import=pandas --hidden-import=pandas._libs --hidden-import=re --hidden-import=requests --hidden-import=set_file_updater --hidden-import=sqlite3 --hidden-import=sys --hidden-import=tiktoken --hidden-import=time --hidden-import=wave_analysis --hidden-import=ai_set_optimizer_openrouter --hidden-import=build_filename --add-data "wave_analysis.py;." --add-data "ai_set_optimizer_openrouter.py;." --add-data "build_filename.py;." --add-data "set_file_updater.py;."
+pyinstaller --onefile extract_mt4_report_v2.py --hidden-import=argparse --hidden-import=collections --hidden-import=datetime --hidden-import=hashlib --hidden-import=io --hidden-import=json --hidden-import=logging --hidden-import=numpy --hidden-import=openpyxl --hidden-import=os --hidden-import=pandas --hidden-import=pandas._libs --hidden-import=re --hidden-import=requests --hidden-import=set_file_updater --hidden-import=sqlite3 --hidden-import=sys --hidden-import=tiktoken --hidden-import=time --hidden-import=wave_analysis --hidden-import=ai_set_optimizer_openrouter --hidden-import=build_filename --hidden-import=prompt_compactor --hidden-import=mt4_set_parser --hidden-import=file_cache --hidden-import=ai_suggestion_queue --hidden-import=set_file_parser --hidden-import=set_lineage_store --hidden-import=magic_registry --hidden-import=artifact_materializer --hidden-import=artifact_blob_store --hidden-import=bar_store --hidden-import=mt4_hst_reader --hidden-import=wave_result_cache --hidden-import=wave_portfolio --hidden-import=extract_setfilename_fields --add-data "wave_analysis.py;." --add-data "ai_set_optimizer_openrouter.py;." --add-data "build_filename.py;." --add-data "set_file_updater.py;." --add-data "prompt_compactor.py;." --add-data "mt4_set_parser.py;." --add-data "file_cache.py;." --add-data "ai_suggestion_queue.py;." --add-data "set_file_parser.py;." --add-data "set_lineage_store.py;." --add-data "magic_registry.py;." --add-data "artifact_materializer.py;." --add-data "artifact_blob_store.py;." --add-data "bar_store.py;." --add-data "mt4_hst_reader.py;." --add-data "wave_result_cache.py;." --add-data "wave_portfolio.py;." --add-data "extract_setfilename_fields.py;."
 
 REM 4. Package extract_mt4_optimization_v2.py
 pyinstaller --onefile extract_mt4_optimization_v2.py
@@ -17,6 +17,9 @@ pyinstaller --onefile extract_mt4_optimization_v2.py
 REM 5. Package zip_with_password.py
 pyinstaller --onefile zip_with_password.py
 
+REM 6. Package ai_suggestion_queue.py (queue-mode AI suggestion worker)
+pyinstaller --onefile ai_suggestion_queue.py --hidden-import=extract_mt4_report_v2 --hidden-import=ai_set_optimizer_openrouter --hidden-import=openpyxl --hidden-import=requests --hidden-import=tiktoken
+
 echo.
 echo Packaging complete! All executables are in the dist\ folder.
 pause
\ No newline at end of file
@@ -42,8 +42,15 @@ def safe_int(val):
 def build_filename(
     EA, Symbol, Timeframe, InitialDeposit="", ProfitAmount="", DrawDown="",
     StartDate="", EndDate="", Stoploss="", WinRate="", ProfitFactor="",
-    NumTrade="", SetVersion="", Step="", ext=".set"
+    NumTrade="", SetVersion="", Step="", ext=".set", magic_registry=None, magic_owner=None
 ):
+    """
+    Returns (file_name, magic_number).
+    magic_registry: optional SQLite path of the magic registry; the magic is then allocated
+    collision-free for magic_owner. Pass a stable identity such as
+    magic_registry.lineage_owner_key so every step of a set lineage keeps one magic; the
+    default owner is EA|symbol|timeframe (one magic per combination, as without the registry).
+    """
     # Clean/format values as requested
     SymbolShort = clean_symbol(Symbol)
     InitialDeposit = safe_int(InitialDeposit)
@@ -66,7 +73,12 @@ def build_filename(
 
     # Generate magic number using the function
     #magic_number = generate_magic_number(base_filename)
-    magic_number = generate_fixed_magic_number(EA, SymbolShort, Timeframe)
+    if magic_registry:
+        from magic_registry import allocate_magic
+        owner = magic_owner or f"{EA}|{SymbolShort}|{Timeframe}"
+        magic_number = allocate_magic(magic_registry, EA, SymbolShort, Timeframe, owner, set_name=base_filename)
+    else:
+        magic_number = generate_fixed_magic_number(EA, SymbolShort, Timeframe)
 
     # Now insert magic_number into the full file name
     parts = base_parts + [f"M{magic_number}", SetVersion, Step]
@@ -0,0 +1,315 @@
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from update_magic_and_rename_files import extract_info, generate_fixed_magic_number
+
+logger = logging.getLogger(__name__)
+
+SIBLING_EXTS = [".htm", ".gif"]
+DEFAULT_WORKERS = 8
+
+def walk_set_files(roots):
+    """Yields (folder, file name) of every .set under roots, using scandir for large trees."""
+    stack = [os.path.abspath(r) for r in roots]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.lower().endswith(".set"):
+                        yield folder, entry.name
+        except OSError as e:
+            logger.error(f"Cannot scan {folder}: {e}")
+
+def plan_renumber(roots):
+    """
+    Plans the rename_files changes for every .set under roots without touching anything.
+    Returns (ops, skipped). Each op renames <old>.set to
+    <EA>_<SYMBOL>_<TF>_<middle>_M<new magic>_<tail>.set, rewrites Magic= and renames the .htm/.gif siblings.
+    skipped lists unrecognized names and target collisions. A file already named for its new magic
+    gets an op (Magic= only) when its Magic= line is stale, as rename_files always rewrote it.
+    """
+    ops = []
+    skipped = []
+    targets = set()
+    for folder, file in walk_set_files(roots):
+        ea_name, symbol, timeframe, middle, old_magic, tail = extract_info(file)
+        if not all([ea_name, symbol, timeframe, middle, old_magic, tail]):
+            skipped.append({"path": os.path.join(folder, file), "reason": "unrecognized filename"})
+            continue
+        new_magic = generate_fixed_magic_number(ea_name, symbol, timeframe)
+        new_file = f"{ea_name}_{symbol}_{timeframe}_{middle}_M{new_magic}_{tail}.set"
+        # Magic= currently in the file (what rollback restores), not the one in the name.
+        # Repeated Magic= lines that disagree are all recorded, so rollback restores each of them.
+        magics = _read_magics(os.path.join(folder, file))
+        old_magic = magics[0] if len(set(magics)) == 1 else (magics or None)
+        if new_file == file:
+            # Already named for the new magic: only a stale Magic= line needs rewriting
+            if all(value.strip() == new_magic for value in magics):
+                continue
+        else:
+            target = os.path.join(folder, new_file)
+            if target in targets or os.path.exists(target):
+                skipped.append({"path": os.path.join(folder, file), "reason": f"target exists: {new_file}"})
+                continue
+            targets.add(target)
+        siblings = []
+        for ext in SIBLING_EXTS:
+            old_sibling = file.replace(".set", ext)
+            if os.path.exists(os.path.join(folder, old_sibling)):
+                siblings.append([old_sibling, new_file.replace(".set", ext)])
+        ops.append({
+            "id": len(ops),
+            "folder": folder,
+            "old": file,
+            "new": new_file,
+            "old_magic": old_magic,
+            "new_magic": new_magic,
+            "siblings": siblings,
+        })
+    return ops, skipped
+
+class RenumberJournal:
+    """
+    Append-only JSONL journal: a plan header, one line per planned op, then
+    done/failed/rolled_back records. Every record is flushed and fsynced before
+    the next file operation, so after a crash the journal says what may be half-done.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._f = None
+
+    @classmethod
+    def create(cls, path, roots, ops, skipped):
+        journal = cls(path)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(json.dumps({
+                "type": "plan", "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "roots": [os.path.abspath(r) for r in roots], "ops": len(ops), "skipped": skipped
+            }) + "\n")
+            for op in ops:
+                f.write(json.dumps(dict(op, type="op")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return journal
+
+    def load(self):
+        """Returns (ops, state) where state maps op id -> last record type."""
+        ops = []
+        state = {}
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A crash can leave a torn last line
+                    continue
+                kind = record.get("type")
+                if kind == "op":
+                    ops.append(record)
+                elif kind in ("done", "failed", "rolled_back"):
+                    state[record["id"]] = kind
+        return ops, state
+
+    def record(self, kind, op_id, **extra):
+        with self._lock:
+            if self._f is None:
+                self._f = open(self.path, "a", encoding="utf-8")
+            self._f.write(json.dumps(dict(extra, type=kind, id=op_id)) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._f is not None:
+                self._f.close()
+                self._f = None
+
+def _magic_lines(lines):
+    """Indices of the Magic= lines; the first is the one read (as update_set_file_magic and SetDocument do)."""
+    return [idx for idx, line in enumerate(lines) if line.strip().startswith("Magic=")]
+
+def _split_magic_line(line):
+    """(text up to and including "Magic=", value, line ending) of a Magic= line."""
+    head, value = line.split("Magic=", 1)
+    body = value.rstrip("\r\n")
+    return head + "Magic=", body, value[len(body):]
+
+def _read_magics(set_file_path):
+    """Values of the Magic= lines exactly as written, first one first ([] when there is none)."""
+    with open(set_file_path, "r", encoding="utf-8", newline="") as f:
+        lines = f.readlines()
+    return [_split_magic_line(lines[idx])[1] for idx in _magic_lines(lines)]
+
+def _set_magic(set_file_path, magic):
+    """
+    Replaces the value of every Magic= line in place, atomically, so a repeated line cannot keep
+    a stale magic. magic is one value for all lines, or a list with one value per line (rollback
+    of a file whose Magic= lines disagreed). Every other byte (comments, blank lines, line endings)
+    is kept, so writing back the old values restores the file exactly.
+    Files without a Magic= line are left as they are (like update_set_file_magic).
+    """
+    with open(set_file_path, "r", encoding="utf-8", newline="") as f:
+        lines = f.readlines()
+    indices = _magic_lines(lines)
+    if not indices:
+        logger.warning(f"'Magic=' line not found in {set_file_path}.")
+        return
+    values = magic if isinstance(magic, list) else [magic] * len(indices)
+    if len(values) != len(indices):
+        raise ValueError(f"{set_file_path} has {len(indices)} Magic= lines, expected {len(values)}")
+    changed = False
+    for idx, new_value in zip(indices, values):
+        head, value, ending = _split_magic_line(lines[idx])
+        if value != str(new_value):
+            lines[idx] = f"{head}{new_value}{ending}"
+            changed = True
+    if not changed:
+        return
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(set_file_path)), prefix=".set_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline="") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, set_file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _move(folder, src, dst):
+    """Renames src to dst unless that already happened (idempotent for resume/rollback)."""
+    if src == dst:
+        return
+    src_path = os.path.join(folder, src)
+    dst_path = os.path.join(folder, dst)
+    if os.path.exists(src_path):
+        if os.path.exists(dst_path):
+            raise FileExistsError(f"Both {src} and {dst} exist in {folder}")
+        os.rename(src_path, dst_path)
+
+def apply_op(op):
+    """Applies one planned op. Safe to repeat after a partial run."""
+    folder = op["folder"]
+    if os.path.exists(os.path.join(folder, op["old"])):
+        _set_magic(os.path.join(folder, op["old"]), op["new_magic"])
+    elif not os.path.exists(os.path.join(folder, op["new"])):
+        raise FileNotFoundError(f"Neither {op['old']} nor {op['new']} exists in {folder}")
+    for old_sibling, new_sibling in op["siblings"]:
+        _move(folder, old_sibling, new_sibling)
+    _move(folder, op["old"], op["new"])
+
+def revert_op(op):
+    """Undoes one op (also a partially applied one). Safe to repeat."""
+    folder = op["folder"]
+    _move(folder, op["new"], op["old"])
+    for old_sibling, new_sibling in op["siblings"]:
+        _move(folder, new_sibling, old_sibling)
+    if op["old_magic"] is not None and os.path.exists(os.path.join(folder, op["old"])):
+        _set_magic(os.path.join(folder, op["old"]), op["old_magic"])
+
+def _run_ops(journal, ops, func, done_kind, workers):
+    counters = {done_kind: 0, "failed": 0}
+    counters_lock = threading.Lock()
+
+    def run(op):
+        try:
+            func(op)
+            journal.record(done_kind, op["id"])
+            kind = done_kind
+        except Exception as e:
+            logger.error(f"Op {op['id']} ({op['old']}) failed: {e}")
+            journal.record("failed", op["id"], error=str(e))
+            kind = "failed"
+        with counters_lock:
+            counters[kind] += 1
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(run, ops))
+    finally:
+        journal.close()
+    return counters
+
+def execute_journal(journal_path, workers=DEFAULT_WORKERS):
+    """Runs every planned op not yet done (also resumes an interrupted run)."""
+    journal = RenumberJournal(journal_path)
+    ops, state = journal.load()
+    pending = [op for op in ops if state.get(op["id"]) != "done"]
+    counters = _run_ops(journal, pending, apply_op, "done", workers)
+    counters["already_done"] = len(ops) - len(pending)
+    logger.info(f"Renumber journal {journal_path} executed: {counters}")
+    return counters
+
+def rollback_journal(journal_path, workers=DEFAULT_WORKERS):
+    """Reverts every op that was started (done, failed or interrupted)."""
+    journal = RenumberJournal(journal_path)
+    ops, state = journal.load()
+    pending = [op for op in ops if state.get(op["id"]) != "rolled_back"]
+    counters = _run_ops(journal, pending, revert_op, "rolled_back", workers)
+    logger.info(f"Renumber journal {journal_path} rolled back: {counters}")
+    return counters
+
+def journal_status(journal_path):
+    ops, state = RenumberJournal(journal_path).load()
+    counters = {"ops": len(ops), "pending": 0, "done": 0, "failed": 0, "rolled_back": 0}
+    for op in ops:
+        counters[state.get(op["id"], "pending")] += 1
+    return counters
+
+def main():
+    parser = argparse.ArgumentParser(description="Plan, execute, resume or roll back bulk .set magic renumbering (rename_files for whole trees).")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_plan = sub.add_parser("plan", help="Scan folders and write the journal; nothing is changed")
+    p_plan.add_argument("--journal", required=True, help="Journal file (JSONL)")
+    p_plan.add_argument("roots", nargs="+", help="Folders to scan recursively")
+
+    p_apply = sub.add_parser("apply", help="Plan and execute in one go")
+    p_apply.add_argument("--journal", required=True, help="Journal file (JSONL)")
+    p_apply.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    p_apply.add_argument("roots", nargs="+", help="Folders to scan recursively")
+
+    for name, help_text in [("run", "Execute (or resume) a planned journal"),
+                            ("rollback", "Revert every op recorded in a journal"),
+                            ("status", "Count ops by state")]:
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--journal", required=True, help="Journal file (JSONL)")
+        if name != "status":
+            p.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        if args.command in ("plan", "apply"):
+            ops, skipped = plan_renumber(args.roots)
+            RenumberJournal.create(args.journal, args.roots, ops, skipped)
+            output["planned"] = len(ops)
+            output["skipped"] = len(skipped)
+            if args.command == "apply":
+                output.update(execute_journal(args.journal, args.workers))
+        elif args.command == "run":
+            output.update(execute_journal(args.journal, args.workers))
+        elif args.command == "rollback":
+            output.update(rollback_journal(args.journal, args.workers))
+        else:
+            output.update(journal_status(args.journal))
+        output["journal"] = args.journal
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    main()
@@ -6,6 +6,7 @@ import argparse
 from bs4 import BeautifulSoup
 import openpyxl  # For reading config.xlsx
 from pathlib import Path
+from artifact_blob_store import ensure_artifact_blob_tables, insert_artifact_row
 
 def get_ea_name_from_title(soup):
     title_tag = soup.find('title')
@@ -489,26 +490,16 @@ def insert_set_file_artifacts(
         link_id (int or None)
     Returns:
         int: The id of the newly inserted row.
+    The file content goes to the artifact_blobs store (deduplicated by SHA-256, written
+    incrementally); the row only holds blob_sha256.
     """
-    # Read file_blob from file_path, if it exists
-    file_blob = None
-    if file_path and os.path.isfile(file_path):
-        with open(file_path, "rb") as f:
-            file_blob = f.read()
-
-    sql = """
-        INSERT INTO set_file_artifacts (
-            step_id, artifact_type, file_path, meta_json, file_blob, link_type, link_id
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
-    """
-    params = (step_id, artifact_type, file_path, meta_json, file_blob, link_type, link_id)
     conn = sqlite3.connect(db_path)
     #conn.execute("PRAGMA key = 'Kh78784bt!'")
     try:
-        cur = conn.cursor()
-        cur.execute(sql, params)
+        ensure_artifact_blob_tables(conn)
+        artifact_id = insert_artifact_row(conn, step_id, artifact_type, file_path, meta_json, link_type, link_id)
         conn.commit()
-        return cur.lastrowid
+        return artifact_id
     finally:
         conn.close()
 
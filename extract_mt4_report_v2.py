@@ -14,9 +14,14 @@ from bs4 import BeautifulSoup
 
 import build_filename
 from build_filename import build_filename
-from set_file_updater import update_single_parameter
-
-from wave_analysis import get_wave_analysis_result_block
+from magic_registry import lineage_owner_key
+from set_file_updater import SetDocument
+from artifact_materializer import materialize_file, stream_rewrite_gif_src
+from artifact_blob_store import ensure_artifact_blob_tables, insert_artifact_row
+from set_lineage_store import SET_ARTIFACT_PARENTS, ensure_set_lineage_tables, find_artifact_set_version, store_set_version
+
+from wave_analysis import get_wave_analysis_result_block, construct_wave_analysis_csv_path
+from wave_portfolio import pip_size_for_symbol
 # --- Logging Setup ---
 # class FlushFileHandler(logging.FileHandler):
 #     def emit(self, record):
@@ -83,40 +88,6 @@ def get_wave_analysis_parameters_from_config(config_xlsx_path, sheet_name="WaveA
         logger.warning(f"Failed to load wave analysis parameters from config: {e}")
         return {}
 
-def construct_wave_analysis_csv_path(
-    data_dir,
-    source,
-    symbol,
-    start_date,
-    end_date,
-    timeframe
-):
-    """
-    Constructs the full path to the wave analysis CSV file.
-    Example:
-      data_dir: "C:/Users/Philip/Documents/GitHub/mt4_optimizer/TickData"
-      source: "Dukascopy"
-      symbol: "AUDCAD"
-      start_date: "2006.01.03"
-      end_date: "2025.09.05"
-      timeframe: "M30"
-    Returns:
-      "C:/Users/Philip/Documents/GitHub/mt4_optimizer/TickData/Dukascopy-AUDCAD-2006.01.03-2025.09.05-bardata_M30.csv"
-    """
-    import os
-
-    # Clean up inputs
-    data_dir = os.path.normpath(data_dir)
-    source = str(source)
-    symbol = str(symbol)
-    start_date = str(start_date)
-    end_date = str(end_date)
-    timeframe = str(timeframe).upper()
-
-    filename = f"{source}-{symbol}-{start_date}-{end_date}-bardata_{timeframe}.csv"
-    full_path = os.path.join(data_dir, filename)
-    return full_path
-
 def read_config_xlsx(path, sheet_name="ai_optimizer"):
     import openpyxl
     wb = openpyxl.load_workbook(path, data_only=True)
@@ -608,9 +579,7 @@ def calc_drawdown_sl_money(max_drawdown, step=100):
     return base
 
 def copy_and_rename_html_and_gif(input_html, output_set_file_name, output_dir):
-    import shutil
     from pathlib import Path
-    import re
 
     # Determine output HTML and GIF names
     base_name = Path(output_set_file_name).stem  # e.g. ...S358
@@ -619,26 +588,15 @@ def copy_and_rename_html_and_gif(input_html, output_set_file_name, output_dir):
     out_html_path = Path(output_dir) / out_html_name
     out_gif_path = Path(output_dir) / out_gif_name
 
-    # Read HTML, find src GIF
-    with open(input_html, "r", encoding="utf-8") as f:
-        html = f.read()
-
-    # Find original GIF name(s)
-    gif_matches = re.findall(r'<img\s+src="([^"]+\.gif)"', html, re.IGNORECASE)
-    if not gif_matches:
+    # Stream the HTML to its new name, pointing every GIF src at the new GIF name
+    orig_gif_name = stream_rewrite_gif_src(input_html, out_html_path, out_gif_name)
+    if not orig_gif_name:
+        os.remove(out_html_path)
         raise Exception("No GIF image found in HTML!")
-    orig_gif_name = gif_matches[0]
     orig_gif_path = Path(input_html).parent / orig_gif_name
 
-    # Replace all GIF src with new GIF name
-    html_new = re.sub(r'(<img\s+src=")[^"]+\.gif(")', r'\1' + out_gif_name + r'\2', html, flags=re.IGNORECASE)
-
-    # Write new HTML
-    with open(out_html_path, "w", encoding="utf-8") as f:
-        f.write(html_new)
-
-    # Copy GIF
-    shutil.copy(orig_gif_path, out_gif_path)
+    # The GIF is identical: reflink it when possible, copy otherwise
+    materialize_file(orig_gif_path, out_gif_path)
 
     # Return both names and full paths for downstream use
     return (
@@ -671,26 +629,58 @@ def insert_set_file_artifacts(
         link_id (int or None)
     Returns:
         int: The id of the newly inserted row.
+    The file content goes to the artifact_blobs store (deduplicated by SHA-256, written
+    incrementally); the row only holds blob_sha256.
     """
-    # Read file_blob from file_path, if it exists
-    file_blob = None
-    if file_path and os.path.isfile(file_path):
-        with open(file_path, "rb") as f:
-            file_blob = f.read()
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        ensure_artifact_blob_tables(conn)
+        artifact_id = insert_artifact_row(conn, step_id, artifact_type, file_path, meta_json, link_type, link_id)
+        conn.commit()
+        return artifact_id
+    finally:
+        conn.close()
 
-    sql = """
-        INSERT INTO set_file_artifacts (
-            step_id, artifact_type, file_path, meta_json, file_blob, link_type, link_id
-        ) VALUES (?, ?, ?, ?, ?, ?, ?)
+def insert_artifact_files(db_path, step_id, artifact_files, link_id=None, link_type="test_metrics"):
+    """
+    Records every existing file in artifact_files ([{"artifact_type", "file_path"}]) in set_file_artifacts,
+    in one connection and transaction.
+    .set artifacts (input_set/output_set/ai_set) are kept in the set_versions lineage store as a
+    line delta against their parent set; meta_json holds set_version_id.
+    Every other file goes to the artifact_blobs store; the row holds blob_sha256.
     """
-    params = (step_id, artifact_type, file_path, meta_json, file_blob, link_type, link_id)
     conn = sqlite3.connect(db_path)
     #conn.execute("PRAGMA key = 'Kh78784bt!'")
     try:
-        cur = conn.cursor()
-        cur.execute(sql, params)
+        ensure_set_lineage_tables(conn)
+        ensure_artifact_blob_tables(conn)
+        versions = {}
+        for artifact in artifact_files:
+            artifact_type = artifact["artifact_type"]
+            file_path = artifact["file_path"]
+            if not file_path or not os.path.isfile(file_path):
+                continue
+            meta = {}
+            if artifact_type in SET_ARTIFACT_PARENTS:
+                with open(file_path, "rb") as f:
+                    file_blob = f.read()
+                parent_type = SET_ARTIFACT_PARENTS[artifact_type]
+                parent_id = None
+                if parent_type:
+                    parent_id = versions.get(parent_type)
+                    if parent_id is None:
+                        parent_id = find_artifact_set_version(conn, step_id, parent_type, link_type, link_id)
+                versions[artifact_type] = store_set_version(conn, file_blob, parent_id)
+                meta["set_version_id"] = versions[artifact_type]
+                conn.execute("""
+                    INSERT INTO set_file_artifacts (
+                        step_id, artifact_type, file_path, meta_json, file_blob, link_type, link_id
+                    ) VALUES (?, ?, ?, ?, NULL, ?, ?)
+                """, (step_id, artifact_type, file_path, json.dumps(meta), link_type, link_id))
+            else:
+                insert_artifact_row(conn, step_id, artifact_type, file_path, json.dumps(meta), link_type, link_id)
         conn.commit()
-        return cur.lastrowid
     finally:
         conn.close()
 
@@ -776,6 +766,8 @@ def process_mt4_report(
     NumTrade = metrics.get("Total trades", "")
     SetVersion = "1"
     Step = step_id
+    # Optional portfolio-wide magic registry (config key magic_registry = true)
+    use_registry = config is not None and config.get("magic_registry", "").strip().lower() in ("1", "true", "yes")
 
     output_set_file_name, magic_number = build_filename(
         EA=EA_name,
@@ -791,7 +783,9 @@ def process_mt4_report(
         ProfitFactor=ProfitFactor,
         NumTrade=NumTrade,
         SetVersion=SetVersion,
-        Step=Step
+        Step=Step,
+        magic_registry=db_path if use_registry else None,
+        magic_owner=lineage_owner_key(db_path, input_set_file) if use_registry else None
     )
     output_file = os.path.join(output_set_file_path, output_set_file_name)
 
@@ -803,14 +797,16 @@ def process_mt4_report(
 
     summary_csv = gen_summary_csv(metrics_no_parameters, custom_metrics, summary_metrics_full_path)
 
-    shutil.copy(input_set_file, output_file)
-    logger.info(f"Copied {input_set_file} to {output_file}")
+    # Read the input .set once, patch it in memory and write the output once
+    set_doc = SetDocument.load(input_set_file)
     if drawdown_sl_money is not None:
-        update_single_parameter(output_file, "DrawDown_SL_Money", drawdown_sl_money)
-        logger.info(f"Updated DrawDown_SL_Money in {output_file} to {drawdown_sl_money}")
+        set_doc.set_value("DrawDown_SL_Money", drawdown_sl_money)
+        logger.info(f"DrawDown_SL_Money set to {drawdown_sl_money}")
     if magic_number is not None:
-        update_single_parameter(output_file, "Magic", magic_number)
-        logger.info(f"Updated Magic in {output_file} to {magic_number}")
+        set_doc.set_value("Magic", magic_number)
+        logger.info(f"Magic set to {magic_number}")
+    set_doc.save(output_file)
+    logger.info(f"Wrote {output_file} from {input_set_file}")
 
     out_html_name, out_html_path, out_gif_name, out_gif_path, orig_gif_path = copy_and_rename_html_and_gif(
         html_file, output_set_file_name, output_set_file_path
@@ -870,6 +866,7 @@ def process_mt4_report(
             spec_path = config.get("spec_path")
             api_key = config.get("api_key")
             models = config.get("models")
+            token_budget = int(float(config["token_budget"])) if config.get("token_budget") else None
 
             set_path = output_file
             summary_path = summary_metrics_full_path
@@ -907,17 +904,56 @@ def process_mt4_report(
                 timeframe=Timeframe
             )
 
-            # (C) Build the wave analysis block
-            wave_analysis_block = get_wave_analysis_result_block(
-                csv_path=wave_params["csv_path"],
-                depth=wave_params["depth"],
-                deviation=wave_params["deviation"],
-                backstep=wave_params["backstep"],
-                percentage=wave_params["percentage"],
-                force_factor=wave_params["force_factor"],
-                normal_wave=wave_params["normal_wave"],
-                medium_wave=wave_params["medium_wave"]
-            )
+            # (C) Build the wave analysis block (from wave_analysis_cache unless disabled in config),
+            # counting pips in the symbol's own unit (0.01 for JPY pairs, 0.1 for gold)
+            pip_size = pip_size_for_symbol(Symbol_code)
+            if config.get("wave_analysis_cache", "").strip().lower() in ("0", "false", "no"):
+                wave_analysis_block = get_wave_analysis_result_block(
+                    csv_path=wave_params["csv_path"],
+                    depth=wave_params["depth"],
+                    deviation=wave_params["deviation"],
+                    backstep=wave_params["backstep"],
+                    percentage=wave_params["percentage"],
+                    force_factor=wave_params["force_factor"],
+                    normal_wave=wave_params["normal_wave"],
+                    medium_wave=wave_params["medium_wave"],
+                    pip_size=pip_size
+                )
+            else:
+                from wave_result_cache import cached_wave_analysis_result
+
+                wave_analysis_block, _ = cached_wave_analysis_result(
+                    db_path=db_path,
+                    csv_path=wave_params["csv_path"],
+                    symbol=Symbol_code,
+                    timeframe=Timeframe,
+                    depth=wave_params["depth"],
+                    deviation=wave_params["deviation"],
+                    backstep=wave_params["backstep"],
+                    percentage=wave_params["percentage"],
+                    force_factor=wave_params["force_factor"],
+                    normal_wave=wave_params["normal_wave"],
+                    medium_wave=wave_params["medium_wave"],
+                    pip_size=pip_size
+                )
+
+            # Queue mode: hand the suggestion to ai_suggestion_queue workers instead of waiting for the LLM
+            if config.get("ai_suggestion_mode", "").strip().lower() == "queue":
+                from ai_suggestion_queue import enqueue_suggestion_job
+
+                job_id = enqueue_suggestion_job(
+                    db_path=db_path,
+                    step_id=step_id,
+                    set_path=set_path,
+                    summary_path=summary_path,
+                    output_path=output_path,
+                    config_xlsx_path=config_xlsx_path,
+                    suggestion_json_path=suggestion_json_path,
+                    wave_analysis_block=wave_analysis_block,
+                    test_metrics_id=test_metrics_id,
+                )
+                insert_artifact_files(db_path, step_id, artifact_files, link_id=test_metrics_id)
+                return json.dumps({"ai_suggestion_job_id": job_id})
 
             ai_set_file_path = suggest_mode_and_sections_and_params_openrouter(
                 template_path=template_path,
@@ -932,7 +968,8 @@ def process_mt4_report(
                 config_xlsx_path=config_xlsx_path,
                 suggestion_json_path=suggestion_json_path,
                 models=models,
-                wave_analysis_block=wave_analysis_block
+                wave_analysis_block=wave_analysis_block,
+                **({"token_budget": token_budget} if token_budget else {})
             )
             logger.info(f"AI set file suggestion complete: {output_path}")
 
@@ -944,33 +981,13 @@ def process_mt4_report(
                     {"artifact_type": "ai_prompt", "file_path": suggestion_json_path.replace(".json", ".prompt.txt")},
                 ])
 
-            for artifact in artifact_files:
-                if artifact["file_path"] and os.path.exists(artifact["file_path"]):
-                    insert_set_file_artifacts(
-                        db_path=db_path,
-                        step_id=step_id,
-                        artifact_type=artifact["artifact_type"],
-                        file_path=artifact["file_path"],
-                        meta_json=json.dumps({}),  # Add metadata if needed
-                        link_type="test_metrics",
-                        link_id=test_metrics_id,
-                    )
+            insert_artifact_files(db_path, step_id, artifact_files, link_id=test_metrics_id)
             return json.dumps({"ai_set_file_path": output_path})
         except Exception as e:
             logger.exception(f"AI set file suggestion failed: {e}")
             return json.dumps({"result": "ai_set_file_suggestion_failed"})
     else:
-        for artifact in artifact_files:
-            if artifact["file_path"] and os.path.exists(artifact["file_path"]):
-                insert_set_file_artifacts(
-                    db_path=db_path,
-                    step_id=step_id,
-                    artifact_type=artifact["artifact_type"],
-                    file_path=artifact["file_path"],
-                    meta_json=json.dumps({}),  # Add metadata if needed
-                    link_type="test_metrics",
-                    link_id=test_metrics_id,
-                )
+        insert_artifact_files(db_path, step_id, artifact_files, link_id=test_metrics_id)
         result = "success"
         logger.info("Processing complete.")
         return json.dumps({"result": result})
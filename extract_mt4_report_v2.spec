@@ -5,8 +5,8 @@ a = Analysis(
     ['extract_mt4_report_v2.py'],
     pathex=[],
     binaries=[],
-    datas=[('wave_analysis.py', '.'), ('ai_set_optimizer_openrouter.py', '.'), ('build_filename.py', '.'), ('set_file_updater.py', '.')],
-    hiddenimports=['argparse', 'collections', 'datetime', 'hashlib', 'io', 'json', 'logging', 'numpy', 'openpyxl', 'os', 'pandas', 'pandas._libs', 're', 'requests', 'set_file_updater', 'sqlite3', 'sys', 'tiktoken', 'time', 'wave_analysis', 'ai_set_optimizer_openrouter', 'build_filename'],
+    datas=[('wave_analysis.py', '.'), ('ai_set_optimizer_openrouter.py', '.'), ('build_filename.py', '.'), ('set_file_updater.py', '.'), ('prompt_compactor.py', '.'), ('mt4_set_parser.py', '.'), ('file_cache.py', '.'), ('ai_suggestion_queue.py', '.'), ('set_file_parser.py', '.'), ('set_lineage_store.py', '.'), ('magic_registry.py', '.'), ('artifact_materializer.py', '.'), ('artifact_blob_store.py', '.'), ('bar_store.py', '.'), ('mt4_hst_reader.py', '.'), ('wave_result_cache.py', '.'), ('wave_portfolio.py', '.'), ('extract_setfilename_fields.py', '.')],
+    hiddenimports=['argparse', 'collections', 'datetime', 'hashlib', 'io', 'json', 'logging', 'numpy', 'openpyxl', 'os', 'pandas', 'pandas._libs', 're', 'requests', 'set_file_updater', 'sqlite3', 'sys', 'tiktoken', 'time', 'wave_analysis', 'ai_set_optimizer_openrouter', 'build_filename', 'prompt_compactor', 'mt4_set_parser', 'file_cache', 'ai_suggestion_queue', 'set_file_parser', 'set_lineage_store', 'magic_registry', 'artifact_materializer', 'artifact_blob_store', 'bar_store', 'mt4_hst_reader', 'wave_result_cache', 'wave_portfolio', 'extract_setfilename_fields'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
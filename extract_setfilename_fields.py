@@ -19,6 +19,35 @@ EA_PATTERNS = [
     r'PP'
 ]
 
+TIMEFRAMES = {"M1","M5","M15","M30","H1","H4","D1","W1","MN1"}
+
+# Compiled once; extract_fields runs for every file of a batch
+EA_RE = re.compile('|'.join(EA_PATTERNS), re.IGNORECASE)
+TOKEN_SPLIT_RE = re.compile(r'[ _\-]+')
+TIMEFRAME_RE = re.compile(r'\b(M1|M5|M15|M30|H1|H4|D1|W1|MN1)\b', re.IGNORECASE)
+DATE_RANGE_RE = re.compile(r'(\d{6,8})\s*[-_~ ]\s*(\d{6,8})')
+DATE_RE = re.compile(r'\b\d{6,8}\b')
+DEPOSIT_TOKEN_RE = re.compile(r'^\d{3,6}$')
+PROFIT_RE = re.compile(r'\b(P|PP|NP|TP)(\d+)(?!\.)\b')
+PROFIT_TOKEN_RE = re.compile(r'^(P|PP|NP|TP)(\d+)$')
+DD_RE = re.compile(r'DD(\d+)')
+D_RE = re.compile(r'\bD(\d{2,6})\b')
+SL_RE = re.compile(r'SL[\s_]?(\d+|Nil)', re.IGNORECASE)
+SL_PAREN_RE = re.compile(r'\(SL[\s_]?(\d+|Nil)\)', re.IGNORECASE)
+WR_RE = re.compile(r'WR[\s_]?(\d+(?:\.\d+)?)', re.IGNORECASE)
+PF_RES = [re.compile(p) for p in [r'PF(\d+\.\d+)', r'PF(\d+)', r'TP(\d+\.\d+)', r'PE(\d+\.\d+)', r'PE(\d+)']]
+PAREN_RE = re.compile(r'\([^)]*\)')
+BRACKET_RE = re.compile(r'\[[^]]*\]')
+NOISE_RE = re.compile(r'(Custom|Dynamic|XLOT|Lot)[^\s]*', re.IGNORECASE)
+DECIMAL_RE = re.compile(r'(?<![\dA-Za-z])(\d+\.\d+)(?![\dA-Za-z])')
+NUMTRADE_RE = re.compile(r'\bT{1,2}(\d+)\b')
+NUMTRADE_TOKEN_RE = re.compile(r'^T{1,2}(\d+)$')
+SET_VERSION_RE = re.compile(r'(?:_|-)V(\d+(?:\.\d+)?)(?=_|-|\.|$)', re.IGNORECASE)
+EA_VERSION_RE = re.compile(r'([0-9]{1,2}\.[0-9]{1,2})')
+STEP_RE = re.compile(r'(?:_|-)S(\d+)(?=_|-|\.|$)', re.IGNORECASE)
+
+_symbol_matchers = {}
+
 def load_symbol_list(symbol_csv_path):
     symbols = []
     with open(symbol_csv_path, encoding='utf-8') as f:
@@ -27,13 +56,44 @@ def load_symbol_list(symbol_csv_path):
             if row and row[0].strip():
                 symbol = row[0].strip()
                 if symbol: symbols.append(symbol)
-    symbols = sorted(list(set(symbols)), key=lambda s: -len(s))
+    # Longest first; equal lengths keep file order so the result does not depend on set ordering
+    symbols = sorted(dict.fromkeys(symbols), key=lambda s: -len(s))
     return symbols
 
+def symbol_matcher(symbol_list):
+    """
+    One compiled alternation for the whole symbol list (cached per list content).
+    The lookahead reports, at every start position, the first listed symbol that matches there.
+    """
+    key = tuple(symbol_list)
+    matcher = _symbol_matchers.get(key)
+    if matcher is None:
+        alternation = '|'.join(re.escape(s) for s in symbol_list)
+        pattern = re.compile(r'(?<![A-Z0-9])(?=(' + alternation + r')(?![A-Z0-9]))', re.IGNORECASE) if symbol_list else None
+        rank = {}
+        for i, s in enumerate(symbol_list):
+            rank.setdefault(s.lower(), i)
+        matcher = _symbol_matchers[key] = (pattern, rank)
+    return matcher
+
+def find_symbol(base, symbol_list):
+    """The first symbol of symbol_list found in base as a whole word (same result as testing them one by one)."""
+    pattern, rank = symbol_matcher(symbol_list)
+    if pattern is None:
+        return ""
+    best = None
+    for m in pattern.finditer(base):
+        i = rank[m.group(1).lower()]
+        if best is None or i < best:
+            best = i
+            if i == 0:
+                break
+    return symbol_list[best] if best is not None else ""
+
 def extract_fields(filename, symbol_list):
     base = os.path.basename(filename)
     base = os.path.splitext(base)[0]
-    tokens = re.split(r'[ _\-]+', base)  # Split by space, underscore, dash
+    tokens = TOKEN_SPLIT_RE.split(base)  # Split by space, underscore, dash
 
     result = {
         "EA": "",
@@ -53,8 +113,7 @@ def extract_fields(filename, symbol_list):
     }
 
     # EA detection (support in any position, support new EAs)
-    ea_pattern = re.compile('|'.join(EA_PATTERNS), re.IGNORECASE)
-    m = ea_pattern.search(base)
+    m = EA_RE.search(base)
     if m:
         ea = m.group(0)
         # Make sure EA is not a substring in the middle of another word (for Lotto/LO/LT/BB/CB)
@@ -65,31 +124,27 @@ def extract_fields(filename, symbol_list):
             result["EA"] = ea
 
     # Symbol detection (longest match priority)
-    for symbol in symbol_list:
-        if re.search(r'(?<![A-Z0-9])' + re.escape(symbol) + r'(?![A-Z0-9])', base, re.IGNORECASE):
-            result["Symbol"] = symbol
-            break
+    result["Symbol"] = find_symbol(base, symbol_list)
 
     # Timeframe detection
-    m = re.search(r'\b(M1|M5|M15|M30|H1|H4|D1|W1|MN1)\b', base, re.IGNORECASE)
+    m = TIMEFRAME_RE.search(base)
     if m:
         result["Timeframe"] = m.group(1).upper()
     else:
         for token in tokens:
-            if token.upper() in {"M1","M5","M15","M30","H1","H4","D1","W1","MN1"}:
+            if token.upper() in TIMEFRAMES:
                 result["Timeframe"] = token.upper()
                 break
 
     # StartDate & EndDate: Look for 6-8 digit number patterns separated by dash, underscore, tilde, or space
-    date_pattern = re.compile(r'(\d{6,8})\s*[-_~ ]\s*(\d{6,8})')
-    m = date_pattern.search(base)
+    m = DATE_RANGE_RE.search(base)
     if m:
         result["StartDate"] = m.group(1)[:8]  # Truncate to 8 digits if longer
         enddate = m.group(2)
         result["EndDate"] = enddate[:8]  # Truncate to 8 digits if longer
     else:
         # fallback: find all 6-8 digit numbers, use first two as Start/End date
-        all_dates = re.findall(r'\b\d{6,8}\b', base)
+        all_dates = DATE_RE.findall(base)
         if all_dates:
             result["StartDate"] = all_dates[0][:8]
             if len(all_dates) > 1:
@@ -109,93 +164,89 @@ def extract_fields(filename, symbol_list):
     # If not found, try to find a token that is a 3-6 digit number, not a date
     if not initial_deposit:
         for token in tokens:
-            if re.match(r'^\d{3,6}$', token):
+            if DEPOSIT_TOKEN_RE.match(token):
                 if token != result["StartDate"] and token != result["EndDate"]:
                     initial_deposit = token
                     break
     result["InitialDeposit"] = initial_deposit
 
     # ProfitAmount: Pxxxx, PPxxxx, NPxxxx, or TPxxxx (must not be followed by a dot)
-    m = re.search(r'\b(P|PP|NP|TP)(\d+)(?!\.)\b', base)
+    m = PROFIT_RE.search(base)
     if m:
         result["ProfitAmount"] = m.group(2)
     else:
         # fallback: scan tokens for Pxxx, PPxxx, NPxxx
         for token in tokens:
-            mt = re.match(r'^(P|PP|NP|TP)(\d+)$', token)
+            mt = PROFIT_TOKEN_RE.match(token)
             if mt:
                 result["ProfitAmount"] = mt.group(2)
                 break
 
     # DrawDown: DDxxx, Dxxx, Dxxxx
-    m = re.search(r'DD(\d+)', base)
+    m = DD_RE.search(base)
     if m:
         result["DrawDown"] = m.group(1)
     else:
         # Only Dxxx if not ProfitAmount or NumTrade
-        matches = re.findall(r'\bD(\d{2,6})\b', base)
+        matches = D_RE.findall(base)
         for candidate in matches:
             if candidate != result["ProfitAmount"] and candidate != result["NumTrade"]:
                 result["DrawDown"] = candidate
                 break
 
     # Stoploss: SLxxx, SL xxx, (SL xxx), SLNil
-    m = re.search(r'SL[\s_]?(\d+|Nil)', base, re.IGNORECASE)
+    m = SL_RE.search(base)
     if not m:
-        m = re.search(r'\(SL[\s_]?(\d+|Nil)\)', base, re.IGNORECASE)
+        m = SL_PAREN_RE.search(base)
     if m:
         result["Stoploss"] = m.group(1)
 
     # WinRate: WRxx or WRxx.x or WinRatexx
-    m = re.search(r'WR[\s_]?(\d+(?:\.\d+)?)', base, re.IGNORECASE)
+    m = WR_RE.search(base)
     if m:
         result["WinRate"] = str(int(float(m.group(1))))
 
     # ProfitFactor: PFx.xx (first), then TPx.xx or PEx.xx (but only if decimal)
-    m = re.search(r'PF(\d+\.\d+)', base)
-    if not m:
-        m = re.search(r'PF(\d+)', base)
-    if not m:
-        m = re.search(r'TP(\d+\.\d+)', base)
-    if not m:
-        m = re.search(r'PE(\d+\.\d+)', base)
-    if not m:
-        m = re.search(r'PE(\d+)', base)
+    m = None
+    for pf_re in PF_RES:
+        m = pf_re.search(base)
+        if m:
+            break
     if m:
         result["ProfitFactor"] = m.group(1)
     else:
         # Enhanced fallback: Find last decimal number not in parentheses/brackets or after x or x.
-        no_paren = re.sub(r'\([^)]*\)', ' ', base)
-        no_paren = re.sub(r'\[[^]]*\]', ' ', no_paren)
-        no_noise = re.sub(r'(Custom|Dynamic|XLOT|Lot)[^\s]*', ' ', no_paren, flags=re.IGNORECASE)
-        decs = re.findall(r'(?<![\dA-Za-z])(\d+\.\d+)(?![\dA-Za-z])', no_noise)
+        no_paren = PAREN_RE.sub(' ', base)
+        no_paren = BRACKET_RE.sub(' ', no_paren)
+        no_noise = NOISE_RE.sub(' ', no_paren)
+        decs = DECIMAL_RE.findall(no_noise)
         if decs:
             result["ProfitFactor"] = decs[-1]
 
     # NumTrade: Txxxx, TTxxxx, Txxx, Txx, T598 (not part of PF or TP)
-    m = re.search(r'\bT{1,2}(\d+)\b', base)
+    m = NUMTRADE_RE.search(base)
     if m:
         result["NumTrade"] = m.group(1)
     else:
         # fallback: scan tokens for Txxx, TTxxx
         for token in tokens:
-            mt = re.match(r'^T{1,2}(\d+)$', token)
+            mt = NUMTRADE_TOKEN_RE.match(token)
             if mt:
                 result["NumTrade"] = mt.group(1)
                 break
 
     # SetVersion: priority to _V1_, _V1-, _V1., _V1$ (not as part of EA)
-    m = re.search(r'(?:_|-)V(\d+(?:\.\d+)?)(?=_|-|\.|$)', base, re.IGNORECASE)
+    m = SET_VERSION_RE.search(base)
     if m:
         result["SetVersion"] = m.group(1)
     else:
         # If EA has version in it, extract to SetVersion as well (for legacy compatibility)
-        m = re.search(r'([0-9]{1,2}\.[0-9]{1,2})', result["EA"])
+        m = EA_VERSION_RE.search(result["EA"])
         if m:
             result["SetVersion"] = m.group(1)
 
     # Step: priority to _S1_, _S1-, _S1., _S1$ etc.
-    m = re.search(r'(?:_|-)S(\d+)(?=_|-|\.|$)', base, re.IGNORECASE)
+    m = STEP_RE.search(base)
     if m:
         result["Step"] = m.group(1)
 
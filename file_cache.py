@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+import tempfile
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Set this environment variable to share the on-disk cache between processes/machines
+CACHE_DIR_ENV = "MT4_OPTIMIZER_CACHE_DIR"
+
+_memory_cache = {}
+_memory_lock = threading.Lock()
+
+def default_cache_dir():
+    """Returns the on-disk cache directory ($MT4_OPTIMIZER_CACHE_DIR or <tmp>/mt4_optimizer_cache)."""
+    return os.environ.get(CACHE_DIR_ENV) or os.path.join(tempfile.gettempdir(), "mt4_optimizer_cache")
+
+def file_identity(path):
+    """Returns (absolute path, mtime_ns, size) for path; changes whenever the file is rewritten."""
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_mtime_ns, st.st_size
+
+def _disk_path(cache_dir, namespace, identity, extra_key):
+    key = json.dumps([namespace, list(identity), extra_key], sort_keys=True, default=str)
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, namespace, digest + ".json")
+
+def _read_disk(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return True, json.load(f)["value"]
+    except FileNotFoundError:
+        return False, None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cache entry {path}: {e}")
+        return False, None
+
+def _write_disk(path, value):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"value": value}, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Could not write cache entry {path}: {e}")
+
+def cached_file_result(namespace, path, compute, extra_key=None, cache_dir=None, use_disk=True):
+    """
+    Memoizes compute(path) by file identity (path, mtime, size).
+    Looks in the in-process cache first, then in the on-disk JSON cache, then computes.
+    The result must be JSON-serializable. Exceptions from compute are not cached.
+    Arguments:
+        namespace (str): Name of the derived artifact, e.g. "prompt_template".
+        path (str): Source file the result is derived from.
+        compute (callable): compute(path) -> value.
+        extra_key: Extra JSON-serializable key (e.g. a sheet name).
+        cache_dir (str or None): On-disk cache directory (default: default_cache_dir()).
+        use_disk (bool): Set False to keep the result in memory only.
+    """
+    identity = file_identity(path)
+    memory_key = (namespace, identity[0], json.dumps(extra_key, sort_keys=True, default=str))
+    with _memory_lock:
+        entry = _memory_cache.get(memory_key)
+    if entry is not None and entry[0] == identity:
+        return entry[1]
+
+    disk_path = _disk_path(cache_dir or default_cache_dir(), namespace, identity, extra_key) if use_disk else None
+    found, value = _read_disk(disk_path) if disk_path else (False, None)
+    if found:
+        logger.info(f"Cache hit on disk for {namespace}: {path}")
+    else:
+        value = compute(path)
+        if disk_path:
+            _write_disk(disk_path, value)
+    with _memory_lock:
+        _memory_cache[memory_key] = (identity, value)
+    return value
+
+def clear_memory_cache():
+    """Drops all in-process entries (the on-disk cache is left untouched)."""
+    with _memory_lock:
+        _memory_cache.clear()
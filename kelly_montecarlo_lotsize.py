@@ -3,23 +3,11 @@ import re
 import csv
 import numpy as np
 
+from set_file_parser import parse_set_path, coerce_value
+
 def parse_set_file(set_path):
-    settings = {}
-    with open(set_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            if '=' in line:
-                key, val = line.strip().split('=', 1)
-                key = key.strip()
-                val = val.strip()
-                # Try to convert to float/int if possible
-                try:
-                    if '.' in val:
-                        val = float(val)
-                    else:
-                        val = int(val)
-                except Exception:
-                    pass
-                settings[key] = val
+    # Try to convert values to float/int if possible
+    settings = {k: coerce_value(v) for k, v in parse_set_path(set_path).values().items()}
     # Only keep typical risk/money management settings
     risk_keys = ['Lots', 'LotSize', 'Risk', 'FixedLot', 'MaxLot', 'MinLot', 'UseMartingale', 'Multiplier', 'MaxDrawdown', 'MaxLots', 'Step', 'RiskPercent', 'UseMM', 'MoneyManagement', 'StartLot']
     return {k: settings[k] for k in settings if any(rk.lower() in k.lower() for rk in risk_keys)}
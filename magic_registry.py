@@ -0,0 +1,256 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import logging
+
+from build_filename import generate_fixed_magic_number
+
+logger = logging.getLogger(__name__)
+
+MAX_PROBES = 1000
+
+def ensure_magic_registry_table(conn):
+    """Creates magic_registry: one row per allocated magic (the primary key), owned by one set."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS magic_registry (
+        magic INTEGER PRIMARY KEY,
+        owner_key TEXT NOT NULL UNIQUE,
+        ea TEXT,
+        symbol TEXT,
+        timeframe TEXT,
+        salt INTEGER NOT NULL DEFAULT 0,
+        set_name TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    # Next salt to try per EA/symbol/timeframe, so allocation does not re-probe taken salts
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS magic_registry_salts (
+        ea TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        next_salt INTEGER NOT NULL,
+        PRIMARY KEY (ea, symbol, timeframe)
+    )
+    """)
+
+def candidate_magic(ea_name, symbol, timeframe, salt=0):
+    """
+    Probe sequence for EA/symbol/timeframe. Salt 0 is generate_fixed_magic_number itself,
+    so the first set of a combination keeps the magic it always had.
+    """
+    if salt == 0:
+        return int(generate_fixed_magic_number(ea_name, symbol, timeframe))
+    base_string = f"{ea_name}|{symbol}|{timeframe}|{salt}"
+    hash_bytes = hashlib.sha256(base_string.encode('utf-8')).digest()
+    return abs(int.from_bytes(hash_bytes[:4], byteorder='little', signed=True))
+
+def allocate_magic_conn(conn, ea_name, symbol, timeframe, owner_key, set_name=None):
+    """
+    Returns the magic registered for owner_key, or registers the next free candidate.
+    Probing resumes at the combination's next salt and each probe is one primary-key
+    lookup, so allocation is O(1) unless hashes collide. Salts of released magics are
+    not handed out again. Does not commit.
+    """
+    row = conn.execute("SELECT magic FROM magic_registry WHERE owner_key = ?", (owner_key,)).fetchone()
+    if row:
+        return row[0]
+    row = conn.execute(
+        "SELECT next_salt FROM magic_registry_salts WHERE ea = ? AND symbol = ? AND timeframe = ?",
+        (ea_name, symbol, timeframe)
+    ).fetchone()
+    first_salt = row[0] if row else 0
+    for salt in range(first_salt, first_salt + MAX_PROBES):
+        magic = candidate_magic(ea_name, symbol, timeframe, salt)
+        if magic == 0:
+            continue  # 0 is the magic of manual trades
+        if conn.execute("SELECT 1 FROM magic_registry WHERE magic = ?", (magic,)).fetchone():
+            continue
+        conn.execute(
+            "INSERT INTO magic_registry (magic, owner_key, ea, symbol, timeframe, salt, set_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (magic, owner_key, ea_name, symbol, timeframe, salt, set_name)
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO magic_registry_salts (ea, symbol, timeframe, next_salt) VALUES (?, ?, ?, ?)",
+            (ea_name, symbol, timeframe, salt + 1)
+        )
+        if salt > first_salt:
+            logger.info(f"Magic for {owner_key} allocated after {salt - first_salt} probes: {magic}")
+        return magic
+    raise RuntimeError(f"No free magic for {ea_name}|{symbol}|{timeframe} after {MAX_PROBES} probes")
+
+def allocate_magic(db_path, ea_name, symbol, timeframe, owner_key, set_name=None):
+    """allocate_magic_conn in its own write transaction (safe with concurrent allocators). Returns the magic as a string."""
+    conn = sqlite3.connect(db_path, timeout=30)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        ensure_magic_registry_table(conn)
+        conn.execute("BEGIN IMMEDIATE")
+        magic = allocate_magic_conn(conn, ea_name, symbol, timeframe, owner_key, set_name)
+        conn.commit()
+        return str(magic)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def lineage_owner_key(db_path, set_file_name):
+    """
+    Registry owner for a set and all its descendants: the lineage root found through
+    test_metrics (set_file_name -> input_set_file). Steps that derive a new set from an input set
+    therefore reuse the input's magic instead of allocating a new one per report.
+    """
+    from ai_set_optimizer_openrouter import find_lineage_root
+
+    set_file_name = os.path.basename(set_file_name)
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        root = find_lineage_root(conn, set_file_name)
+    except sqlite3.OperationalError:
+        # No test_metrics table yet: the set is its own root
+        root = set_file_name
+    finally:
+        conn.close()
+    return f"lineage:{root}"
+
+def registered_magics(db_path, low, high):
+    """Registered magics in [low, high] (an empty set when the registry table does not exist yet)."""
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        rows = conn.execute("SELECT magic FROM magic_registry WHERE magic BETWEEN ? AND ?", (int(low), int(high))).fetchall()
+    except sqlite3.OperationalError:
+        return set()
+    finally:
+        conn.close()
+    return {row[0] for row in rows}
+
+def release_magic(db_path, owner_key=None, magic=None):
+    """Frees a magic (by owner or by value) once its set is retired. Returns the number of rows removed."""
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        ensure_magic_registry_table(conn)
+        if owner_key is not None:
+            cur = conn.execute("DELETE FROM magic_registry WHERE owner_key = ?", (owner_key,))
+        else:
+            cur = conn.execute("DELETE FROM magic_registry WHERE magic = ?", (int(magic),))
+        conn.commit()
+        return cur.rowcount
+    finally:
+        conn.close()
+
+def audit_set_library(db_path, roots, symbol_csv=None, register=False):
+    """
+    One pass over every .set under roots, grouping by the Magic= value.
+    Reports magics used by more than one EA/symbol/timeframe (hash collisions), magics shared
+    by several sets of the same combination, files whose Magic= differs from M<magic> in the
+    name, and magics registered to another owner. register=True records unregistered
+    magics (owner = file path) so later allocations avoid them.
+    """
+    from set_file_parser import parse_set_path
+    from set_library_index import walk_set_files, DEFAULT_SYMBOL_CSV
+    from extract_setfilename_fields import load_symbol_list, extract_fields
+    import re
+
+    name_magic_re = re.compile(r"_M(\d+)_V\d+(?:_S\d+)?\.set$", re.IGNORECASE)
+    symbol_list = load_symbol_list(symbol_csv or DEFAULT_SYMBOL_CSV)
+    by_magic = {}
+    report = {"scanned": 0, "no_magic": [], "name_mismatch": [], "collisions": [], "shared": [],
+              "registry_conflicts": [], "registered": 0}
+    for file_path in walk_set_files(roots):
+        report["scanned"] += 1
+        try:
+            value = parse_set_path(file_path, use_cache=False).first_value("Magic")
+            magic = int(float(value)) if value not in (None, "") else None
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot read Magic from {file_path}: {e}")
+            magic = None
+        if magic is None:
+            report["no_magic"].append(file_path)
+            continue
+        m = name_magic_re.search(os.path.basename(file_path))
+        if m and int(m.group(1)) != magic:
+            report["name_mismatch"].append({"file_path": file_path, "magic": magic, "name_magic": int(m.group(1))})
+        fields = extract_fields(file_path, symbol_list)
+        by_magic.setdefault(magic, []).append((file_path, (fields["EA"], fields["Symbol"], fields["Timeframe"])))
+
+    for magic, files in by_magic.items():
+        if len(files) < 2:
+            continue
+        combos = sorted({"|".join(c) for _, c in files})
+        entry = {"magic": magic, "combinations": combos, "files": [f for f, _ in files]}
+        report["collisions" if len(combos) > 1 else "shared"].append(entry)
+
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        ensure_magic_registry_table(conn)
+        for magic, files in by_magic.items():
+            row = conn.execute("SELECT owner_key, ea, symbol, timeframe FROM magic_registry WHERE magic = ?", (magic,)).fetchone()
+            combo = files[0][1]
+            if row is None:
+                if register:
+                    # salt -1 marks magics found by the audit rather than allocated here
+                    conn.execute(
+                        "INSERT INTO magic_registry (magic, owner_key, ea, symbol, timeframe, salt, set_name) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (magic, files[0][0], combo[0], combo[1], combo[2], -1, os.path.basename(files[0][0]))
+                    )
+                    report["registered"] += 1
+            elif (row[1], row[2], row[3]) != combo:
+                report["registry_conflicts"].append({"magic": magic, "owner_key": row[0], "file_path": files[0][0]})
+        conn.commit()
+    finally:
+        conn.close()
+    report["distinct_magics"] = len(by_magic)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Portfolio-wide magic number registry.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_alloc = sub.add_parser("allocate", help="Allocate (or look up) the magic of one set")
+    p_alloc.add_argument("--db-path", required=True)
+    p_alloc.add_argument("--ea", required=True)
+    p_alloc.add_argument("--symbol", required=True)
+    p_alloc.add_argument("--timeframe", required=True)
+    p_alloc.add_argument("--owner", required=True, help="Unique key of the set (e.g. its file name without the magic)")
+
+    p_release = sub.add_parser("release", help="Free a magic")
+    p_release.add_argument("--db-path", required=True)
+    p_release.add_argument("--owner")
+    p_release.add_argument("--magic", type=int)
+
+    p_audit = sub.add_parser("audit", help="Scan .set folders for magic collisions in one pass")
+    p_audit.add_argument("--db-path", required=True)
+    p_audit.add_argument("roots", nargs="+")
+    p_audit.add_argument("--symbols", help="SymbolList.csv")
+    p_audit.add_argument("--register", action="store_true", help="Record unregistered magics found in the library")
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        started = time.perf_counter()
+        if args.command == "allocate":
+            output["magic"] = allocate_magic(args.db_path, args.ea, args.symbol, args.timeframe, args.owner)
+        elif args.command == "release":
+            if args.owner is None and args.magic is None:
+                raise ValueError("Specify --owner or --magic")
+            output["released"] = release_magic(args.db_path, owner_key=args.owner, magic=args.magic)
+        else:
+            output.update(audit_set_library(args.db_path, args.roots, args.symbols, args.register))
+        output["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ import json
 import openai
 import re
 from set_file_updater import update_parameters
+from set_file_parser import parse_set_path
 
 def extract_json_objects(text):
     """
@@ -37,16 +38,10 @@ def get_current_value(param_name, set_path):
     Extract the current value of a parameter from the .set file.
     """
     try:
-        with open(set_path, encoding='utf-8') as f:
-            for line in f:
-                if line.strip().startswith(param_name + "="):
-                    try:
-                        return float(line.strip().split("=")[1])
-                    except Exception:
-                        return None
+        value = parse_set_path(set_path).first_value(param_name)
+        return float(value.split("=")[0]) if value is not None else None
     except Exception:
-        pass
-    return None
+        return None
 
 def parse_section_args(section_arg):
     """
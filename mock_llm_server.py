@@ -0,0 +1,290 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from string import Template
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8765
+CHAT_PATHS = ("/api/v1/chat/completions", "/v1/chat/completions", "/chat/completions")
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+SET_LINE_RE = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_]*)=(-?\d+(?:\.\d+)?)\s*$", re.MULTILINE)
+SECTION_RE = re.compile(r"^[^=\r\n]*={3,}\s*([^=\r\n]+?)\s*={3,}", re.MULTILINE)
+
+DEFAULT_OPTIONS = {
+    "seed": 42,
+    "latency_ms": 800.0,           # fixed/mean/median latency depending on the distribution
+    "latency_jitter_ms": 200.0,    # uniform half-width or normal std dev
+    "latency_sigma": 0.5,          # lognormal sigma
+    "latency_dist": "lognormal",
+    "rate_limit_rate": 0.0,        # probability of a random 429
+    "rate_limit_every": 0,         # every N requests start a 429 burst (0 = off)
+    "rate_limit_burst": 0,         # length of each 429 burst
+    "retry_after": 1.0,            # Retry-After seconds sent with 429s
+    "error_rate": 0.0,             # probability of a 500
+    "malformed_rate": 0.0,         # probability of a response without two valid JSON blocks
+    "params_per_response": 5,
+    "response_template": None,     # string.Template with $model, $request_id, $mode_sections_json, $parameters_json
+}
+
+# Responses get_valid_json_from_ai must reject (fewer than two valid JSON blocks)
+MALFORMED_RESPONSES = [
+    "I could not determine the best parameters for this EA.",
+    "```json\n{\"mode\": \"grid\", \"sections\": [\n```\n```json\n[{\"name\": \"GridStep\", \"start\": 10,\n```",
+    "```json\n{\"mode\": \"grid\", \"sections\": []}\n```\nParameter list omitted.",
+]
+
+DEFAULT_RESPONSE_TEMPLATE = (
+    "Mode and sections:\n```json\n$mode_sections_json\n```\n"
+    "Parameters:\n```json\n$parameters_json\n```\n"
+)
+
+def _rng_for(seed, model, prompt, occurrence):
+    """Deterministic RNG per (seed, model, prompt, n-th time this prompt was seen)."""
+    digest = hashlib.sha256(f"{seed}|{model}|{occurrence}|{prompt}".encode("utf-8")).hexdigest()
+    return random.Random(int(digest[:16], 16))
+
+def sample_latency(rng, options):
+    """Returns a latency in seconds drawn from options["latency_dist"]."""
+    dist = options["latency_dist"]
+    mean = options["latency_ms"]
+    if dist == "fixed":
+        ms = mean
+    elif dist == "uniform":
+        ms = rng.uniform(mean - options["latency_jitter_ms"], mean + options["latency_jitter_ms"])
+    elif dist == "normal":
+        ms = rng.gauss(mean, options["latency_jitter_ms"])
+    elif dist == "exponential":
+        ms = rng.expovariate(1.0 / mean) if mean > 0 else 0
+    else:
+        ms = rng.lognormvariate(0, options["latency_sigma"]) * mean
+    return max(ms, 0) / 1000.0
+
+def build_suggestion_response(prompt, model, rng, options, request_id):
+    """Builds a templated suggestion from the .set lines and section headers found in the prompt."""
+    sections = []
+    for name in SECTION_RE.findall(prompt):
+        name = name.strip()
+        if name and name not in sections:
+            sections.append(name)
+    params = {}
+    for name, value in SET_LINE_RE.findall(prompt):
+        params.setdefault(name, float(value))
+    names = sorted(params)
+    picked = rng.sample(names, min(options["params_per_response"], len(names)))
+    parameters = []
+    for name in picked:
+        value = params[name]
+        base = abs(value) if value else 1.0
+        step = base / 4.0 if base >= 4 else 1.0
+        parameters.append({
+            "name": name,
+            "start": round(value - 2 * step, 4),
+            "end": round(value + 2 * step, 4),
+            "step": round(step, 4),
+            "reason": f"Mock suggestion from {model}",
+        })
+    mode_sections = {
+        "mode": rng.choice(["grid", "trend", "hedge"]),
+        "sections": [
+            {"name": s, "explanation": f"Mock section rationale {i + 1}"}
+            for i, s in enumerate(rng.sample(sections, min(2, len(sections))))
+        ],
+    }
+    template = Template(options["response_template"] or DEFAULT_RESPONSE_TEMPLATE)
+    return template.safe_substitute(
+        model=model,
+        request_id=request_id,
+        mode_sections_json=json.dumps(mode_sections, indent=2),
+        parameters_json=json.dumps(parameters, indent=2),
+    )
+
+class MockLLMServer(ThreadingHTTPServer):
+    """OpenRouter/OpenAI-compatible chat completions stand-in with configurable faults."""
+    daemon_threads = True
+
+    def __init__(self, address, options=None):
+        super().__init__(address, MockLLMHandler)
+        self.options = dict(DEFAULT_OPTIONS)
+        self.options.update({k: v for k, v in (options or {}).items() if v is not None})
+        if self.options["latency_dist"] not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {self.options['latency_dist']}")
+        self.lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1/chat/completions"
+
+    def reset_stats(self):
+        with self.lock:
+            self.request_count = 0
+            self.prompt_seen = {}
+            self.stats = {"requests": 0, "ok": 0, "rate_limited": 0, "errors": 0, "malformed": 0,
+                          "latency_sec_total": 0.0, "by_model": {}}
+
+    def plan_request(self, model, prompt):
+        """Decides the outcome of one request. Returns (status, latency_sec, content or None)."""
+        with self.lock:
+            self.request_count += 1
+            n = self.request_count
+            key = (model, prompt)
+            occurrence = self.prompt_seen.get(key, 0)
+            self.prompt_seen[key] = occurrence + 1
+        options = self.options
+        rng = _rng_for(options["seed"], model, prompt, occurrence)
+        latency = sample_latency(rng, options)
+        every, burst = options["rate_limit_every"], options["rate_limit_burst"]
+        in_burst = every > 0 and burst > 0 and (n - 1) % every < burst
+        if in_burst or rng.random() < options["rate_limit_rate"]:
+            return 429, min(latency, 0.05), None
+        if rng.random() < options["error_rate"]:
+            return 500, latency, None
+        if rng.random() < options["malformed_rate"]:
+            return 200, latency, rng.choice(MALFORMED_RESPONSES)
+        return 200, latency, build_suggestion_response(prompt, model, rng, options, f"mock-{n}")
+
+    def record(self, model, status, latency, malformed):
+        with self.lock:
+            stats = self.stats
+            stats["requests"] += 1
+            stats["latency_sec_total"] += latency
+            per_model = stats["by_model"].setdefault(model, {"requests": 0, "rate_limited": 0})
+            per_model["requests"] += 1
+            if status == 429:
+                stats["rate_limited"] += 1
+                per_model["rate_limited"] += 1
+            elif status >= 500:
+                stats["errors"] += 1
+            else:
+                stats["ok"] += 1
+                if malformed:
+                    stats["malformed"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps(self.stats))
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.server.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        if self.path == "/reset":
+            self.server.reset_stats()
+            self._send_json(200, {"reset": True})
+            return
+        if self.path not in CHAT_PATHS:
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            data = json.loads(raw or b"{}")
+            model = data.get("model", "mock/model")
+            prompt = "\n".join(m.get("content", "") for m in data.get("messages", []) if m.get("role") == "user")
+        except Exception as e:
+            self._send_json(400, {"error": {"message": f"invalid request body: {e}"}})
+            return
+
+        status, latency, content = self.server.plan_request(model, prompt)
+        time.sleep(latency)
+        self.server.record(model, status, latency, content in MALFORMED_RESPONSES)
+        if status == 429:
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "code": 429}},
+                            headers={"Retry-After": str(self.server.options["retry_after"])})
+        elif status >= 500:
+            self._send_json(status, {"error": {"message": "Mock upstream error", "code": status}})
+        else:
+            self._send_json(200, {
+                "id": f"mock-{self.server.request_count}",
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4,
+                          "total_tokens": (len(prompt) + len(content)) // 4},
+            })
+
+def start_mock_server(host="127.0.0.1", port=0, **options):
+    """Starts MockLLMServer on a background thread (port=0 picks a free port). Returns the server."""
+    server = MockLLMServer((host, port), options)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logger.info(f"Mock LLM server listening on {server.url}")
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenRouter-compatible mock LLM server for offline load tests of the AI suggestion pipeline.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--seed", type=int, default=DEFAULT_OPTIONS["seed"])
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default=DEFAULT_OPTIONS["latency_dist"])
+    parser.add_argument("--latency-ms", type=float, default=DEFAULT_OPTIONS["latency_ms"], help="Fixed/mean/median latency in ms")
+    parser.add_argument("--latency-jitter-ms", type=float, default=DEFAULT_OPTIONS["latency_jitter_ms"], help="Uniform half-width or normal std dev in ms")
+    parser.add_argument("--latency-sigma", type=float, default=DEFAULT_OPTIONS["latency_sigma"], help="Lognormal sigma")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of a random 429")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Start a 429 burst every N requests")
+    parser.add_argument("--rate-limit-burst", type=int, default=0, help="Number of 429s per burst")
+    parser.add_argument("--retry-after", type=float, default=DEFAULT_OPTIONS["retry_after"], help="Retry-After seconds for 429s")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 500")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Probability of a response without two valid JSON blocks")
+    parser.add_argument("--params-per-response", type=int, default=DEFAULT_OPTIONS["params_per_response"])
+    parser.add_argument("--response-template", help="Template file ($model, $request_id, $mode_sections_json, $parameters_json)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    template = None
+    if args.response_template:
+        with open(args.response_template, encoding="utf-8") as f:
+            template = f.read()
+    server = MockLLMServer((args.host, args.port), {
+        "seed": args.seed,
+        "latency_dist": args.latency_dist,
+        "latency_ms": args.latency_ms,
+        "latency_jitter_ms": args.latency_jitter_ms,
+        "latency_sigma": args.latency_sigma,
+        "rate_limit_rate": args.rate_limit_rate,
+        "rate_limit_every": args.rate_limit_every,
+        "rate_limit_burst": args.rate_limit_burst,
+        "retry_after": args.retry_after,
+        "error_rate": args.error_rate,
+        "malformed_rate": args.malformed_rate,
+        "params_per_response": args.params_per_response,
+        "response_template": template,
+    })
+    logger.info(f"Mock LLM server listening on {server.url} (set OPENROUTER_API_URL to this URL); stats at /stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
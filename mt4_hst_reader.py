@@ -0,0 +1,120 @@
+import argparse
+import json
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+HST_HEADER_SIZE = 148
+
+# int version; char copyright[64]; char symbol[12]; int period; int digits;
+# int timesign; int last_sync; int unused[13]
+HST_HEADER_DTYPE = np.dtype([
+    ("version", "<i4"), ("copyright", "S64"), ("symbol", "S12"), ("period", "<i4"), ("digits", "<i4"),
+    ("timesign", "<i4"), ("last_sync", "<i4"), ("unused", "<i4", (13,)),
+])
+
+# Build 600+ (MqlRates, packed): 60 bytes per bar
+HST_V401_DTYPE = np.dtype([
+    ("time", "<i8"), ("open", "<f8"), ("high", "<f8"), ("low", "<f8"), ("close", "<f8"),
+    ("volume", "<i8"), ("spread", "<i4"), ("real_volume", "<i8"),
+])
+
+# Build < 600: 44 bytes per bar, note low before high
+HST_V400_DTYPE = np.dtype([
+    ("time", "<i4"), ("open", "<f8"), ("low", "<f8"), ("high", "<f8"), ("close", "<f8"), ("volume", "<f8"),
+])
+
+HST_BAR_DTYPES = {400: HST_V400_DTYPE, 401: HST_V401_DTYPE}
+
+def read_hst_header(hst_path):
+    """Header fields of an MT4 .hst file as a dict (version, copyright, symbol, period, digits, timesign, last_sync)."""
+    with open(hst_path, "rb") as f:
+        raw = f.read(HST_HEADER_SIZE)
+    if len(raw) < HST_HEADER_SIZE:
+        raise ValueError(f"{hst_path} is too short for an HST header ({len(raw)} bytes)")
+    header = np.frombuffer(raw, dtype=HST_HEADER_DTYPE, count=1)[0]
+    return {
+        "version": int(header["version"]),
+        "copyright": header["copyright"].split(b"\x00", 1)[0].decode(errors="replace"),
+        "symbol": header["symbol"].split(b"\x00", 1)[0].decode(errors="replace"),
+        "period": int(header["period"]),
+        "digits": int(header["digits"]),
+        "timesign": int(header["timesign"]),
+        "last_sync": int(header["last_sync"]),
+    }
+
+def map_hst_bars(hst_path):
+    """
+    (header, bars) where bars is a read-only np.memmap of the bar records with the structured
+    dtype of the file version. A trailing partial record (the terminal still writing) is ignored.
+    """
+    header = read_hst_header(hst_path)
+    dtype = HST_BAR_DTYPES.get(header["version"])
+    if dtype is None:
+        raise ValueError(f"Unsupported HST version {header['version']} in {hst_path}")
+    count = (os.path.getsize(hst_path) - HST_HEADER_SIZE) // dtype.itemsize
+    if count <= 0:
+        return header, np.empty(0, dtype=dtype)
+    bars = np.memmap(hst_path, dtype=dtype, mode="r", offset=HST_HEADER_SIZE, shape=(count,))
+    return header, bars
+
+def read_hst_columns(hst_path):
+    """
+    {column: array} of an MT4 .hst file (v400 or v401): datetime (datetime64[ns], UTC as stored),
+    open, high, low, close, volume and, for v401, spread. Columns are converted in bulk from the
+    mapped records; bars with a zero or non-finite price are dropped, as read_mt4_csv does.
+    """
+    header, bars = map_hst_bars(hst_path)
+    times = bars["time"].astype(np.int64)
+    columns = {"datetime": times.astype("datetime64[s]").astype("datetime64[ns]")}
+    for col in ["open", "high", "low", "close"]:
+        columns[col] = np.asarray(bars[col], dtype=np.float64)
+    columns["volume"] = np.asarray(bars["volume"]).astype(np.int64)
+    if "spread" in bars.dtype.names:
+        columns["spread"] = np.asarray(bars["spread"], dtype=np.int64)
+    del bars
+
+    valid = np.ones(len(times), dtype=bool)
+    for col in ["open", "high", "low", "close"]:
+        valid &= np.isfinite(columns[col]) & (columns[col] != 0.0)
+    if not valid.all():
+        logger.warning(f"{hst_path}: dropping {int((~valid).sum())} bars with zero or non-finite prices")
+        columns = {col: values[valid] for col, values in columns.items()}
+    logger.info(f"Read {len(columns['datetime'])} bars from {hst_path} ({header['symbol']} M{header['period']}, v{header['version']})")
+    return columns
+
+def read_hst(hst_path):
+    """MT4 .hst file as a DataFrame with the read_mt4_csv columns (plus spread for v401)."""
+    return pd.DataFrame(read_hst_columns(hst_path), copy=False)
+
+def main():
+    parser = argparse.ArgumentParser(description="Read an MT4 .hst history file (v400/v401).")
+    parser.add_argument('--hst_path', type=str, required=True, help='Path to MT4 HST file')
+    parser.add_argument('--csv_out', type=str, default=None, help='Optional CSV export of the bars')
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        header = read_hst_header(args.hst_path)
+        bars = read_hst(args.hst_path)
+        output.update(header)
+        output["bars"] = len(bars)
+        if len(bars):
+            output["first_bar"] = str(bars['datetime'].iloc[0])
+            output["last_bar"] = str(bars['datetime'].iloc[-1])
+        if args.csv_out:
+            bars.to_csv(args.csv_out, index=False)
+            output["csv_out"] = args.csv_out
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
-import re
-from typing import List, Dict, Any
+from typing import List
+
+from set_file_parser import parse_set_path
 
 # Sections to ignore in the set file
 IGNORE_SECTIONS = [
@@ -34,48 +35,19 @@ class MT4SetFile:
         self.load()
 
     def load(self):
-        with open(self.filename, encoding="utf-8") as f:
-            lines = f.readlines()
-
-        param_dict: Dict[str, Dict[str, Any]] = {}
-        param_name = None
-        current_section = None
-        ignore_section = False
-
-        for line in lines:
-            line = line.strip()
-            # Detect section headers
-            if "=========" in line or "******" in line:
-                current_section = line.replace("_", "").replace("=", "").replace("*", "").strip()
-                ignore_section = any(sect in line for sect in IGNORE_SECTIONS)
+        parsed = parse_set_path(self.filename)
+        for p in parsed.parameters.values():
+            # Parameters under ignored sections are skipped
+            if p.header and any(sect in p.header for sect in IGNORE_SECTIONS):
                 continue
-            if ignore_section:
-                continue
-            if not line or "=" not in line:
-                continue
-            if "," in line:
-                match = re.match(r"([a-zA-Z0-9_]+),([F123])=(.*)", line)
-                if match:
-                    name, typ, val = match.groups()
-                    if name not in param_dict:
-                        param_dict[name] = {"section": current_section}
-                    param_dict[name][typ] = val
-            else:
-                name, val = line.split("=", 1)
-                param_name = name
-                if name not in param_dict:
-                    param_dict[name] = {"section": current_section}
-                param_dict[name]["value"] = val
-
-        for k, v in param_dict.items():
             self.parameters.append(
                 MT4SetParameter(
-                    name=k,
-                    value=v.get("value"),
-                    start=v.get("1"),
-                    step=v.get("2"),
-                    end=v.get("3"),
-                    section=v.get("section")
+                    name=p.name,
+                    value=p.value,
+                    start=p.start,
+                    step=p.step,
+                    end=p.end,
+                    section=p.section
                 )
             )
 
@@ -0,0 +1,218 @@
+import csv
+import io
+import math
+import re
+import logging
+from functools import lru_cache
+
+from mt4_set_parser import IGNORE_SECTIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOKEN_BUDGET = 12000
+
+# Summary metrics the prompt actually needs (column names written by gen_summary_csv)
+DEFAULT_SUMMARY_METRICS = [
+    "Symbol", "Period", "initial_deposit", "net_profit", "profit_factor", "expected_payoff",
+    "max_drawdown", "max_drawdown_pct", "max_relative_drawdown", "max_relative_drawdown_pct",
+    "absolute_drawdown", "recovery_factor", "total_trades", "win_rate", "sharpe_ratio", "sortino_ratio",
+    "largest_loss_trade", "max_consecutive_losses", "max_consecutive_loss",
+]
+
+# Spec columns kept when the budget forces the parameter specification to shrink
+ESSENTIAL_SPEC_COLUMNS = ["Section", "Parameter", "Description"]
+
+CSV_SPLIT_RE = re.compile(r',(?=(?:[^\"]*\"[^\"]*\")*[^\"]*$)')
+JUNK_KEY_RE = re.compile(r".+,\d+,\w+$")
+
+@lru_cache(maxsize=None)
+def _get_encoding(model):
+    """Returns a tiktoken encoding for the model, or None when tiktoken cannot be used."""
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    name = model.split("/")[-1] if model else "gpt-4o"
+    try:
+        try:
+            return tiktoken.encoding_for_model(name)
+        except KeyError:
+            # Non-OpenAI models: o200k_base is a close enough approximation for budgeting
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # e.g. BPE files cannot be downloaded on an offline machine
+        logger.warning(f"Could not load tiktoken encoding for {model}: {e}")
+        return None
+
+def count_tokens(text, model="openai/gpt-4o"):
+    """Counts prompt tokens for the model; falls back to ~4 characters per token."""
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return int(math.ceil(len(text) / 4.0))
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_tokens_for_models(text, models):
+    """Returns the largest token count across models (the prompt must fit all of them)."""
+    models = models or ["openai/gpt-4o"]
+    return max(count_tokens(text, m) for m in models)
+
+def _param_base_name(key):
+    return key.split(",")[0].strip()
+
+def compact_set_content(set_content):
+    """
+    Returns the .set content without ignored sections (IGNORE_SECTIONS) and junk keys.
+    Section header lines of kept sections are preserved for context.
+    """
+    lines = []
+    ignore_section = False
+    for line in set_content.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if "=========" in line or "******" in line:
+            ignore_section = any(sect in line for sect in IGNORE_SECTIONS)
+            if not ignore_section:
+                lines.append(line)
+            continue
+        if ignore_section or "=" not in line:
+            continue
+        key = line.split("=", 1)[0].strip()
+        if JUNK_KEY_RE.match(key):
+            continue
+        lines.append(line)
+    return "\n".join(lines)
+
+def tunable_parameter_names(compact_set):
+    """Returns parameter names present in compacted .set content, in file order."""
+    names = []
+    seen = set()
+    for line in compact_set.splitlines():
+        if "=========" in line or "******" in line or "=" not in line:
+            continue
+        name = _param_base_name(line.split("=", 1)[0])
+        if name and name not in seen:
+            seen.add(name)
+            names.append(name)
+    return names
+
+def compact_spec_content(spec_content, parameter_names, columns=None):
+    """
+    Keeps the spec header plus the rows for parameter_names.
+    columns: optional list of column names to keep (e.g. ESSENTIAL_SPEC_COLUMNS).
+    """
+    lines = [l.strip() for l in spec_content.splitlines() if l.strip()]
+    if not lines:
+        return ""
+    header = [x.strip() for x in lines[0].split(",")]
+    try:
+        param_idx = header.index("Parameter")
+    except ValueError:
+        param_idx = 1
+    keep_idx = None
+    if columns:
+        keep_idx = [i for i, h in enumerate(header) if h in columns]
+    wanted = set(parameter_names)
+    out = [",".join(header[i] for i in keep_idx) if keep_idx else lines[0]]
+    for line in lines[1:]:
+        parts = CSV_SPLIT_RE.split(line)
+        if len(parts) > param_idx and parts[param_idx].strip() in wanted:
+            out.append(",".join(parts[i].strip() for i in keep_idx if i < len(parts)) if keep_idx else line)
+    return "\n".join(out)
+
+def compact_summary_csv(summary_content, metric_names=None):
+    """Reduces the header/value summary CSV written by gen_summary_csv to metric_names."""
+    metric_names = metric_names or DEFAULT_SUMMARY_METRICS
+    rows = list(csv.reader(io.StringIO(summary_content)))
+    if len(rows) < 2 or len(rows[0]) != len(rows[1]):
+        return summary_content
+    values = dict(zip(rows[0], rows[1]))
+    keys = [k for k in metric_names if k in values]
+    if not keys:
+        return summary_content
+    return ",".join(keys) + "\n" + ",".join(values[k] for k in keys)
+
+def _truncate_lines_to_budget(text, max_tokens, model):
+    """Keeps whole lines from the top of text until max_tokens is reached."""
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        cost = count_tokens(line + "\n", model)
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+def build_budgeted_prompt(
+    build_prompt,
+    set_content,
+    spec_content,
+    summary_content,
+    suggestion_history_summary_block,
+    base_parameters=None,
+    models=None,
+    token_budget=DEFAULT_TOKEN_BUDGET,
+    summary_metrics=None
+):
+    """
+    Builds the suggestion prompt within token_budget.
+    build_prompt(set_content, spec_content, summary_content, history_block) must return the full prompt.
+    Reductions are applied in order until the prompt fits:
+      1. drop ignored sections, junk keys, non-tunable spec rows and unused summary metrics
+      2. keep only the essential spec columns
+      3. drop the suggestion history block
+      4. truncate the .set parameters on whole-line boundaries
+    Returns (prompt, token_count).
+    """
+    models = models or ["openai/gpt-4o"]
+    base_parameters = set(base_parameters or [])
+
+    compact_set = compact_set_content(set_content)
+    params = tunable_parameter_names(compact_set)
+    parts = {
+        "set": compact_set,
+        "spec": compact_spec_content(spec_content, params),
+        "summary": compact_summary_csv(summary_content, summary_metrics),
+        "history": suggestion_history_summary_block,
+    }
+
+    def render():
+        prompt = build_prompt(parts["set"], parts["spec"], parts["summary"], parts["history"])
+        return prompt, count_tokens_for_models(prompt, models)
+
+    prompt, tokens = render()
+    if not token_budget or tokens <= token_budget:
+        logger.info(f"Prompt fits budget: {tokens}/{token_budget} tokens.")
+        return prompt, tokens
+
+    parts["spec"] = compact_spec_content(spec_content, params, columns=ESSENTIAL_SPEC_COLUMNS)
+    prompt, tokens = render()
+    if tokens <= token_budget:
+        logger.info(f"Prompt fits budget with essential spec columns: {tokens}/{token_budget} tokens.")
+        return prompt, tokens
+
+    parts["history"] = ""
+    prompt, tokens = render()
+    if tokens <= token_budget:
+        logger.info(f"Prompt fits budget without suggestion history: {tokens}/{token_budget} tokens.")
+        return prompt, tokens
+
+    # Last resort: base parameters first, then the rest of the file, whole lines only
+    model = max(models, key=lambda m: count_tokens(parts["set"], m))
+    set_lines = parts["set"].splitlines()
+    base_lines = [l for l in set_lines if _param_base_name(l.split("=", 1)[0]) in base_parameters]
+    other_lines = [l for l in set_lines if _param_base_name(l.split("=", 1)[0]) not in base_parameters]
+    parts["set"] = "\n".join(base_lines)
+    prompt, tokens = render()
+    remaining = token_budget - tokens
+    if remaining > 0 and other_lines:
+        extra = _truncate_lines_to_budget("\n".join(other_lines), remaining, model).splitlines()
+        parts["set"] = "\n".join(base_lines + extra)
+        prompt, tokens = render()
+        while tokens > token_budget and extra:
+            extra.pop()
+            parts["set"] = "\n".join(base_lines + extra)
+            prompt, tokens = render()
+    logger.warning(f"Prompt truncated to fit budget: {tokens}/{token_budget} tokens.")
+    return prompt, tokens
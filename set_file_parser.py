@@ -0,0 +1,165 @@
+import os
+import re
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# <name>,F / <name>,1 (start) / <name>,2 (step) / <name>,3 (end)
+RANGE_KEY_RE = re.compile(r"([a-zA-Z0-9_]+),([F123])$")
+RANGE_FIELDS = {"1": "start", "2": "step", "3": "end", "F": "flag"}
+
+PARSE_CACHE_SIZE = 4096
+
+def is_section_header(line):
+    return "=========" in line or "******" in line
+
+def section_name(line):
+    """Section title of a header line, e.g. "___rc=== Risk Control ===" -> "rc Risk Control"."""
+    return line.replace("_", "").replace("=", "").replace("*", "").strip()
+
+def coerce_value(value):
+    """Converts a .set value to int/float when possible, else returns it unchanged."""
+    try:
+        if "." in value:
+            return float(value)
+        return int(value)
+    except (TypeError, ValueError):
+        return value
+
+class SetParameter:
+    """One .set parameter: value plus optimization start/step/end and F flag (all raw strings)."""
+    __slots__ = ("name", "value", "start", "step", "end", "flag", "section", "header")
+
+    def __init__(self, name, section=None, header=None):
+        self.name = name
+        self.value = None
+        self.start = None
+        self.step = None
+        self.end = None
+        self.flag = None
+        self.section = section
+        self.header = header
+
+    @property
+    def optimized(self):
+        return self.flag == "1"
+
+    def number(self, field="value"):
+        """Typed value of field ("value", "start", "step" or "end"), None when missing/not numeric."""
+        value = coerce_value(getattr(self, field))
+        return value if isinstance(value, (int, float)) else None
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "value": self.value,
+            "start": self.start,
+            "step": self.step,
+            "end": self.end,
+            "flag": self.flag,
+            "section": self.section,
+        }
+
+class ParsedSetFile:
+    """
+    Result of one .set parse. Shared through the parse cache, so treat it as read-only.
+    text: the original file content (to_text() round-trips it byte for byte)
+    entries: every key=value line in file order as (raw key, raw value)
+    parameters: name -> SetParameter, in first-seen order
+    """
+    __slots__ = ("path", "text", "entries", "parameters")
+
+    def __init__(self, path, text, entries, parameters):
+        self.path = path
+        self.text = text
+        self.entries = entries
+        self.parameters = parameters
+
+    def to_text(self):
+        return self.text
+
+    def pairs(self):
+        """[(key, value)] in file order (a fresh list)."""
+        return list(self.entries)
+
+    def values(self):
+        """{stripped key: stripped value}; later duplicates win."""
+        return {k.strip(): v.strip() for k, v in self.entries}
+
+    def first_value(self, key):
+        """Raw value of the first line whose key is exactly key, or None."""
+        for k, v in self.entries:
+            if k == key:
+                return v
+        return None
+
+    def get(self, name):
+        return self.parameters.get(name)
+
+def parse_set_text(text, path=None):
+    """Parses .set content in a single pass. Returns a ParsedSetFile."""
+    entries = []
+    parameters = {}
+    current_section = None
+    current_header = None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if is_section_header(line):
+            current_header = line
+            current_section = section_name(line)
+            if "=" not in line:
+                continue
+        if "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        entries.append((key, value))
+        if current_header == line:
+            continue
+        if "," in key:
+            match = RANGE_KEY_RE.match(key)
+            if not match:
+                continue
+            name, field = match.group(1), RANGE_FIELDS[match.group(2)]
+        else:
+            name, field = key, "value"
+        param = parameters.get(name)
+        if param is None:
+            param = parameters[name] = SetParameter(name, current_section, current_header)
+        setattr(param, field, value)
+    return ParsedSetFile(path, text, entries, parameters)
+
+_parse_cache = OrderedDict()
+_parse_cache_lock = threading.Lock()
+
+def parse_set_path(set_file_path, use_cache=True):
+    """
+    Reads and parses a .set file. Parses are cached by (absolute path, mtime, size),
+    so re-reading an unchanged file costs one stat() instead of a read and parse.
+    """
+    abs_path = os.path.abspath(set_file_path)
+    st = os.stat(abs_path)
+    identity = (st.st_mtime_ns, st.st_size)
+    if use_cache:
+        with _parse_cache_lock:
+            entry = _parse_cache.get(abs_path)
+            if entry is not None and entry[0] == identity:
+                _parse_cache.move_to_end(abs_path)
+                return entry[1]
+    with open(abs_path, encoding="utf-8") as f:
+        text = f.read()
+    parsed = parse_set_text(text, set_file_path)
+    if use_cache:
+        with _parse_cache_lock:
+            _parse_cache[abs_path] = (identity, parsed)
+            _parse_cache.move_to_end(abs_path)
+            while len(_parse_cache) > PARSE_CACHE_SIZE:
+                _parse_cache.popitem(last=False)
+    return parsed
+
+def clear_parse_cache():
+    with _parse_cache_lock:
+        _parse_cache.clear()
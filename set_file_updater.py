@@ -1,6 +1,10 @@
+import os
 import re
+import tempfile
 import logging
 
+from set_file_parser import parse_set_path
+
 logging.getLogger().handlers = []  # Remove all handlers
 logging.disable(logging.CRITICAL)  # Disable all logging
 logger = logging.getLogger(__name__)
@@ -26,19 +30,11 @@ def init_set_file(set_file_path):
         f.write(updated_content)
     logger.info(f"Set file initialized: {set_file_path}")
 
+JUNK_KEY_RES = [re.compile(r".+,\d+,\w+$"), re.compile(r".+,\d+,\d+$")]
+
 def parse_set_file(set_file_path):
     """Parse the .set file into an ordered list of (param, value) tuples."""
-    params = []
-    with open(set_file_path, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if '=' in line and not line.startswith('#') and ',' not in line.split('=')[0].strip().split()[-1]:
-                param, value = line.split('=', 1)
-                params.append((param, value))
-            elif '=' in line and not line.startswith('#'):
-                param, value = line.split('=', 1)
-                params.append((param, value))
-    return params
+    return parse_set_path(set_file_path).pairs()
 
 def write_set_file(params, out_path):
     """Write updated parameters back to a .set file."""
@@ -46,6 +42,133 @@ def write_set_file(params, out_path):
         for k, v in params:
             f.write(f"{k}={v}\n")
 
+def _atomic_write_text(out_path, text):
+    """Writes text to a temp file next to out_path, then renames it over out_path."""
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    fd, tmp_path = tempfile.mkstemp(dir=out_dir, prefix=".set_", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, out_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+class SetDocument:
+    """
+    In-memory .set file: load once, apply any number of patches, save once.
+    The source file is never modified unless it is also the save destination.
+    Repeated keys (loose match): the first occurrence is the one read and written, as the
+    line-rewriting tools (update_set_file_magic, bulk_set_renumber) do; writing a key drops its
+    later duplicates, so no stale value is left for MT4 to apply after the written one.
+    Example:
+        doc = SetDocument.load("input.set")
+        doc.set_value("Magic", 123456)
+        doc.apply_suggestions([{"name": "GridStep", "start": 10, "step": 5, "end": 30}])
+        doc.save("output.set")
+    """
+
+    def __init__(self, params=None, source_text=None):
+        self.params = list(params or [])
+        self.source_text = source_text
+        self.dirty = source_text is None
+        self._reindex()
+
+    @classmethod
+    def load(cls, set_file_path):
+        parsed = parse_set_path(set_file_path)
+        return cls(parsed.pairs(), source_text=parsed.text)
+
+    def _reindex(self):
+        # First occurrence wins for repeated keys; _duplicates lists the keys that have later copies
+        self._index = {}
+        self._duplicates = set()
+        for i, (k, _) in enumerate(self.params):
+            norm = normalize_param_name(k)
+            if norm in self._index:
+                self._duplicates.add(norm)
+            else:
+                self._index[norm] = i
+
+    def index_of(self, name):
+        """Position in params of the occurrence of name that get/set_value use, or None."""
+        return self._index.get(normalize_param_name(name))
+
+    def get(self, name, default=None):
+        i = self._index.get(normalize_param_name(name))
+        return self.params[i][1] if i is not None else default
+
+    def _drop_duplicates(self, norm):
+        """Removes every occurrence of norm after the first."""
+        first = self._index[norm]
+        self.params = [p for j, p in enumerate(self.params) if j <= first or normalize_param_name(p[0]) != norm]
+        self._reindex()
+        self.dirty = True
+
+    def set_value(self, name, value, rename=False):
+        """
+        Updates the first occurrence of name (loose match) and drops its later duplicates, or appends it.
+        rename: also write the key as name (update_parameters did so for ranges and flags).
+        """
+        value = str(value)
+        norm = normalize_param_name(name)
+        i = self._index.get(norm)
+        if i is not None:
+            if norm in self._duplicates:
+                self._drop_duplicates(norm)
+            key = name if rename else self.params[i][0]
+            if self.params[i] == (key, value):
+                return
+            self.params[i] = (key, value)
+        else:
+            self.params.append((name, value))
+            self._index[norm] = len(self.params) - 1
+        self.dirty = True
+
+    def set_values(self, values):
+        """set_value for every (name, value) in a dict or list of pairs."""
+        for name, value in (values.items() if isinstance(values, dict) else values):
+            self.set_value(name, value)
+
+    def set_range(self, name, start=None, step=None, end=None, optimize=True):
+        """Writes <name>,1/2/3 (start/step/end) and <name>,F."""
+        base = name.split(",")[0].strip()
+        for idx, value in zip([1, 2, 3], [start, step, end]):
+            if value is not None:
+                self.set_value(f"{base},{idx}", value, rename=True)
+        self.set_value(f"{base},F", "1" if optimize else "0", rename=True)
+
+    def reset_optimization_flags(self):
+        """Turns every <param>,F=1 into <param>,F=0 (the in-memory init_set_file)."""
+        for i, (k, v) in enumerate(self.params):
+            if k.endswith(",F") and v.startswith("1"):
+                self.params[i] = (k, "0" + v[1:])
+                self.dirty = True
+
+    def apply_suggestions(self, suggestions):
+        """Sets an optimization range for every suggestion ({"name", "start", "step", "end"})."""
+        for suggestion in suggestions:
+            self.set_range(suggestion["name"], suggestion.get("start"), suggestion.get("step"), suggestion.get("end"))
+
+    def remove_junk_keys(self):
+        """Removes keys like <param>,x,y or <param>,x,step."""
+        kept = [(k, v) for k, v in self.params if not any(r.match(k) for r in JUNK_KEY_RES)]
+        if len(kept) != len(self.params):
+            self.params = kept
+            self._reindex()
+            self.dirty = True
+
+    def to_text(self):
+        if not self.dirty:
+            return self.source_text
+        return "".join(f"{k}={v}\n" for k, v in self.params)
+
+    def save(self, out_path):
+        """Writes the document to out_path atomically (unchanged documents are written verbatim)."""
+        _atomic_write_text(out_path, self.to_text())
+        logger.info(f"Set file written to {out_path}")
+
 def update_parameters(input_set_path, suggestions, output_set_path):
     """
     Update MT4 .set file using OpenAI suggestions.
@@ -54,50 +177,15 @@ def update_parameters(input_set_path, suggestions, output_set_path):
       - Write <param>,2 = step
       - Write <param>,3 = stop/end
       - Write <param>,F = 1 (enable optimization)
-    Remove any lines with keys like <param>,x,y or <param>,x,step
+    All other <param>,F flags are reset to 0 and keys like <param>,x,y or <param>,x,step are removed.
+    The input file is left untouched; the output is written once.
     """
-    init_set_file(input_set_path)  # Ensure the set file is initialized
-    params = parse_set_file(input_set_path)
-    # Build lookup for easy update/overwrite
-    param_dict = {normalize_param_name(k): (i, v) for i, (k, v) in enumerate(params)}
-    updated_keys = set()
-
-    for suggestion in suggestions:
-        base_param = suggestion["name"].split(",")[0] if "," in suggestion["name"] else suggestion["name"]
-        base_param = base_param.strip()
-        # Set start, step, end (stop)
-        for idx, field in zip([1,2,3], ["start", "step", "end"]):
-            key = f"{base_param},{idx}"
-            norm_key = normalize_param_name(key)
-            value = suggestion.get(field)
-            if value is not None:
-                updated_keys.add(norm_key)
-                if norm_key in param_dict:
-                    orig_idx, _ = param_dict[norm_key]
-                    params[orig_idx] = (key, str(value))
-                else:
-                    params.append((key, str(value)))
-                    param_dict[norm_key] = (len(params)-1, str(value))
-        # Set F flag for optimization
-        flag_key = f"{base_param},F"
-        flag_norm = normalize_param_name(flag_key)
-        updated_keys.add(flag_norm)
-        if flag_norm in param_dict:
-            orig_idx, _ = param_dict[flag_norm]
-            params[orig_idx] = (flag_key, "1")
-        else:
-            params.append((flag_key, "1"))
-            param_dict[flag_norm] = (len(params)-1, "1")
-
-    # Remove lines with keys like <param>,x,y or <param>,x,step/stop/end
-    cleaned_params = []
-    for k, v in params:
-        # Remove keys with two or more commas (e.g. DrawDown_SL_Money,1,1 or DrawDown_SL_Money,1,step)
-        if re.match(r".+,\d+,\w+$", k) or re.match(r".+,\d+,\d+$", k):
-            continue
-        cleaned_params.append((k, v))
-
-    write_set_file(cleaned_params, output_set_path)
+    doc = SetDocument.load(input_set_path)
+    doc.reset_optimization_flags()
+    doc.apply_suggestions(suggestions)
+    doc.remove_junk_keys()
+    doc.dirty = True
+    doc.save(output_set_path)
     logger.info(f"Set file updated and written to {output_set_path}")
 
 def update_single_parameter(set_file_path, parameter_name, parameter_value, output_set_file_path=None):
@@ -105,22 +193,13 @@ def update_single_parameter(set_file_path, parameter_name, parameter_value, outp
     Update a single parameter in the .set file.
     If output_set_file_path is None, updates in-place.
     Example: update_single_parameter('file.set', 'Magic', 123456)
+    For several parameters, use SetDocument to read and write the file only once.
     """
-    params = parse_set_file(set_file_path)
-    norm_param = normalize_param_name(parameter_name)
-    updated = False
-
-    # Update if found, else add at the end
-    for i, (k, v) in enumerate(params):
-        if normalize_param_name(k) == norm_param:
-            params[i] = (k, str(parameter_value))
-            updated = True
-            break
-    if not updated:
-        params.append((parameter_name, str(parameter_value)))
-
+    doc = SetDocument.load(set_file_path)
+    doc.set_value(parameter_name, parameter_value)
+    doc.dirty = True
     out_path = output_set_file_path if output_set_file_path else set_file_path
-    write_set_file(params, out_path)
+    doc.save(out_path)
     logger.info(f"Parameter '{parameter_name}' updated to '{parameter_value}' in {out_path}")
 
 if __name__ == "__main__":
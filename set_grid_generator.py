@@ -0,0 +1,261 @@
+import argparse
+import csv
+import json
+import os
+import zipfile
+import logging
+from decimal import Decimal
+
+from build_filename import generate_fixed_magic_number
+from set_file_updater import SetDocument
+
+logger = logging.getLogger(__name__)
+
+MT4_MAX_MAGIC = 2 ** 31 - 1
+
+def _decimal(value):
+    return Decimal(str(value))
+
+def _format_decimal(value):
+    text = format(value.normalize(), "f")
+    return text if text != "-0" else "0"
+
+def grid_axis(suggestion):
+    """
+    Values of one suggestion ({"name", "start", "step", "end"}) as strings, start..end inclusive.
+    Decimal arithmetic avoids float drift (0.1 + 0.2 steps). A missing step/end gives just start.
+    """
+    start = _decimal(suggestion["start"])
+    step = suggestion.get("step")
+    end = suggestion.get("end")
+    if step is None or end is None or _decimal(step) == 0:
+        return [_format_decimal(start)]
+    step, end = _decimal(step), _decimal(end)
+    if (end - start) * step < 0:
+        return [_format_decimal(start)]
+    count = int((end - start) / step) + 1
+    return [_format_decimal(start + k * step) for k in range(count)]
+
+class SetGrid:
+    """
+    The cartesian product of suggestion ranges over a base .set, addressed by index.
+    Combination i is decoded in mixed radix, so nothing but the axes is kept in memory.
+    magic_registry: optional registry database; its registered magics are never given to a variant.
+    """
+
+    def __init__(self, base_set_path, suggestions, ea, symbol, timeframe, magic_registry=None):
+        self.names = []
+        self.axes = []
+        for suggestion in suggestions:
+            name = suggestion["name"].split(",")[0].strip()
+            if name in self.names:
+                continue
+            self.names.append(name)
+            self.axes.append(grid_axis(suggestion))
+        self.size = 1
+        for axis in self.axes:
+            self.size *= len(axis)
+
+        self.base_magic = int(generate_fixed_magic_number(ea, symbol, timeframe))
+        # The variant suffix replaces the last magic_digits digits. Suffixes whose magic is the live
+        # base magic (or a registered one) are skipped, so no variant trades under a live set's magic;
+        # a digit is added when the skipped suffixes leave too few for the grid.
+        self.magic_digits = len(str(max(self.size - 1, 0)))
+        while True:
+            self._set_magic_block(magic_registry)
+            if self.size + len(self.skipped_suffixes) <= 10 ** self.magic_digits:
+                break
+            self.magic_digits += 1
+        # The remaining prefix must be non-zero, or a combination would get magic 0 (manual trades)
+        # and small magics collide across grids
+        if self.base_magic < 10 ** self.magic_digits:
+            raise ValueError(
+                f"Magic {self.base_magic} of {ea}/{symbol}/{timeframe} has too few digits for a grid of {self.size} combinations"
+            )
+
+        # Template: optimization off, junk keys removed, every grid parameter and Magic present.
+        # set_value leaves one line per written key, so render patches the only copy.
+        doc = SetDocument.load(base_set_path)
+        doc.reset_optimization_flags()
+        doc.remove_junk_keys()
+        for name, axis in zip(self.names, self.axes):
+            doc.set_value(name, axis[0])
+        doc.set_value("Magic", self.base_magic)
+        self.template = list(doc.params)
+        self.positions = [doc.index_of(n) for n in self.names]
+        self.magic_position = doc.index_of("Magic")
+
+    def _block_magic(self, suffix):
+        """Magic of a suffix: the base prefix, moved one block down when it would exceed int32."""
+        magic = self.block + suffix
+        while magic > MT4_MAX_MAGIC:
+            magic -= 10 ** self.magic_digits
+        return magic
+
+    def _set_magic_block(self, magic_registry=None):
+        """Block start for the current magic_digits and the sorted suffixes whose magic is reserved."""
+        scale = 10 ** self.magic_digits
+        self.block = (self.base_magic // scale) * scale
+        reserved = {self.base_magic}
+        if magic_registry:
+            from magic_registry import registered_magics
+            reserved |= registered_magics(magic_registry, self.block - scale, self.block + scale - 1)
+        skipped = set()
+        for magic in reserved:
+            for suffix in (magic - self.block, magic - self.block + scale):
+                if 0 <= suffix < scale and self._block_magic(suffix) == magic:
+                    skipped.add(suffix)
+        self.skipped_suffixes = sorted(skipped)
+
+    def __len__(self):
+        return self.size
+
+    def values(self, index):
+        """Parameter values of combination index (the first parameter varies slowest)."""
+        values = [None] * len(self.axes)
+        for i in range(len(self.axes) - 1, -1, -1):
+            index, digit = divmod(index, len(self.axes[i]))
+            values[i] = self.axes[i][digit]
+        return values
+
+    def magic(self, index):
+        """
+        Base magic from generate_fixed_magic_number with its last digits replaced by the
+        index-th free suffix, so every combination gets a distinct, stable magic within int32
+        that is neither the base magic nor a registered one.
+        """
+        scale = 10 ** self.magic_digits
+        suffix = index
+        for skipped in self.skipped_suffixes:
+            if skipped > suffix:
+                break
+            suffix += 1
+        magic = self._block_magic(suffix)
+        if magic < scale:
+            raise ValueError(f"No magic with a non-zero prefix for combination {index}")
+        return magic
+
+    def render(self, index):
+        """.set text of combination index."""
+        params = list(self.template)
+        for pos, value in zip(self.positions, self.values(index)):
+            params[pos] = (params[pos][0], value)
+        params[self.magic_position] = (params[self.magic_position][0], str(self.magic(index)))
+        return "".join(f"{k}={v}\n" for k, v in params)
+
+    def indices(self, shard_index=0, shard_count=1, limit=None):
+        """Combination indices of one shard (index % shard_count == shard_index)."""
+        produced = 0
+        for index in range(shard_index, self.size, shard_count):
+            if limit is not None and produced >= limit:
+                return
+            produced += 1
+            yield index
+
+def generate_set_grid(
+    base_set_path,
+    suggestions,
+    ea,
+    symbol,
+    timeframe,
+    out_dir=None,
+    zip_path=None,
+    shard_index=0,
+    shard_count=1,
+    limit=None,
+    name_prefix=None,
+    manifest_path=None,
+    magic_registry=None
+):
+    """
+    Writes one standalone .set per grid combination of this shard, either into out_dir or
+    straight into zip_path, one file at a time. A manifest CSV (index, file, magic, values)
+    is streamed alongside. Variant magics avoid those registered in magic_registry when given.
+    Returns a summary dict.
+    """
+    if bool(out_dir) == bool(zip_path):
+        raise ValueError("Specify exactly one of out_dir or zip_path")
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard_index must be in [0, {shard_count})")
+
+    grid = SetGrid(base_set_path, suggestions, ea, symbol, timeframe, magic_registry=magic_registry)
+    prefix = name_prefix or os.path.splitext(os.path.basename(base_set_path))[0]
+    width = len(str(max(grid.size - 1, 0)))
+    if manifest_path is None:
+        target = out_dir if out_dir else os.path.dirname(os.path.abspath(zip_path))
+        manifest_path = os.path.join(target, f"{prefix}_grid_shard{shard_index}of{shard_count}.csv")
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    archive = zipfile.ZipFile(zip_path, "w", compression=zipfile.ZIP_DEFLATED) if zip_path else None
+    written = 0
+    try:
+        with open(manifest_path, "w", newline="", encoding="utf-8") as mf:
+            writer = csv.writer(mf)
+            writer.writerow(["index", "file_name", "magic"] + grid.names)
+            for index in grid.indices(shard_index, shard_count, limit):
+                magic = grid.magic(index)
+                file_name = f"{prefix}_G{index:0{width}d}_M{magic}.set"
+                text = grid.render(index)
+                if archive is not None:
+                    archive.writestr(file_name, text)
+                else:
+                    with open(os.path.join(out_dir, file_name), "w", encoding="utf-8") as f:
+                        f.write(text)
+                writer.writerow([index, file_name, magic] + grid.values(index))
+                written += 1
+    finally:
+        if archive is not None:
+            archive.close()
+    logger.info(f"Generated {written} of {grid.size} grid .set files (shard {shard_index}/{shard_count}).")
+    return {
+        "combinations": grid.size,
+        "written": written,
+        "shard_index": shard_index,
+        "shard_count": shard_count,
+        "parameters": {n: len(a) for n, a in zip(grid.names, grid.axes)},
+        "manifest_path": manifest_path,
+        "output": zip_path or out_dir,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Expand a base .set and parameter ranges into standalone .set variants (one per combination).")
+    parser.add_argument("--set", required=True, help="Base .set file")
+    parser.add_argument("--suggestions", required=True, help="JSON file: [{\"name\", \"start\", \"step\", \"end\"}, ...] (same as update_parameters)")
+    parser.add_argument("--ea", required=True, help="EA name for the magic number")
+    parser.add_argument("--symbol", required=True, help="Symbol for the magic number")
+    parser.add_argument("--timeframe", required=True, help="Timeframe for the magic number")
+    parser.add_argument("--out-dir", help="Write .set files into this folder")
+    parser.add_argument("--zip", help="Write .set files into this zip archive")
+    parser.add_argument("--shard-index", type=int, default=0, help="This worker's bucket (0-based)")
+    parser.add_argument("--shard-count", type=int, default=1, help="Number of worker buckets")
+    parser.add_argument("--limit", type=int, help="Maximum files to write")
+    parser.add_argument("--prefix", help="File name prefix (default: base .set name)")
+    parser.add_argument("--magic-registry", help="Magic registry database; its magics are not given to variants")
+    parser.add_argument("--count-only", action="store_true", help="Only report the number of combinations")
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        with open(args.suggestions, encoding="utf-8") as f:
+            suggestions = json.load(f)
+        if args.count_only:
+            grid = SetGrid(args.set, suggestions, args.ea, args.symbol, args.timeframe, magic_registry=args.magic_registry)
+            output["combinations"] = grid.size
+            output["parameters"] = {n: len(a) for n, a in zip(grid.names, grid.axes)}
+        else:
+            output.update(generate_set_grid(
+                args.set, suggestions, args.ea, args.symbol, args.timeframe,
+                out_dir=args.out_dir, zip_path=args.zip, shard_index=args.shard_index,
+                shard_count=args.shard_count, limit=args.limit, name_prefix=args.prefix,
+                magic_registry=args.magic_registry
+            ))
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    main()
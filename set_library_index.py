@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import logging
+
+from extract_setfilename_fields import load_symbol_list, extract_fields
+from set_file_parser import parse_set_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SYMBOL_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), "SymbolList.csv")
+COMMIT_EVERY = 500
+
+# "GridStep<25", "Lot_Size>=0.02", "Comment_EA=PX"
+CONDITION_RE = re.compile(r"^\s*([A-Za-z0-9_]+)\s*(<=|>=|!=|=|<|>)\s*(.+?)\s*$")
+
+def ensure_set_library_tables(conn):
+    """Creates set_library_files (one row per .set) and set_library_params (one row per parameter)."""
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS set_library_files (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        file_path TEXT NOT NULL UNIQUE,
+        file_name TEXT NOT NULL,
+        folder TEXT,
+        mtime_ns INTEGER NOT NULL,
+        size INTEGER NOT NULL,
+        ea TEXT COLLATE NOCASE,
+        symbol TEXT COLLATE NOCASE,
+        timeframe TEXT COLLATE NOCASE,
+        magic INTEGER,
+        filename_fields_json TEXT,
+        indexed_at REAL
+    )
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS set_library_params (
+        file_id INTEGER NOT NULL,
+        param TEXT NOT NULL,
+        value TEXT,
+        value_num REAL,
+        start REAL,
+        step REAL,
+        end REAL,
+        optimized INTEGER,
+        section TEXT,
+        PRIMARY KEY (file_id, param)
+    ) WITHOUT ROWID
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_set_library_params_param_value ON set_library_params (param, value_num)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_set_library_files_symbol_tf ON set_library_files (symbol, timeframe)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_set_library_files_ea ON set_library_files (ea)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_set_library_files_magic ON set_library_files (magic)")
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def walk_set_files(roots):
+    """Yields the absolute path of every .set file under roots."""
+    for root in roots:
+        for dirpath, _, filenames in os.walk(root):
+            for name in filenames:
+                if name.lower().endswith(".set"):
+                    yield os.path.abspath(os.path.join(dirpath, name))
+
+def _index_one(cur, file_path, st, symbol_list, existing_id):
+    parsed = parse_set_path(file_path, use_cache=False)
+    fields = extract_fields(file_path, symbol_list)
+    magic = _to_float(parsed.first_value("Magic"))
+    row = (
+        file_path, os.path.basename(file_path), os.path.dirname(file_path), st.st_mtime_ns, st.st_size,
+        fields.get("EA") or None, fields.get("Symbol") or None, fields.get("Timeframe") or None,
+        int(magic) if magic is not None else None, json.dumps(fields), time.time()
+    )
+    if existing_id is None:
+        cur.execute("""
+            INSERT INTO set_library_files (
+                file_path, file_name, folder, mtime_ns, size, ea, symbol, timeframe, magic, filename_fields_json, indexed_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, row)
+        file_id = cur.lastrowid
+    else:
+        file_id = existing_id
+        cur.execute("""
+            UPDATE set_library_files SET
+                file_path = ?, file_name = ?, folder = ?, mtime_ns = ?, size = ?, ea = ?, symbol = ?, timeframe = ?,
+                magic = ?, filename_fields_json = ?, indexed_at = ?
+            WHERE id = ?
+        """, row + (file_id,))
+        cur.execute("DELETE FROM set_library_params WHERE file_id = ?", (file_id,))
+    cur.executemany("""
+        INSERT OR REPLACE INTO set_library_params (file_id, param, value, value_num, start, step, end, optimized, section)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, [
+        (file_id, p.name, p.value, _to_float(p.value), _to_float(p.start), _to_float(p.step), _to_float(p.end),
+         1 if p.optimized else 0, p.section)
+        for p in parsed.parameters.values()
+    ])
+
+def index_set_library(db_path, roots, symbol_csv=DEFAULT_SYMBOL_CSV, prune=True, full=False):
+    """
+    Indexes every .set file under roots into set_library_files/set_library_params.
+    Only new files and files whose (mtime, size) changed are re-parsed, unless full=True.
+    prune: drop index rows of files under roots that no longer exist.
+    Returns counters: scanned, indexed, unchanged, removed, failed.
+    """
+    symbol_list = load_symbol_list(symbol_csv)
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    counters = {"scanned": 0, "indexed": 0, "unchanged": 0, "removed": 0, "failed": 0}
+    try:
+        ensure_set_library_tables(conn)
+        cur = conn.cursor()
+        abs_roots = [os.path.abspath(r) for r in roots]
+        known = {}
+        for root in abs_roots:
+            prefix = os.path.join(root, "")
+            for file_id, path, mtime_ns, size in cur.execute(
+                "SELECT id, file_path, mtime_ns, size FROM set_library_files WHERE substr(file_path, 1, ?) = ?",
+                (len(prefix), prefix)
+            ):
+                known[path] = (file_id, mtime_ns, size)
+        seen = set()
+        pending = 0
+        for file_path in walk_set_files(abs_roots):
+            counters["scanned"] += 1
+            seen.add(file_path)
+            try:
+                st = os.stat(file_path)
+                entry = known.get(file_path)
+                if not full and entry and entry[1] == st.st_mtime_ns and entry[2] == st.st_size:
+                    counters["unchanged"] += 1
+                    continue
+                _index_one(cur, file_path, st, symbol_list, entry[0] if entry else None)
+                counters["indexed"] += 1
+                pending += 1
+            except Exception as e:
+                counters["failed"] += 1
+                logger.error(f"Failed to index {file_path}: {e}")
+            if pending >= COMMIT_EVERY:
+                conn.commit()
+                pending = 0
+        if prune:
+            gone = [(v[0],) for k, v in known.items() if k not in seen]
+            cur.executemany("DELETE FROM set_library_params WHERE file_id = ?", gone)
+            cur.executemany("DELETE FROM set_library_files WHERE id = ?", gone)
+            counters["removed"] = len(gone)
+        conn.commit()
+    finally:
+        conn.close()
+    logger.info(f"Set library index updated: {counters}")
+    return counters
+
+def parse_condition(text):
+    """Parses "Param<op>value" into (param, op, value); numeric values compare numerically."""
+    m = CONDITION_RE.match(text)
+    if not m:
+        raise ValueError(f"Invalid condition: {text!r} (expected e.g. GridStep<25)")
+    param, op, value = m.groups()
+    return param, op, value
+
+def query_set_library(db_path, conditions=None, ea=None, symbol=None, timeframe=None, magic=None,
+                      folder=None, show_params=None, limit=None):
+    """
+    Finds indexed .set files matching every condition ("GridStep<25", ...) and the filename filters.
+    show_params: parameter names whose values are returned with each file (default: the condition params).
+    Returns a list of dicts (file_path, ea, symbol, timeframe, magic, params).
+    """
+    where = []
+    args = []
+    for i, text in enumerate(conditions or []):
+        param, op, value = parse_condition(text)
+        num = _to_float(value)
+        column = "value_num" if num is not None else "value"
+        where.append(
+            f"EXISTS (SELECT 1 FROM set_library_params p{i} "
+            f"WHERE p{i}.file_id = f.id AND p{i}.param = ? AND p{i}.{column} {'<>' if op == '!=' else op} ?)"
+        )
+        args.extend([param, num if num is not None else value])
+    for column, value in [("ea", ea), ("symbol", symbol), ("timeframe", timeframe), ("magic", magic)]:
+        if value is not None:
+            where.append(f"f.{column} = ?")
+            args.append(value)
+    if folder:
+        prefix = os.path.join(os.path.abspath(folder), "")
+        where.append("substr(f.file_path, 1, ?) = ?")
+        args.extend([len(prefix), prefix])
+    sql = "SELECT f.id, f.file_path, f.ea, f.symbol, f.timeframe, f.magic FROM set_library_files AS f"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += " ORDER BY f.file_path"
+    if limit:
+        sql += f" LIMIT {int(limit)}"
+
+    if show_params is None:
+        show_params = [parse_condition(c)[0] for c in (conditions or [])]
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        ensure_set_library_tables(conn)
+        rows = conn.execute(sql, args).fetchall()
+        results = []
+        for file_id, file_path, row_ea, row_symbol, row_tf, row_magic in rows:
+            params = {}
+            if show_params:
+                placeholders = ",".join(["?"] * len(show_params))
+                for name, value in conn.execute(
+                    f"SELECT param, value FROM set_library_params WHERE file_id = ? AND param IN ({placeholders})",
+                    [file_id] + list(show_params)
+                ):
+                    params[name] = value
+            results.append({
+                "file_path": file_path,
+                "ea": row_ea,
+                "symbol": row_symbol,
+                "timeframe": row_tf,
+                "magic": row_magic,
+                "params": params,
+            })
+    finally:
+        conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Index .set files (filename fields + parameters) into SQLite and query them.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_index = sub.add_parser("index", help="Incrementally (re)index .set files under one or more folders")
+    p_index.add_argument("--db-path", required=True, help="SQLite database holding the index")
+    p_index.add_argument("roots", nargs="+", help="Folders to scan (e.g. 01_user_inputs 02_backtest)")
+    p_index.add_argument("--symbols", default=DEFAULT_SYMBOL_CSV, help="SymbolList.csv (default: %(default)s)")
+    p_index.add_argument("--full", action="store_true", help="Re-parse every file, not only changed ones")
+    p_index.add_argument("--no-prune", action="store_true", help="Keep rows of files that no longer exist")
+
+    p_query = sub.add_parser("query", help="Find .set files by parameter values and filename fields")
+    p_query.add_argument("--db-path", required=True, help="SQLite database holding the index")
+    p_query.add_argument("--where", action="append", default=[], help="Parameter condition, e.g. \"GridStep<25\" (repeatable)")
+    p_query.add_argument("--ea", help="EA from the filename, e.g. PX3.71")
+    p_query.add_argument("--symbol", help="Symbol from the filename, e.g. GBPAUD")
+    p_query.add_argument("--timeframe", help="Timeframe from the filename, e.g. H1")
+    p_query.add_argument("--magic", type=int, help="Magic parameter value")
+    p_query.add_argument("--folder", help="Only files under this folder")
+    p_query.add_argument("--show", help="Comma-separated parameters to return for each file")
+    p_query.add_argument("--limit", type=int, help="Maximum number of files")
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        started = time.perf_counter()
+        if args.command == "index":
+            output.update(index_set_library(
+                args.db_path, args.roots, symbol_csv=args.symbols, prune=not args.no_prune, full=args.full
+            ))
+        else:
+            show = [s.strip() for s in args.show.split(",") if s.strip()] if args.show else None
+            data = query_set_library(
+                args.db_path, args.where, ea=args.ea, symbol=args.symbol, timeframe=args.timeframe,
+                magic=args.magic, folder=args.folder, show_params=show, limit=args.limit
+            )
+            output["count"] = len(data)
+            output["data"] = data
+        output["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import difflib
+import hashlib
+import json
+import threading
+import zlib
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# A new base is written once a delta chain gets this deep, so reconstruction stays bounded
+MAX_CHAIN_DEPTH = 32
+# ... or when the delta is not clearly smaller than a compressed full copy
+MAX_DELTA_RATIO = 0.6
+VERSION_CACHE_SIZE = 256
+
+# .set artifact types stored in the lineage store, with the artifact type of their parent
+SET_ARTIFACT_PARENTS = {"input_set": None, "output_set": "input_set", "ai_set": "output_set"}
+
+_version_cache = OrderedDict()
+_version_cache_lock = threading.Lock()
+
+def ensure_set_lineage_tables(conn):
+    """Creates set_versions: one row per distinct .set content, stored as a base or a line delta."""
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS set_versions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sha256 TEXT NOT NULL UNIQUE,
+        parent_id INTEGER,
+        depth INTEGER NOT NULL DEFAULT 0,
+        kind TEXT NOT NULL,
+        data BLOB NOT NULL,
+        size INTEGER NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_set_versions_parent ON set_versions (parent_id)")
+
+def _cache_get(sha):
+    with _version_cache_lock:
+        data = _version_cache.get(sha)
+        if data is not None:
+            _version_cache.move_to_end(sha)
+        return data
+
+def _cache_put(sha, data):
+    with _version_cache_lock:
+        _version_cache[sha] = data
+        _version_cache.move_to_end(sha)
+        while len(_version_cache) > VERSION_CACHE_SIZE:
+            _version_cache.popitem(last=False)
+
+def clear_version_cache():
+    with _version_cache_lock:
+        _version_cache.clear()
+
+def make_delta(parent, child):
+    """Line delta turning parent bytes into child bytes: [[i1, i2, [replacement lines]], ...]."""
+    a = parent.splitlines(keepends=True)
+    b = child.splitlines(keepends=True)
+    ops = []
+    for tag, i1, i2, j1, j2 in difflib.SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if tag != "equal":
+            # latin-1 maps every byte to one code point, so any encoding survives JSON
+            ops.append([i1, i2, [line.decode("latin-1") for line in b[j1:j2]]])
+    return ops
+
+def apply_delta(parent, ops):
+    a = parent.splitlines(keepends=True)
+    out = []
+    pos = 0
+    for i1, i2, lines in ops:
+        out.extend(a[pos:i1])
+        out.extend(line.encode("latin-1") for line in lines)
+        pos = i2
+    out.extend(a[pos:])
+    return b"".join(out)
+
+def _encode_delta(ops):
+    return zlib.compress(json.dumps(ops, separators=(",", ":")).encode("utf-8"), 9)
+
+def _decode_delta(blob):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+def load_set_version(conn, version_id):
+    """Returns the full bytes of a stored version (walks back to the base, then applies deltas)."""
+    chain = []
+    current = version_id
+    data = None
+    while current is not None:
+        row = conn.execute(
+            "SELECT sha256, parent_id, kind, data FROM set_versions WHERE id = ?", (current,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"set_versions id {current} not found")
+        sha, parent_id, kind, blob = row
+        cached = _cache_get(sha)
+        if cached is not None:
+            data = cached
+            break
+        if kind == "base":
+            data = zlib.decompress(blob)
+            _cache_put(sha, data)
+            break
+        chain.append((sha, blob))
+        current = parent_id
+    if data is None:
+        raise ValueError(f"set_versions id {version_id} has no base version")
+    for sha, blob in reversed(chain):
+        data = apply_delta(data, _decode_delta(blob))
+        _cache_put(sha, data)
+    return data
+
+def store_set_version(conn, data, parent_version_id=None):
+    """
+    Stores .set bytes and returns their set_versions id.
+    Identical content is stored once. With a parent, only the line delta is kept
+    unless the chain is too deep or the delta is not worth it.
+    Does not commit.
+    """
+    sha = hashlib.sha256(data).hexdigest()
+    row = conn.execute("SELECT id FROM set_versions WHERE sha256 = ?", (sha,)).fetchone()
+    if row:
+        _cache_put(sha, data)
+        return row[0]
+
+    kind, blob, depth, parent_id = "base", zlib.compress(data, 9), 0, None
+    if parent_version_id is not None:
+        parent_row = conn.execute("SELECT depth FROM set_versions WHERE id = ?", (parent_version_id,)).fetchone()
+        if parent_row and parent_row[0] + 1 < MAX_CHAIN_DEPTH:
+            delta_blob = _encode_delta(make_delta(load_set_version(conn, parent_version_id), data))
+            if len(delta_blob) < len(blob) * MAX_DELTA_RATIO:
+                kind, blob, depth, parent_id = "delta", delta_blob, parent_row[0] + 1, parent_version_id
+    cur = conn.execute(
+        "INSERT INTO set_versions (sha256, parent_id, depth, kind, data, size) VALUES (?, ?, ?, ?, ?, ?)",
+        (sha, parent_id, depth, kind, blob, len(data))
+    )
+    _cache_put(sha, data)
+    logger.info(f"Stored set version {cur.lastrowid} ({kind}, {len(blob)} of {len(data)} bytes)")
+    return cur.lastrowid
+
+def find_artifact_set_version(conn, step_id, artifact_type, link_type=None, link_id=None):
+    """set_version_id recorded in meta_json of the latest matching set_file_artifacts row, or None."""
+    sql = "SELECT meta_json FROM set_file_artifacts WHERE step_id = ? AND artifact_type = ?"
+    args = [step_id, artifact_type]
+    if link_id is not None:
+        sql += " AND link_type = ? AND link_id = ?"
+        args.extend([link_type, link_id])
+    row = conn.execute(sql + " ORDER BY id DESC LIMIT 1", args).fetchone()
+    if not row or not row[0]:
+        return None
+    try:
+        return json.loads(row[0]).get("set_version_id")
+    except (ValueError, AttributeError):
+        return None
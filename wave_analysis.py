@@ -2,6 +2,7 @@ import pandas as pd
 import numpy as np
 import argparse
 import logging
+import re
 
 logging.getLogger().handlers = []  # Remove all handlers
 logging.disable(logging.CRITICAL)  # Disable all logging
@@ -9,14 +10,26 @@ logger = logging.getLogger(__name__)
 
 from datetime import datetime
 
+from bar_store import load_bars, time_slice, frame_view, is_sorted_by_time
+
+# Columns of a headerless MT4 history export (File > Save in the History Center): 2025.05.23,04:30,o,h,l,c,v
+MT4_HISTORY_COLUMNS = ['date', 'time', 'open', 'high', 'low', 'close', 'volume']
+
 def read_mt4_csv(csv_path):
     with open(csv_path, 'r', encoding='utf-8') as f:
         sample = f.read(2048)
         delimiter = '\t' if '\t' in sample else ','
-    df = pd.read_csv(csv_path, delimiter=delimiter)
+    # A first line starting with a date is data, not a header
+    headerless = bool(re.match(r'\s*\d{4}[.\-/]\d{1,2}[.\-/]\d{1,2}', sample))
+    if headerless:
+        df = pd.read_csv(csv_path, delimiter=delimiter, header=None, names=MT4_HISTORY_COLUMNS)
+    else:
+        df = pd.read_csv(csv_path, delimiter=delimiter)
     df.columns = [c.strip().replace(' ', '_').lower() for c in df.columns]
     if 'date' in df.columns and 'time' in df.columns:
-        df['datetime'] = pd.to_datetime(df['date'] + ' ' + df['time'], format='%Y.%m.%d %H:%M:%S')
+        stamps = df['date'].astype(str) + ' ' + df['time'].astype(str)
+        time_format = '%Y.%m.%d %H:%M:%S' if len(df) and str(df['time'].iloc[0]).count(':') == 2 else '%Y.%m.%d %H:%M'
+        df['datetime'] = pd.to_datetime(stamps, format=time_format)
     elif 'datetime' in df.columns:
         df['datetime'] = pd.to_datetime(df['datetime'])
     else:
@@ -42,16 +55,22 @@ def read_mt4_csv(csv_path):
         (df['open'] != 0.0) &
         (df['high'] != 0.0) &
         (df['low'] != 0.0) &
-        df['close'].map(np.isfinite) &
-        df['open'].map(np.isfinite) &
-        df['high'].map(np.isfinite) &
-        df['low'].map(np.isfinite)
+        np.isfinite(df['close'].to_numpy()) &
+        np.isfinite(df['open'].to_numpy()) &
+        np.isfinite(df['high'].to_numpy()) &
+        np.isfinite(df['low'].to_numpy())
     ].reset_index(drop=True)
     return df
 
 def filter_bars_by_date_range(bars, start_date, end_date):
-    filtered = bars[(bars['datetime'] >= start_date) & (bars['datetime'] <= end_date)].reset_index(drop=True)
-    return filtered
+    """
+    Bars with start_date <= datetime <= end_date. Bars in time order (always the case for
+    load_bars) are sliced by binary search into a view; for many windows use bar_store.BarSeries.
+    """
+    if not is_sorted_by_time(bars):
+        return bars[(bars['datetime'] >= start_date) & (bars['datetime'] <= end_date)].reset_index(drop=True)
+    i, j = time_slice(bars['datetime'].to_numpy(), start_date, end_date)
+    return frame_view(bars, i, j)
 
 def print_analysed_period(bars):
     if len(bars) == 0:
@@ -61,12 +80,13 @@ def print_analysed_period(bars):
     end = bars['datetime'].iloc[-1]
     logger.info(f"\nAnalysed from {start.strftime('%Y.%m.%d %H:%M')} to {end.strftime('%Y.%m.%d %H:%M')}\n")
 
-def zigzag_mt4_pivots(bars, depth, deviation, backstep):
+def zigzag_mt4_pivots_reference(bars, depth, deviation, backstep, pip_size=0.0001):
+    """Bar-by-bar port of the MT4 ZigZag indicator; the reference zigzag_mt4_pivots is checked against."""
     lows = bars['low'].values
     highs = bars['high'].values
     times = bars['datetime'].values
     N = len(lows)
-    Point = 0.0001
+    Point = pip_size
 
     ExtZigzagBuffer = np.zeros(N)
     ExtHighBuffer = np.zeros(N)
@@ -171,98 +191,288 @@ def zigzag_mt4_pivots(bars, depth, deviation, backstep):
     pivots = pivots[::-1]
     return pivots
 
-def calculate_waves_from_pivots(filtered_pivots):
-    waves = []
-    for i in range(1, len(filtered_pivots)):
-        dt1, price1, type1 = filtered_pivots[i - 1]
-        dt2, price2, type2 = filtered_pivots[i]
-        bars = (pd.to_datetime(dt2) - pd.to_datetime(dt1)).total_seconds() / (30 * 60)
-        pips = abs(price2 - price1) * 10000
-        wave_type = type2
-        if pips > 0 and bars > 0:
-            waves.append({'bars': bars, 'pips': pips, 'type': wave_type, 'start': pd.to_datetime(dt1), 'end': pd.to_datetime(dt2)})
-    return waves
+def _rolling_extremum(values, window, count, ufunc):
+    """
+    ufunc (np.minimum/np.maximum) over values[i:i+window] for i in range(count); all windows are complete.
+    van Herk/Gil-Werman: per-block prefix and suffix scans, O(n) whatever the window.
+    """
+    n = count + window - 1
+    blocks = -(-n // window)
+    fill = np.inf if ufunc is np.minimum else -np.inf
+    padded = np.full(blocks * window, fill)
+    padded[:n] = values[:n]
+    padded = padded.reshape(blocks, window)
+    prefix = ufunc.accumulate(padded, axis=1).ravel()
+    suffix = ufunc.accumulate(padded[:, ::-1], axis=1)[:, ::-1].ravel()
+    return ufunc(suffix[:count], prefix[window - 1:window - 1 + count])
+
+def zigzag_extremum_buffers(lows, highs, depth, deviation, backstep, low_windows=None, high_windows=None, pip_size=0.0001):
+    """
+    ExtLowBuffer/ExtHighBuffer of the MT4 ZigZag (pass 1), without the per-bar loop.
+    The indicator walks i from limit-1 down to 0, and its state reduces to array expressions:
+    - lastlow is always the window minimum of the bar visited before (i+1), so "new extremum"
+      is low_windows[i] != low_windows[i+1].
+    - Backstep clearing only ever zeroes buffer values. Whether bar p survives depends only on
+      some bar i in [p-backstep, p-1] having a new in-deviation extremum beyond lows[p].
+      That is a rolling minimum (maximum for highs) over the event values.
+    low_windows/high_windows: optional precomputed rolling extrema for this depth.
+    pip_size: price of one deviation unit (0.0001 for most FX pairs, 0.01 for JPY quotes).
+    """
+    N = len(lows)
+    limit = N - depth
+    ExtLowBuffer = np.zeros(N)
+    ExtHighBuffer = np.zeros(N)
+    if limit <= 0:
+        return ExtLowBuffer, ExtHighBuffer, limit
+    Point = pip_size
+    dev = deviation * Point
+    backstep = max(int(backstep), 0)
+
+    for values, windows, buffer, is_low in (
+        (lows, low_windows, ExtLowBuffer, True),
+        (highs, high_windows, ExtHighBuffer, False),
+    ):
+        if windows is None:
+            windows = _rolling_extremum(values, depth, limit, np.minimum if is_low else np.maximum)
+        else:
+            windows = windows[:limit]
+        v = values[:limit]
+        previous = np.empty(limit)
+        previous[:-1] = windows[1:]
+        previous[-1] = 0.0  # lastlow/lasthigh start at 0
+        changed = windows != previous
+        if is_low:
+            within = ~(v - windows > dev)
+        else:
+            within = ~(windows - v > dev)
+        event = changed & within
+        candidate = event & (v == windows)
+        if backstep > 0 and candidate.any():
+            # Extremum of the events at bars p-backstep .. p-1 (inf/-inf where there is none)
+            fill = np.inf if is_low else -np.inf
+            event_values = np.where(event, windows, fill)
+            padded = np.concatenate([np.full(backstep, fill), event_values[:-1]]) if limit > 1 else np.full(backstep, fill)
+            if is_low:
+                prior = _rolling_extremum(padded, backstep, limit, np.minimum)
+                candidate &= ~(v > prior)
+            else:
+                prior = _rolling_extremum(padded, backstep, limit, np.maximum)
+                candidate &= ~(v < prior)
+        buffer[:limit][candidate] = v[candidate]
+    return ExtLowBuffer, ExtHighBuffer, limit
 
-def filter_waves(waves, percentage=50.0, force_factor=3, deviation=5):
+def zigzag_pivots_from_buffers(ExtLowBuffer, ExtHighBuffer, lows, highs, times, limit):
+    """Pass 2 of the MT4 ZigZag: the alternating high/low state machine, over the non-zero bars only."""
+    pivots = []
+    whatlookfor = 0
+    lastlow = 0.0
+    lasthigh = 0.0
+    if limit <= 0:
+        return pivots
+    candidates = np.flatnonzero((ExtLowBuffer[:limit] != 0.0) | (ExtHighBuffer[:limit] != 0.0))
+    for i in candidates[::-1].tolist():
+        low_i = ExtLowBuffer[i]
+        high_i = ExtHighBuffer[i]
+        if whatlookfor == 0:
+            if lastlow == 0.0 and lasthigh == 0.0:
+                if high_i != 0.0:
+                    lasthigh = highs[i]
+                    whatlookfor = -1
+                    pivots.append((times[i], lasthigh, 'High'))
+                if low_i != 0.0:
+                    lastlow = lows[i]
+                    whatlookfor = 1
+                    pivots.append((times[i], lastlow, 'Low'))
+        elif whatlookfor == 1:  # look for peak
+            if low_i != 0.0 and low_i < lastlow and high_i == 0.0:
+                lastlow = low_i
+                pivots[-1] = (times[i], lastlow, 'Low')
+            if high_i != 0.0 and low_i == 0.0:
+                lasthigh = high_i
+                whatlookfor = -1
+                pivots.append((times[i], lasthigh, 'High'))
+        elif whatlookfor == -1:  # look for lawn
+            if high_i != 0.0 and high_i > lasthigh and low_i == 0.0:
+                lasthigh = high_i
+                pivots[-1] = (times[i], lasthigh, 'High')
+            if low_i != 0.0 and high_i == 0.0:
+                lastlow = low_i
+                whatlookfor = 1
+                pivots.append((times[i], lastlow, 'Low'))
+    return pivots[::-1]
+
+def zigzag_mt4_pivots(bars, depth, deviation, backstep, pip_size=0.0001):
+    """
+    MT4 ZigZag pivots [(datetime64, price, 'High'/'Low')], oldest first.
+    Same output as zigzag_mt4_pivots_reference, with pass 1 vectorized.
+    """
+    lows = bars['low'].to_numpy(dtype=np.float64)
+    highs = bars['high'].to_numpy(dtype=np.float64)
+    times = bars['datetime'].values
+    ExtLowBuffer, ExtHighBuffer, limit = zigzag_extremum_buffers(lows, highs, depth, deviation, backstep, pip_size=pip_size)
+    return zigzag_pivots_from_buffers(ExtLowBuffer, ExtHighBuffer, lows, highs, times, limit)
+
+def pivot_arrays(pivots):
+    """(times datetime64[ns], prices, types) arrays of [(datetime, price, 'High'/'Low')] pivots."""
+    times = np.array([p[0] for p in pivots], dtype="datetime64[ns]")
+    prices = np.array([p[1] for p in pivots], dtype=np.float64)
+    types = np.array([p[2] for p in pivots], dtype="<U4")
+    return times, prices, types
+
+def infer_bar_minutes(times):
+    """Bar length of a sorted datetime series: the median gap between bars, in minutes (30 when unknown)."""
+    times = np.asarray(times, dtype="datetime64[ns]")
+    if len(times) < 2:
+        return 30
+    gaps = np.diff(times).astype(np.int64)
+    gaps = gaps[gaps > 0]
+    if not len(gaps):
+        return 30
+    return float(np.median(gaps)) / 60e9
+
+def wave_columns(times, prices, types, pip_size=0.0001, bar_minutes=None, pivot_bars=None):
+    """
+    Waves between consecutive pivots as columns: start, end (datetime64[ns]), bars, pips, type
+    (type of the ending pivot) and pivot (index of the ending pivot). bars is the time span in bar_minutes bars, or the bar index
+    difference when pivot_bars (the pivots' bar positions) is given. Zero-length waves are dropped.
+    bar_minutes is the bar length of the data the pivots come from (infer_bar_minutes of its datetimes);
+    it is required unless pivot_bars is given, since the pivots alone do not tell it.
+    """
+    if pivot_bars is None and not bar_minutes:
+        raise ValueError("wave_columns needs bar_minutes (or pivot_bars) to count wave bars")
+    times = np.asarray(times, dtype="datetime64[ns]")
+    prices = np.asarray(prices, dtype=np.float64)
+    types = np.asarray(types)
+    if len(times) < 2:
+        empty = np.empty(0)
+        return {"start": times[:0], "end": times[:0], "bars": empty, "pips": empty, "type": types[:0],
+                "pivot": np.empty(0, dtype=np.int64)}
+    if pivot_bars is not None:
+        bars = np.diff(np.asarray(pivot_bars, dtype=np.int64)).astype(np.float64)
+    else:
+        bars = np.diff(times).astype(np.int64) / 1e9 / (bar_minutes * 60)
+    pips = np.abs(prices[1:] - prices[:-1]) * (1 / pip_size)
+    keep = (pips > 0) & (bars > 0)
+    return {
+        "start": times[:-1][keep], "end": times[1:][keep],
+        "bars": bars[keep], "pips": pips[keep], "type": types[1:][keep], "pivot": np.flatnonzero(keep) + 1,
+    }
+
+def wave_records(columns):
+    """Waves as the list of dicts calculate_waves_from_pivots returns."""
+    starts = pd.DatetimeIndex(columns["start"])
+    ends = pd.DatetimeIndex(columns["end"])
+    return [
+        {'bars': bars, 'pips': pips, 'type': wave_type, 'start': start, 'end': end}
+        for bars, pips, wave_type, start, end in zip(
+            columns["bars"].tolist(), columns["pips"], columns["type"].tolist(), starts, ends
+        )
+    ]
+
+def calculate_waves_from_pivots(filtered_pivots, pip_size=0.0001, *, bar_minutes):
+    """
+    Waves between the pivots as dicts. bar_minutes (required) is the bar length of the data the
+    pivots come from, e.g. infer_bar_minutes(bars['datetime'].values); the pivots alone do not tell it.
+    """
+    times, prices, types = pivot_arrays(filtered_pivots)
+    return wave_records(wave_columns(times, prices, types, pip_size=pip_size, bar_minutes=bar_minutes))
+
+def filter_wave_indices(types, pips, percentage=50.0, force_factor=3, deviation=5):
+    """
+    Indices of the waves filter_waves keeps. A same-direction wave survives only when it is big
+    enough (percentage of the last kept wave, force_factor x deviation); otherwise it replaces the
+    last kept wave. Each decision depends on the previous one, so this stays a loop, over plain lists.
+    """
+    n = len(pips)
     if percentage == 0.0 and force_factor == 0:
-        return waves
+        return np.arange(n)
+    types = types.tolist() if hasattr(types, "tolist") else list(types)
+    pips = pips.tolist() if hasattr(pips, "tolist") else list(pips)
+    ratio = percentage / 100.0
+    force = force_factor * deviation
     filtered = []
     prev_type = None
     prev_pips = None
-    for wave in waves:
-        this_type = wave['type']
-        pips = wave['pips']
+    for k in range(n):
+        this_type = types[k]
+        wave_pips = pips[k]
         if prev_type == this_type:
-            percentage_ok = (prev_pips is None or pips >= prev_pips * (percentage / 100.0))
-            force_ok = pips >= (force_factor * deviation)
-            if percentage_ok and force_ok:
-                filtered.append(wave)
-                prev_type = this_type
-                prev_pips = pips
-            else:
-                if filtered:
-                    filtered[-1] = wave
+            if (prev_pips is None or wave_pips >= prev_pips * ratio) and wave_pips >= force:
+                filtered.append(k)
+                prev_pips = wave_pips
+            elif filtered:
+                filtered[-1] = k
         else:
-            filtered.append(wave)
+            filtered.append(k)
             prev_type = this_type
-            prev_pips = pips
-    return filtered
+            prev_pips = wave_pips
+    return np.array(filtered, dtype=np.int64)
+
+def filter_waves(waves, percentage=50.0, force_factor=3, deviation=5):
+    if percentage == 0.0 and force_factor == 0:
+        return waves
+    keep = filter_wave_indices(
+        [w['type'] for w in waves], [w['pips'] for w in waves], percentage, force_factor, deviation
+    )
+    return [waves[k] for k in keep.tolist()]
 
 def mt4_percentiles(pips_arr, percentiles):
     arr_sorted = np.sort(pips_arr)
-    edges = []
-    for percent in percentiles:
-        idx = int(len(arr_sorted) * percent / 100.0)
-        if idx >= len(arr_sorted): idx = len(arr_sorted) - 1
-        edges.append(arr_sorted[idx])
-    edges.append(arr_sorted[-1])
-    return edges
+    idx = (len(arr_sorted) * np.asarray(percentiles, dtype=np.float64) / 100.0).astype(np.int64)
+    idx = np.minimum(idx, len(arr_sorted) - 1)
+    return list(arr_sorted[idx]) + [arr_sorted[-1]]
 
-def wave_band_stats_mt4(waves, percentiles):
-    pips_arr = np.array([w['pips'] for w in waves])
-    edges = mt4_percentiles(pips_arr, percentiles)
-    min_pips = int(pips_arr.min())
-    bands = [
-        (min_pips, int(edges[0])),
-        (int(edges[0]), int(edges[1])),
-        (int(edges[1]), int(edges[2]))
-    ]
+def wave_band_stats_columns(bars, pips, percentiles):
+    """
+    Normal/Medium/Rare band stats from wave columns. Band edges are the integer parts of the
+    MT4 percentiles: [min, e0), [e0, e1), [e1, e2]. Membership is one searchsorted over the
+    edges, totals and counts are bincounts; waves above int(e2) fall in no band, as in MT4.
+    """
+    bars = np.asarray(bars, dtype=np.float64)
+    pips = np.asarray(pips, dtype=np.float64)
+    edges = mt4_percentiles(pips, percentiles)
+    min_pips = int(pips.min())
+    bounds = [min_pips, int(edges[0]), int(edges[1]), int(edges[2])]
+    band = np.searchsorted(np.array(bounds[1:3]), pips, side='right')
+    band[(pips < bounds[0]) | (pips > bounds[3])] = 3
+    counts = np.bincount(band, minlength=4)
+    total_bars = np.bincount(band, weights=bars, minlength=4)
+    total_pips = np.bincount(band, weights=pips, minlength=4)
+    # Stable grouping keeps wave order inside a band (first longest/shortest wins, as before)
+    order = np.argsort(band, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(counts)])
     results = []
-    for idx, (low, high) in enumerate(bands):
-        if idx < 2:
-            mask = (pips_arr >= low) & (pips_arr < high)
-        else:
-            mask = (pips_arr >= low) & (pips_arr <= high)
-        ws = [w for w, m in zip(waves, mask) if m]
-        if not ws:
-            stats = {
+    for idx in range(3):
+        low, high = bounds[idx], bounds[idx + 1]
+        if not counts[idx]:
+            results.append({
                 'count': 0, 'total_bars': 0, 'total_pips': 0, 'avg_bars': 0, 'avg_pips': 0,
                 'longest_bars': 0, 'longest_pips': 0, 'shortest_bars': 0, 'shortest_pips': 0,
                 'min_pips': low, 'max_pips': high
-            }
-        else:
-            total_bars = sum(w['bars'] for w in ws)
-            total_pips = sum(w['pips'] for w in ws)
-            avg_bars = np.mean([w['bars'] for w in ws])
-            avg_pips = np.mean([w['pips'] for w in ws])
-            longest = max(ws, key=lambda w: w['bars'])
-            shortest = min(ws, key=lambda w: w['bars'])
-            stats = {
-                'count': len(ws),
-                'total_bars': total_bars,
-                'total_pips': total_pips,
-                'avg_bars': avg_bars,
-                'avg_pips': avg_pips,
-                'longest_bars': longest['bars'],
-                'longest_pips': longest['pips'],
-                'shortest_bars': shortest['bars'],
-                'shortest_pips': shortest['pips'],
-                'min_pips': low,
-                'max_pips': high
-            }
-        results.append(stats)
+            })
+            continue
+        members = order[offsets[idx]:offsets[idx + 1]]
+        band_bars = bars[members]
+        longest = members[np.argmax(band_bars)]
+        shortest = members[np.argmin(band_bars)]
+        results.append({
+            'count': int(counts[idx]),
+            'total_bars': total_bars[idx],
+            'total_pips': total_pips[idx],
+            'avg_bars': np.mean(band_bars),
+            'avg_pips': np.mean(pips[members]),
+            'longest_bars': bars[longest],
+            'longest_pips': pips[longest],
+            'shortest_bars': bars[shortest],
+            'shortest_pips': pips[shortest],
+            'min_pips': low,
+            'max_pips': high
+        })
     return results
 
+def wave_band_stats_mt4(waves, percentiles):
+    return wave_band_stats_columns([w['bars'] for w in waves], [w['pips'] for w in waves], percentiles)
+
 def print_band(name, stats, percent):
     if not stats: return
     logger.info(f"{name} Wave Frequency ({percent}%): {int(stats['min_pips'])} Pips - {int(stats['max_pips'])} Pips")
@@ -309,10 +519,11 @@ def main():
     parser.add_argument('--end_date', type=str, default=None, help='Analysis end date (YYYY-MM-DD HH:MM)')
     parser.add_argument('--export_pivots', type=str, default="", help='Export pivots to CSV filename')
     parser.add_argument('--export_waves', type=str, default="", help='Export waves to CSV filename')
+    parser.add_argument('--bar_minutes', type=float, default=None, help='Bar length in minutes (default: inferred from the data)')
 
     args = parser.parse_args()
 
-    bars = read_mt4_csv(args.csv_path)
+    bars = load_bars(args.csv_path)
 
     if args.start_date and args.end_date:
         try:
@@ -328,7 +539,8 @@ def main():
     logger.info("First 20 pivots from Python:")
     for p in pivots[:20]:
         logger.info(f"{p[0]}, {p[1]:.5f}, {p[2]}")
-    waves = calculate_waves_from_pivots(pivots)
+    bar_minutes = args.bar_minutes or infer_bar_minutes(bars['datetime'].values)
+    waves = calculate_waves_from_pivots(pivots, bar_minutes=bar_minutes)
     waves_filtered = filter_waves(waves, args.percentage, args.force_factor, args.deviation)
     print_wave_samples(waves_filtered, count=10)
     percentiles = [args.normal_wave, args.normal_wave + args.medium_wave]
@@ -344,8 +556,42 @@ def main():
         export_waves_to_csv(waves_filtered, args.export_waves)
         logger.info(f"Exported waves to {args.export_waves}")
 
-def get_wave_analysis_result_block(
-    csv_path,
+def construct_wave_analysis_csv_path(
+    data_dir,
+    source,
+    symbol,
+    start_date,
+    end_date,
+    timeframe
+):
+    """
+    Constructs the full path to the wave analysis CSV file.
+    Example:
+      data_dir: "C:/Users/Philip/Documents/GitHub/mt4_optimizer/TickData"
+      source: "Dukascopy"
+      symbol: "AUDCAD"
+      start_date: "2006.01.03"
+      end_date: "2025.09.05"
+      timeframe: "M30"
+    Returns:
+      "C:/Users/Philip/Documents/GitHub/mt4_optimizer/TickData/Dukascopy-AUDCAD-2006.01.03-2025.09.05-bardata_M30.csv"
+    """
+    import os
+
+    # Clean up inputs
+    data_dir = os.path.normpath(data_dir)
+    source = str(source)
+    symbol = str(symbol)
+    start_date = str(start_date)
+    end_date = str(end_date)
+    timeframe = str(timeframe).upper()
+
+    filename = f"{source}-{symbol}-{start_date}-{end_date}-bardata_{timeframe}.csv"
+    full_path = os.path.join(data_dir, filename)
+    return full_path
+
+def wave_analysis_profile(
+    bars,
     depth=12,
     deviation=5,
     backstep=3,
@@ -353,42 +599,49 @@ def get_wave_analysis_result_block(
     force_factor=3,
     normal_wave=80,
     medium_wave=15,
-    start_date=None,
-    end_date=None
+    pip_size=0.0001,
+    bar_minutes=None
 ):
     """
-    Returns a formatted wave analysis result block (as string) suitable for AI prompt injection.
+    Structured wave analysis of bars: analysed period, pivot and wave counts and the
+    Normal/Medium/Rare band stats (None when there are no waves).
+    bar_minutes: bar length for wave durations; None takes it from the bars themselves.
     """
+    profile = {"bars": len(bars), "start": None, "end": None, "pivots": 0, "waves": 0, "band_stats": None,
+               "normal_wave": normal_wave, "medium_wave": medium_wave}
+    if len(bars) == 0:
+        return profile
+    profile["start"] = bars['datetime'].iloc[0]
+    profile["end"] = bars['datetime'].iloc[-1]
+    if bar_minutes is None:
+        bar_minutes = infer_bar_minutes(bars['datetime'].values)
+    pivots = zigzag_mt4_pivots(bars, depth, deviation, backstep, pip_size=pip_size)
+    waves = wave_columns(*pivot_arrays(pivots), pip_size=pip_size, bar_minutes=bar_minutes)
+    keep = filter_wave_indices(waves["type"], waves["pips"], percentage, force_factor, deviation)
+    profile["pivots"] = len(pivots)
+    profile["waves"] = len(keep)
+    if len(keep):
+        percentiles = [normal_wave, normal_wave + medium_wave]
+        profile["band_stats"] = wave_band_stats_columns(waves["bars"][keep], waves["pips"][keep], percentiles)
+    return profile
+
+def format_wave_analysis_block(profile):
+    """The text block of get_wave_analysis_result_block for a wave_analysis_profile result."""
     import io
-    from datetime import datetime
-    bars = read_mt4_csv(csv_path)
-
-    if start_date and end_date:
-        try:
-            start_dt = datetime.strptime(start_date, "%Y-%m-%d %H:%M")
-            end_dt = datetime.strptime(end_date, "%Y-%m-%d %H:%M")
-            bars = filter_bars_by_date_range(bars, start_dt, end_dt)
-        except Exception as e:
-            return f"Wave Analysis: Error parsing start/end date: {e}"
-
     output = io.StringIO()
     # Analysed period
-    if len(bars) == 0:
+    if profile["bars"] == 0:
         output.write("No bars to analyse.\n")
         return output.getvalue()
-    start = bars['datetime'].iloc[0]
-    end = bars['datetime'].iloc[-1]
+    start = profile["start"]
+    end = profile["end"]
     output.write(f"Analysed from {start.strftime('%Y.%m.%d %H:%M')} to {end.strftime('%Y.%m.%d %H:%M')}\n\n")
 
-    pivots = zigzag_mt4_pivots(bars, depth, deviation, backstep)
-    waves = calculate_waves_from_pivots(pivots)
-    waves_filtered = filter_waves(waves, percentage, force_factor, deviation)
-    percentiles = [normal_wave, normal_wave + medium_wave]
-    band_stats_list = wave_band_stats_mt4(waves_filtered, percentiles)
+    normal_wave = profile["normal_wave"]
+    medium_wave = profile["medium_wave"]
     band_names = ["Normal", "Medium", "Rare"]
-
     for name, stats, percent in zip(
-        band_names, band_stats_list, [normal_wave, medium_wave, 100 - (normal_wave + medium_wave)]
+        band_names, profile["band_stats"] or [], [normal_wave, medium_wave, 100 - (normal_wave + medium_wave)]
     ):
         if not stats: continue
         output.write(f"{name} Wave Frequency ({percent:.1f}%): {int(stats['min_pips'])} Pips - {int(stats['max_pips'])} Pips\n")
@@ -399,5 +652,70 @@ def get_wave_analysis_result_block(
 
     return output.getvalue()
 
+def wave_band_stats_by_name(band_stats):
+    """{"Normal"|"Medium"|"Rare": {stat: float}} of wave_band_stats_mt4 output, JSON-ready."""
+    return {
+        name: {k: float(v) for k, v in stats.items()}
+        for name, stats in zip(["Normal", "Medium", "Rare"], band_stats or [])
+    }
+
+def wave_analysis_result(
+    csv_path,
+    depth=12,
+    deviation=5,
+    backstep=3,
+    percentage=50.0,
+    force_factor=3,
+    normal_wave=80,
+    medium_wave=15,
+    start_date=None,
+    end_date=None,
+    pip_size=0.0001,
+    bar_minutes=None
+):
+    """
+    (result block, profile) for csv_path; see get_wave_analysis_result_block and wave_analysis_profile.
+    profile is None when the block is an error message.
+    """
+    from datetime import datetime
+    bars = load_bars(csv_path)
+
+    if start_date and end_date:
+        try:
+            start_dt = datetime.strptime(start_date, "%Y-%m-%d %H:%M")
+            end_dt = datetime.strptime(end_date, "%Y-%m-%d %H:%M")
+            bars = filter_bars_by_date_range(bars, start_dt, end_dt)
+        except Exception as e:
+            return f"Wave Analysis: Error parsing start/end date: {e}", None
+
+    profile = wave_analysis_profile(
+        bars, depth, deviation, backstep, percentage, force_factor, normal_wave, medium_wave,
+        pip_size=pip_size, bar_minutes=bar_minutes
+    )
+    return format_wave_analysis_block(profile), profile
+
+def get_wave_analysis_result_block(
+    csv_path,
+    depth=12,
+    deviation=5,
+    backstep=3,
+    percentage=50.0,
+    force_factor=3,
+    normal_wave=80,
+    medium_wave=15,
+    start_date=None,
+    end_date=None,
+    pip_size=0.0001,
+    bar_minutes=None
+):
+    """
+    Returns a formatted wave analysis result block (as string) suitable for AI prompt injection.
+    """
+    block, _ = wave_analysis_result(
+        csv_path, depth, deviation, backstep, percentage, force_factor, normal_wave, medium_wave,
+        start_date, end_date, pip_size=pip_size, bar_minutes=bar_minutes
+    )
+    return block
+
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -1,82 +1,25 @@
-import struct
 import pandas as pd
 import numpy as np
 import sys
 import argparse
 from datetime import datetime
 
+from mt4_hst_reader import read_hst_header, read_hst
+
 def inspect_hst_header(hst_path):
-    with open(hst_path, 'rb') as f:
-        header = f.read(148)
-        version = struct.unpack('<I', header[12:16])[0]
-        copyright_str = header[20:76].decode(errors='replace')
-        symbol = header[76:88].decode(errors='replace').strip('\x00')
-        period = struct.unpack('<I', header[88:92])[0]
-        digits = struct.unpack('<I', header[92:96])[0]
-        print("---- HST Header Info ----")
-        print(f"Version   : {version}")
-        print(f"Copyright : {copyright_str}")
-        print(f"Symbol    : {symbol}")
-        print(f"Period    : {period}")
-        print(f"Digits    : {digits}")
-        print(f"First 64 bytes: {header[:64]}")
-        print("-------------------------")
-        return version
+    header = read_hst_header(hst_path)
+    print("---- HST Header Info ----")
+    print(f"Version   : {header['version']}")
+    print(f"Copyright : {header['copyright']}")
+    print(f"Symbol    : {header['symbol']}")
+    print(f"Period    : {header['period']}")
+    print(f"Digits    : {header['digits']}")
+    print("-------------------------")
+    return header['version']
 
 def read_mt4_hst_auto(hst_path):
-    version = inspect_hst_header(hst_path)
-    bars = []
-    with open(hst_path, 'rb') as f:
-        header = f.read(148)
-        if version >= 400:  # Build 600+ (modern MT4)
-            bar_size = 60
-            bar_struct = '<I4dQIIII'
-            while True:
-                bar = f.read(bar_size)
-                if len(bar) < bar_size:
-                    break
-                try:
-                    time, open_, high, low, close, volume, spread, reserved1, reserved2, reserved3 = struct.unpack(bar_struct, bar)
-                except Exception as e:
-                    print(f"Error unpacking bar: {e}")
-                    continue
-                dt = datetime.utcfromtimestamp(time)
-                bars.append({
-                    'datetime': dt,
-                    'open': open_,
-                    'high': high,
-                    'low': low,
-                    'close': close,
-                    'volume': volume,
-                    'spread': spread
-                })
-        else:  # Build < 600 (old MT4)
-            bar_size = 44
-            bar_struct = '<I4f2I'
-            while True:
-                bar = f.read(bar_size)
-                if len(bar) < bar_size:
-                    break
-                try:
-                    time, open_, low, high, close, volume, spread = struct.unpack(bar_struct, bar)
-                except Exception as e:
-                    print(f"Error unpacking bar: {e}")
-                    continue
-                dt = datetime.utcfromtimestamp(time)
-                bars.append({
-                    'datetime': dt,
-                    'open': open_,
-                    'high': high,
-                    'low': low,
-                    'close': close,
-                    'volume': volume,
-                    'spread': spread
-                })
-    df = pd.DataFrame(bars)
-    for col in ['open', 'high', 'low', 'close']:
-        df = df[df[col].map(lambda x: np.isfinite(x) and abs(x) < 1000)]
-    df = df.reset_index(drop=True)
-    return df
+    inspect_hst_header(hst_path)
+    return read_hst(hst_path)
 
 def zigzag(bars, depth, deviation, backstep):
     highs = bars['high'].values
@@ -0,0 +1,277 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bar_store import load_bars
+from extract_setfilename_fields import load_symbol_list
+from file_cache import file_identity
+from wave_analysis import (
+    construct_wave_analysis_csv_path, wave_analysis_profile, format_wave_analysis_block, wave_band_stats_by_name
+)
+
+logger = logging.getLogger(__name__)
+
+WAVE_PARAM_NAMES = ["depth", "deviation", "backstep", "percentage", "force_factor", "normal_wave", "medium_wave"]
+DEFAULT_WAVE_PARAMS = {"depth": 12, "deviation": 5, "backstep": 3, "percentage": 50.0, "force_factor": 3,
+                       "normal_wave": 80, "medium_wave": 15}
+
+TIMEFRAME_MINUTES = {"M1": 1, "M5": 5, "M15": 15, "M30": 30, "H1": 60, "H4": 240, "D1": 1440, "W1": 10080, "MN1": 43200}
+FX_CURRENCY_RE = re.compile(r"^[A-Z]{6}$")
+
+def ensure_wave_profile_tables(conn):
+    """One row per (symbol, timeframe, window, ZigZag settings); written as each symbol finishes."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS wave_profiles (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        symbol TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        source TEXT,
+        depth INTEGER NOT NULL,
+        deviation REAL NOT NULL,
+        backstep INTEGER NOT NULL,
+        percentage REAL NOT NULL,
+        force_factor REAL NOT NULL,
+        normal_wave REAL NOT NULL,
+        medium_wave REAL NOT NULL,
+        pip_size REAL NOT NULL,
+        data_path TEXT,
+        data_mtime_ns INTEGER,
+        data_size INTEGER,
+        status TEXT NOT NULL,
+        error TEXT,
+        bars INTEGER,
+        pivots INTEGER,
+        waves INTEGER,
+        first_bar TEXT,
+        last_bar TEXT,
+        band_stats_json TEXT,
+        result_block TEXT,
+        elapsed_sec REAL,
+        updated_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (symbol, timeframe, start_date, end_date, depth, deviation, backstep, percentage, force_factor, normal_wave, medium_wave)
+    )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wave_profiles_symbol_timeframe ON wave_profiles (symbol, timeframe)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_wave_profiles_status ON wave_profiles (status)")
+
+def pip_size_for_symbol(symbol, overrides=None):
+    """
+    Pip size used as the ZigZag deviation unit and for pip counts: overrides first, then
+    0.01 for JPY/HUF quoted pairs and silver, 0.1 for gold, 0.0001 for other currency pairs.
+    Anything else (indices, stocks, crypto) needs an override and falls back to 0.0001.
+    """
+    if overrides and symbol in overrides:
+        return float(overrides[symbol])
+    code = symbol.upper()
+    if code.startswith("XAU"):
+        return 0.1
+    if code.startswith("XAG"):
+        return 0.01
+    if FX_CURRENCY_RE.match(code) and code[3:] in ("JPY", "HUF"):
+        return 0.01
+    return 0.0001
+
+def load_pip_sizes(pip_csv_path):
+    """{symbol: pip_size} from a symbol,pip_size CSV (header optional)."""
+    overrides = {}
+    with open(pip_csv_path, encoding="utf-8") as f:
+        for line in f:
+            parts = [p.strip() for p in line.split(",")]
+            if len(parts) < 2 or not parts[0]:
+                continue
+            try:
+                overrides[parts[0]] = float(parts[1])
+            except ValueError:
+                continue  # header
+    return overrides
+
+def timeframe_minutes(timeframe):
+    code = str(timeframe).upper()
+    if code not in TIMEFRAME_MINUTES:
+        raise ValueError(f"Unknown timeframe: {timeframe}")
+    return TIMEFRAME_MINUTES[code]
+
+def plan_wave_jobs(symbols, timeframes, windows, data_dir, source, params=None, pip_sizes=None):
+    """One job per symbol, timeframe and (start_date, end_date) window, data file resolved by construct_wave_analysis_csv_path."""
+    params = dict(DEFAULT_WAVE_PARAMS, **(params or {}))
+    jobs = []
+    for symbol in symbols:
+        pip_size = pip_size_for_symbol(symbol, pip_sizes)
+        for timeframe in timeframes:
+            for start_date, end_date in windows:
+                jobs.append(dict(
+                    params,
+                    symbol=symbol,
+                    timeframe=str(timeframe).upper(),
+                    start_date=start_date,
+                    end_date=end_date,
+                    source=source,
+                    pip_size=pip_size,
+                    data_path=construct_wave_analysis_csv_path(data_dir, source, symbol, start_date, end_date, timeframe),
+                ))
+    return jobs
+
+def run_wave_job(job):
+    """Runs the wave pipeline for one job (in a worker process); returns the wave_profiles row values."""
+    started = time.perf_counter()
+    row = dict(job, status="ok", error=None)
+    try:
+        bars = load_bars(job["data_path"])
+        profile = wave_analysis_profile(
+            bars, **{k: job[k] for k in WAVE_PARAM_NAMES},
+            pip_size=job["pip_size"], bar_minutes=timeframe_minutes(job["timeframe"])
+        )
+        row["bars"] = profile["bars"]
+        row["pivots"] = profile["pivots"]
+        row["waves"] = profile["waves"]
+        row["first_bar"] = str(profile["start"]) if profile["start"] is not None else None
+        row["last_bar"] = str(profile["end"]) if profile["end"] is not None else None
+        row["band_stats_json"] = json.dumps(wave_band_stats_by_name(profile["band_stats"]))
+        row["result_block"] = format_wave_analysis_block(profile)
+        if not profile["band_stats"]:
+            row["status"] = "no_waves"
+    except Exception as e:
+        row["status"] = "error"
+        row["error"] = str(e)
+    row["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return row
+
+def _job_key(job):
+    return tuple([job["symbol"], job["timeframe"], job["start_date"], job["end_date"]] + [job[k] for k in WAVE_PARAM_NAMES])
+
+def _completed_keys(conn):
+    """Keys of rows that are done, with the data file identity they were computed from."""
+    rows = conn.execute(f"""
+        SELECT symbol, timeframe, start_date, end_date, {", ".join(WAVE_PARAM_NAMES)}, pip_size, data_mtime_ns, data_size
+        FROM wave_profiles WHERE status IN ('ok', 'no_waves')
+    """).fetchall()
+    return {tuple(r[:4]) + tuple(r[4:4 + len(WAVE_PARAM_NAMES)]): tuple(r[-3:]) for r in rows}
+
+def _save_row(conn, row):
+    columns = ["symbol", "timeframe", "start_date", "end_date", "source"] + WAVE_PARAM_NAMES + [
+        "pip_size", "data_path", "data_mtime_ns", "data_size", "status", "error", "bars", "pivots", "waves",
+        "first_bar", "last_bar", "band_stats_json", "result_block", "elapsed_sec"]
+    conn.execute(
+        f"INSERT OR REPLACE INTO wave_profiles ({', '.join(columns)}, updated_at) "
+        f"VALUES ({', '.join('?' for _ in columns)}, CURRENT_TIMESTAMP)",
+        [row.get(c) for c in columns]
+    )
+    conn.commit()
+
+def run_wave_portfolio(db_path, jobs, workers=None, force=False):
+    """
+    Runs the jobs over a process pool and stores every result in wave_profiles as soon as it
+    arrives, so an interrupted run resumes where it stopped. Jobs whose row is done for the
+    same data file (mtime, size) and pip size are skipped unless force is set;
+    jobs without a data file are recorded as 'missing'.
+    Returns counts per outcome.
+    """
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        ensure_wave_profile_tables(conn)
+        conn.commit()
+        done = {} if force else _completed_keys(conn)
+        summary = {"ok": 0, "no_waves": 0, "failed": 0, "missing": 0, "skipped": 0}
+        pending = []
+        for job in jobs:
+            if not os.path.isfile(job["data_path"]):
+                _save_row(conn, dict(job, status="missing", error=f"Data file not found: {job['data_path']}"))
+                summary["missing"] += 1
+                continue
+            _, mtime_ns, size = file_identity(job["data_path"])
+            job = dict(job, data_mtime_ns=mtime_ns, data_size=size)
+            if done.get(_job_key(job)) == (job["pip_size"], mtime_ns, size):
+                summary["skipped"] += 1
+                continue
+            pending.append(job)
+        # Largest files first so the pool does not end on one long job
+        pending.sort(key=lambda job: -job["data_size"])
+
+        workers = max(1, min(workers or os.cpu_count() or 1, len(pending) or 1))
+        logger.info(f"Wave portfolio: {len(pending)} jobs to run on {workers} workers, {summary['skipped']} up to date")
+        if workers == 1:
+            results = (run_wave_job(job) for job in pending)
+            for row in results:
+                _save_row(conn, row)
+                summary["failed" if row["status"] == "error" else row["status"]] += 1
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(run_wave_job, job) for job in pending]
+                for future in as_completed(futures):
+                    row = future.result()
+                    _save_row(conn, row)
+                    summary["failed" if row["status"] == "error" else row["status"]] += 1
+                    logger.info(f"{row['symbol']} {row['timeframe']} {row['start_date']}-{row['end_date']}: {row['status']}")
+        return summary
+    finally:
+        conn.close()
+
+def _windows(text):
+    """"2006.01.03-2025.09.05,2020.01.02-2025.09.05" -> [(start, end), ...]."""
+    windows = []
+    for part in text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_date, sep, end_date = part.partition("-")
+        if not sep or not end_date:
+            raise ValueError(f"Window must be START-END: {part}")
+        windows.append((start_date.strip(), end_date.strip()))
+    return windows
+
+def main():
+    parser = argparse.ArgumentParser(description="Portfolio-wide wave analysis over SymbolList.csv, stored in the wave_profiles table.")
+    parser.add_argument('--db_path', type=str, required=True, help='SQLite database')
+    parser.add_argument('--symbol_csv', type=str, required=True, help='SymbolList.csv (symbol in the first column)')
+    parser.add_argument('--data_dir', type=str, required=True, help='Folder with the bar data files')
+    parser.add_argument('--source', type=str, default="Dukascopy", help='Data source prefix of the file names')
+    parser.add_argument('--timeframes', type=str, default="M30", help='Timeframes, e.g. "M30,H1"')
+    parser.add_argument('--windows', type=str, required=True, help='Date windows of the files, e.g. "2006.01.03-2025.09.05"')
+    parser.add_argument('--symbols', type=str, default=None, help='Only these symbols (comma-separated)')
+    parser.add_argument('--pip_sizes', type=str, default=None, help='Optional symbol,pip_size CSV overriding the built-in pip sizes')
+    parser.add_argument('--depth', type=int, default=12, help='ZigZag Depth')
+    parser.add_argument('--deviation', type=float, default=5, help='ZigZag Deviation')
+    parser.add_argument('--backstep', type=int, default=3, help='ZigZag Backstep')
+    parser.add_argument('--percentage', type=float, default=50.0, help='Filter percentage')
+    parser.add_argument('--force_factor', type=float, default=3, help='Filter force factor')
+    parser.add_argument('--normal_wave', type=float, default=80, help='Normal Wave percentile')
+    parser.add_argument('--medium_wave', type=float, default=15, help='Medium Wave percentile')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--force', action='store_true', help='Recompute rows that are already up to date')
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        started = time.perf_counter()
+        symbols = load_symbol_list(args.symbol_csv)
+        if args.symbols:
+            wanted = {s.strip() for s in args.symbols.split(",") if s.strip()}
+            symbols = [s for s in symbols if s in wanted]
+        params = {k: getattr(args, k) for k in WAVE_PARAM_NAMES}
+        pip_sizes = load_pip_sizes(args.pip_sizes) if args.pip_sizes else None
+        timeframes = [t.strip() for t in args.timeframes.split(",") if t.strip()]
+        for timeframe in timeframes:
+            timeframe_minutes(timeframe)
+        jobs = plan_wave_jobs(symbols, timeframes, _windows(args.windows), args.data_dir, args.source, params, pip_sizes)
+        output.update(run_wave_portfolio(args.db_path, jobs, workers=args.workers, force=args.force))
+        output["jobs"] = len(jobs)
+        output["elapsed_sec"] = round(time.perf_counter() - started, 3)
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+    main()
@@ -0,0 +1,120 @@
+import json
+import sqlite3
+import logging
+
+from artifact_blob_store import sha256_file
+from file_cache import cached_file_result
+from wave_analysis import wave_analysis_result, wave_band_stats_by_name
+
+logger = logging.getLogger(__name__)
+
+# Everything the wave analysis result depends on besides the data file content
+WAVE_CACHE_KEY_COLUMNS = [
+    "data_sha256", "symbol", "timeframe", "start_date", "end_date", "depth", "deviation", "backstep",
+    "percentage", "force_factor", "percentiles", "pip_size", "bar_minutes",
+]
+
+def ensure_wave_analysis_cache_table(conn):
+    """One row per distinct wave analysis: the formatted block and the structured band stats."""
+    columns = {row[1]: row[2] for row in conn.execute("PRAGMA table_info(wave_analysis_cache)")}
+    if columns.get("bar_minutes", "REAL").upper() != "REAL":
+        # Earlier caches keyed bar_minutes as a truncated integer (0 = inferred); it is only a cache, so rebuild it
+        logger.info("Dropping wave_analysis_cache with the old integer bar_minutes key")
+        conn.execute("DROP TABLE wave_analysis_cache")
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS wave_analysis_cache (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        data_sha256 TEXT NOT NULL,
+        symbol TEXT NOT NULL,
+        timeframe TEXT NOT NULL,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        depth INTEGER NOT NULL,
+        deviation REAL NOT NULL,
+        backstep INTEGER NOT NULL,
+        percentage REAL NOT NULL,
+        force_factor REAL NOT NULL,
+        percentiles TEXT NOT NULL,
+        pip_size REAL NOT NULL,
+        bar_minutes REAL NOT NULL,
+        data_path TEXT,
+        result_block TEXT NOT NULL,
+        band_stats_json TEXT,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE ({", ".join(WAVE_CACHE_KEY_COLUMNS)})
+    )
+    """)
+
+def data_file_sha256(path):
+    """Content hash of a bar data file, hashed once per (path, mtime, size)."""
+    return cached_file_result("data_sha256", path, lambda p: sha256_file(p)[0])
+
+def cached_wave_analysis_result(
+    db_path,
+    csv_path,
+    symbol="",
+    timeframe="",
+    depth=12,
+    deviation=5,
+    backstep=3,
+    percentage=50.0,
+    force_factor=3,
+    normal_wave=80,
+    medium_wave=15,
+    start_date=None,
+    end_date=None,
+    pip_size=0.0001,
+    bar_minutes=None
+):
+    """
+    (result block, band stats by name) as get_wave_analysis_result_block computes them, looked up
+    in wave_analysis_cache first. The key is the data file's content hash plus every analysis
+    setting, so a rewritten file or changed setting never returns a stale block. Misses are
+    computed and stored; error blocks (bad dates) are returned without being stored.
+    """
+    key = {
+        "data_sha256": data_file_sha256(csv_path),
+        "symbol": str(symbol or ""),
+        "timeframe": str(timeframe or "").upper(),
+        "start_date": str(start_date or ""),
+        "end_date": str(end_date or ""),
+        "depth": int(depth),
+        "deviation": float(deviation),
+        "backstep": int(backstep),
+        "percentage": float(percentage),
+        "force_factor": float(force_factor),
+        "percentiles": json.dumps([float(normal_wave), float(normal_wave) + float(medium_wave)]),
+        "pip_size": float(pip_size),
+        # -1: bar length inferred from the data, which data_sha256 already covers
+        "bar_minutes": -1.0 if bar_minutes is None else float(bar_minutes),
+    }
+    where = " AND ".join(f"{col} = ?" for col in WAVE_CACHE_KEY_COLUMNS)
+    values = [key[col] for col in WAVE_CACHE_KEY_COLUMNS]
+
+    conn = sqlite3.connect(db_path)
+    #conn.execute("PRAGMA key = 'Kh78784bt!'")
+    try:
+        ensure_wave_analysis_cache_table(conn)
+        row = conn.execute(
+            f"SELECT result_block, band_stats_json FROM wave_analysis_cache WHERE {where}", values
+        ).fetchone()
+        if row is not None:
+            logger.info(f"Wave analysis cache hit for {symbol} {timeframe} ({csv_path})")
+            return row[0], json.loads(row[1]) if row[1] else {}
+
+        block, profile = wave_analysis_result(
+            csv_path, depth, deviation, backstep, percentage, force_factor, normal_wave, medium_wave,
+            start_date, end_date, pip_size=pip_size, bar_minutes=bar_minutes
+        )
+        if profile is None:
+            return block, {}
+        band_stats = wave_band_stats_by_name(profile["band_stats"])
+        conn.execute(f"""
+            INSERT OR IGNORE INTO wave_analysis_cache ({", ".join(WAVE_CACHE_KEY_COLUMNS)}, data_path, result_block, band_stats_json)
+            VALUES ({", ".join("?" for _ in WAVE_CACHE_KEY_COLUMNS)}, ?, ?, ?)
+        """, values + [csv_path, block, json.dumps(band_stats)])
+        conn.commit()
+        logger.info(f"Wave analysis cached for {symbol} {timeframe} ({csv_path})")
+        return block, band_stats
+    finally:
+        conn.close()
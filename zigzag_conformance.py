@@ -0,0 +1,416 @@
+import argparse
+import json
+import os
+import sys
+import time
+import logging
+
+import numpy as np
+import pandas as pd
+
+from bar_store import load_bars
+from wave_analysis import (
+    zigzag_mt4_pivots_reference, zigzag_mt4_pivots, pivot_arrays, wave_columns, infer_bar_minutes,
+    filter_bars_by_date_range
+)
+from zigzag_incremental import IncrementalZigZag
+
+logger = logging.getLogger(__name__)
+
+MT4_TIME_FORMAT = "%Y.%m.%d %H:%M"
+PIVOT_DIFF_COLUMNS = [
+    "status", "mt4_datetime", "mt4_price", "mt4_type", "py_datetime", "py_price", "py_type",
+    "time_delta_s", "price_delta",
+]
+WAVE_DIFF_COLUMNS = [
+    "status", "mt4_start", "mt4_end", "mt4_bars", "mt4_pips", "mt4_type", "py_start", "py_end", "py_bars",
+    "py_pips", "py_type", "start_delta_s", "end_delta_s", "bars_delta", "pips_delta",
+]
+
+def load_mt4_pivots(mt4_csv):
+    """ZigZagExport_Pivots.csv (DateTime;Price;Type, newest first) as datetime, price, type, oldest first."""
+    pivots = pd.read_csv(mt4_csv, delimiter=';', header=None, skiprows=1, names=['datetime', 'price', 'type'])
+    pivots['datetime'] = pd.to_datetime(pivots['datetime'].str.strip(), format=MT4_TIME_FORMAT)
+    pivots['type'] = pivots['type'].str.strip()
+    return pivots.sort_values('datetime', kind='stable').reset_index(drop=True)
+
+def load_mt4_waves(mt4_csv, mt4_point=0.00001, pip_size=0.0001):
+    """
+    ZigZagExport_Waves.csv (start;end;bars;pips;type, newest first, each wave from its later pivot back
+    to the earlier one) as chronological waves in the wave_columns convention: start < end, bars >= 0,
+    pips in pip_size units (the export counts mt4_point units) and type the type of the ending pivot.
+    """
+    waves = pd.read_csv(mt4_csv, delimiter=';', header=None, skiprows=1, names=['start', 'end', 'bars', 'pips', 'type'])
+    first = pd.to_datetime(waves['start'].str.strip(), format=MT4_TIME_FORMAT)
+    second = pd.to_datetime(waves['end'].str.strip(), format=MT4_TIME_FORMAT)
+    types = waves['type'].str.strip()
+    backwards = (first > second).to_numpy()
+    # Walking backwards the row type is that of the earlier pivot; the later one has the other type
+    flipped = types.map({'High': 'Low', 'Low': 'High'}).fillna(types)
+    out = pd.DataFrame({
+        'start': np.where(backwards, second, first).astype('datetime64[ns]'),
+        'end': np.where(backwards, first, second).astype('datetime64[ns]'),
+        'bars': waves['bars'].abs().astype(np.float64),
+        'pips': waves['pips'].abs().astype(np.float64) * mt4_point / pip_size,
+        'type': np.where(backwards, flipped, types),
+    })
+    return out.sort_values('start', kind='stable').reset_index(drop=True)
+
+def pivots_frame(pivots):
+    """[(datetime, price, 'High'/'Low')] pivots as a datetime, price, type DataFrame."""
+    times, prices, types = pivot_arrays(pivots)
+    return pd.DataFrame({'datetime': times, 'price': prices, 'type': types.astype(object)})
+
+def python_waves_frame(bars, pivots, pip_size=0.0001, bar_minutes=None):
+    """
+    Unfiltered waves of the pivots, as calculate_waves_from_pivots measures them (the MT4 export
+    does the same: bars is the time span in bar lengths, weekends included). bar_minutes
+    defaults to the bar length of bars.
+    """
+    times, prices, types = pivot_arrays(pivots)
+    if not bar_minutes:
+        bar_minutes = infer_bar_minutes(bars['datetime'].to_numpy())
+    columns = wave_columns(times, prices, types, pip_size=pip_size, bar_minutes=bar_minutes)
+    return pd.DataFrame({
+        'start': columns['start'], 'end': columns['end'], 'bars': columns['bars'],
+        'pips': columns['pips'], 'type': columns['type'].astype(object),
+    })
+
+def clip_to_overlap(mt4, py, on):
+    """Both frames restricted to the time span they both cover, so unequal history lengths are not counted as differences."""
+    if not len(mt4) or not len(py):
+        return mt4, py
+    lo = max(mt4[on].iloc[0], py[on].iloc[0])
+    hi = min(mt4[on].iloc[-1], py[on].iloc[-1])
+    keep_mt4 = ((mt4[on] >= lo) & (mt4[on] <= hi)).to_numpy()
+    keep_py = ((py[on] >= lo) & (py[on] <= hi)).to_numpy()
+    return mt4[keep_mt4].reset_index(drop=True), py[keep_py].reset_index(drop=True)
+
+def _align(mt4, py, on, time_tolerance):
+    """
+    One-to-one pairing of mt4 and py rows of the same type by nearest `on` time within time_tolerance,
+    with merge_asof. When several MT4 rows pick the same Python row the closest keeps it. Returns the paired frame
+    (mt4_* and py_* columns, py_* empty for unpaired MT4 rows) and the unpaired Python rows.
+    """
+    left = mt4.add_prefix('mt4_')
+    left['_key'] = left['mt4_' + on].astype('datetime64[ns]')
+    right = py.add_prefix('py_')
+    right['_key'] = right['py_' + on].astype('datetime64[ns]')
+    right['_py_row'] = np.arange(len(right))
+    left['_type'] = left['mt4_type'].astype(str)
+    right['_type'] = right['py_type'].astype(str)
+    merged = pd.merge_asof(
+        left.sort_values('_key', kind='stable'), right.sort_values('_key', kind='stable'), on='_key',
+        by='_type', direction='nearest', tolerance=pd.Timedelta(time_tolerance),
+    )
+    delta = (merged['py_' + on] - merged['mt4_' + on]).dt.total_seconds()
+    # Losers of a contested Python row become unpaired (NaN rows never compare equal)
+    rows = merged['_py_row'].to_numpy(dtype=np.float64)
+    order = np.lexsort((delta.abs().to_numpy(), rows))
+    contested = np.zeros(len(merged), dtype=bool)
+    contested[order[1:]] = rows[order[1:]] == rows[order[:-1]]
+    py_cols = [c for c in merged.columns if c.startswith('py_')] + ['_py_row']
+    merged.loc[contested, py_cols] = np.nan
+    paired_rows = merged['_py_row'].dropna().astype(np.int64).to_numpy()
+    extra = np.ones(len(py), dtype=bool)
+    extra[paired_rows] = False
+    return merged.drop(columns=['_key', '_type']), right[extra].drop(columns=['_key', '_type'])
+
+def align_pivots(mt4, py, time_tolerance="0min", price_tolerance=0.000005):
+    """
+    Pivot diff of MT4 (expected) and Python (actual) pivots, one row per pivot in time order:
+    status is match, price_mismatch, missing (MT4 pivot without a Python pivot of its type within
+    time_tolerance) or extra (Python pivot without an MT4 one).
+    """
+    merged, extra = _align(mt4, py, 'datetime', time_tolerance)
+    merged['time_delta_s'] = (merged['py_datetime'] - merged['mt4_datetime']).dt.total_seconds()
+    merged['price_delta'] = merged['py_price'] - merged['mt4_price']
+    paired = merged['py_datetime'].notna()
+    merged['status'] = np.select(
+        [~paired, merged['price_delta'].abs() > price_tolerance],
+        ['missing', 'price_mismatch'], default='match',
+    )
+    extra = extra.drop(columns=['_py_row']).assign(status='extra')
+    diff = pd.concat([merged.drop(columns=['_py_row']), extra], ignore_index=True)
+    diff['_t'] = diff['mt4_datetime'].fillna(diff['py_datetime'])
+    return diff.sort_values('_t', kind='stable').reset_index(drop=True)[PIVOT_DIFF_COLUMNS]
+
+def align_waves(mt4, py, time_tolerance="0min", pips_tolerance=0.1, bars_tolerance=0):
+    """
+    Wave diff of MT4 (expected) and Python (actual) waves paired on type and start time: status is
+    match, end_mismatch (end further apart than time_tolerance), bars_mismatch, pips_mismatch,
+    missing or extra.
+    """
+    merged, extra = _align(mt4, py, 'start', time_tolerance)
+    merged['start_delta_s'] = (merged['py_start'] - merged['mt4_start']).dt.total_seconds()
+    merged['end_delta_s'] = (merged['py_end'] - merged['mt4_end']).dt.total_seconds()
+    merged['bars_delta'] = merged['py_bars'] - merged['mt4_bars']
+    merged['pips_delta'] = merged['py_pips'] - merged['mt4_pips']
+    paired = merged['py_start'].notna()
+    merged['status'] = np.select(
+        [
+            ~paired,
+            merged['end_delta_s'].abs() > pd.Timedelta(time_tolerance).total_seconds(),
+            merged['bars_delta'].abs() > bars_tolerance,
+            merged['pips_delta'].abs() > pips_tolerance,
+        ],
+        ['missing', 'end_mismatch', 'bars_mismatch', 'pips_mismatch'], default='match',
+    )
+    extra = extra.drop(columns=['_py_row']).assign(status='extra')
+    diff = pd.concat([merged.drop(columns=['_py_row']), extra], ignore_index=True)
+    diff['_t'] = diff['mt4_start'].fillna(diff['py_start'])
+    return diff.sort_values('_t', kind='stable').reset_index(drop=True)[WAVE_DIFF_COLUMNS]
+
+def match_stats(diff, time_column):
+    """
+    Match-rate summary of a pivot or wave diff: counts per status, match_rate (share of MT4 rows
+    reproduced exactly), python_match_rate (share of Python rows that are in MT4) and the time
+    of the first row that is not a match.
+    """
+    counts = diff['status'].value_counts()
+    mt4_rows = int(len(diff) - counts.get('extra', 0))
+    py_rows = int(len(diff) - counts.get('missing', 0))
+    matched = int(counts.get('match', 0))
+    bad = diff[diff['status'] != 'match']
+    first_bad = None
+    if len(bad):
+        t = bad['mt4_' + time_column].iloc[0]
+        first_bad = str(bad['py_' + time_column].iloc[0] if pd.isna(t) else t)
+    return {
+        "mt4": mt4_rows,
+        "python": py_rows,
+        "matched": matched,
+        "match_rate": matched / mt4_rows if mt4_rows else 1.0,
+        "python_match_rate": matched / py_rows if py_rows else 1.0,
+        "status_counts": {str(k): int(v) for k, v in counts.items()},
+        "first_difference": first_bad,
+    }
+
+def run_conformance(
+    csv_path,
+    mt4_pivots_csv,
+    mt4_waves_csv=None,
+    depth=12,
+    deviation=5,
+    backstep=3,
+    pip_size=0.0001,
+    mt4_point=0.00001,
+    time_tolerance="0min",
+    price_tolerance=0.000005,
+    pips_tolerance=0.1,
+    bars_tolerance=0,
+    bar_minutes=None,
+    start_date=None,
+    end_date=None,
+    clip=True,
+    diff_dir=None
+):
+    """
+    Python ZigZag on csv_path against the MT4 ZigZag exports. Returns {"pivots": stats, "waves": stats}
+    (see match_stats); with diff_dir, the full diffs are written there as pivot_diff.csv and wave_diff.csv.
+    """
+    bars = load_bars(csv_path)
+    if start_date and end_date:
+        bars = filter_bars_by_date_range(bars, pd.Timestamp(start_date), pd.Timestamp(end_date))
+    pivots = zigzag_mt4_pivots(bars, depth, deviation, backstep, pip_size=pip_size)
+
+    report = {}
+    diffs = {}
+    mt4 = load_mt4_pivots(mt4_pivots_csv)
+    py = pivots_frame(pivots)
+    if clip:
+        mt4, py = clip_to_overlap(mt4, py, 'datetime')
+    diffs['pivot_diff.csv'] = align_pivots(mt4, py, time_tolerance, price_tolerance)
+    report["pivots"] = match_stats(diffs['pivot_diff.csv'], 'datetime')
+
+    if mt4_waves_csv:
+        mt4 = load_mt4_waves(mt4_waves_csv, mt4_point=mt4_point, pip_size=pip_size)
+        py = python_waves_frame(bars, pivots, pip_size=pip_size, bar_minutes=bar_minutes)
+        if clip:
+            mt4, py = clip_to_overlap(mt4, py, 'start')
+        diffs['wave_diff.csv'] = align_waves(mt4, py, time_tolerance, pips_tolerance, bars_tolerance)
+        report["waves"] = match_stats(diffs['wave_diff.csv'], 'start')
+
+    if diff_dir:
+        os.makedirs(diff_dir, exist_ok=True)
+        for name, diff in diffs.items():
+            diff.to_csv(os.path.join(diff_dir, name), index=False)
+        report["diff_dir"] = diff_dir
+    logger.info(f"Conformance of {csv_path}: pivot match rate {report['pivots']['match_rate']:.3f}")
+    return report
+
+def synthetic_bars(n, seed=0, start="2020-01-01", bar_minutes=30, pip_size=0.0001, digits=5):
+    """n random-walk bars on a regular bar_minutes grid, prices rounded to digits like broker quotes."""
+    rng = np.random.default_rng(seed)
+    close = np.round(1.0 + np.cumsum(rng.normal(0.0, 5 * pip_size, n)), digits)
+    open_ = np.concatenate([close[:1], close[:-1]])
+    high = np.round(np.maximum(open_, close) + np.abs(rng.normal(0.0, 2 * pip_size, n)), digits)
+    low = np.round(np.minimum(open_, close) - np.abs(rng.normal(0.0, 2 * pip_size, n)), digits)
+    return pd.DataFrame({
+        "datetime": pd.date_range(start, periods=n, freq=f"{bar_minutes}min"),
+        "open": open_, "high": high, "low": low, "close": close,
+        "volume": rng.integers(1, 2000, n),
+    })
+
+def _prepare_reference(bars, depth, deviation, backstep, pip_size):
+    return lambda: zigzag_mt4_pivots_reference(bars, depth, deviation, backstep, pip_size=pip_size)
+
+def _prepare_vectorized(bars, depth, deviation, backstep, pip_size):
+    return lambda: zigzag_mt4_pivots(bars, depth, deviation, backstep, pip_size=pip_size)
+
+def _prepare_incremental(bars, depth, deviation, backstep, pip_size):
+    def run():
+        zz = IncrementalZigZag(depth=depth, deviation=deviation, backstep=backstep, pip_size=pip_size)
+        zz.update(bars)
+        return zz.pivots
+    return run
+
+def _prepare_incremental_append(bars, depth, deviation, backstep, pip_size):
+    # State built on all but the last bar outside the timing; the run is the one-bar update
+    zz = IncrementalZigZag(depth=depth, deviation=deviation, backstep=backstep, pip_size=pip_size)
+    zz.update(bars.iloc[:-1])
+    def run():
+        zz.update(bars)
+        return zz.pivots
+    return run
+
+# name: prepare(bars, depth, deviation, backstep, pip_size) -> run() returning the pivots; only run() is timed
+ZIGZAG_ENGINES = {
+    "reference": _prepare_reference,
+    "vectorized": _prepare_vectorized,
+    "incremental": _prepare_incremental,
+    "incremental_append": _prepare_incremental_append,
+}
+
+def same_pivots(a, b):
+    """True when two pivot lists are identical: same times, prices (bit for bit) and types."""
+    if len(a) != len(b):
+        return False
+    return all(np.array_equal(x, y) for x, y in zip(pivot_arrays(a), pivot_arrays(b)))
+
+def benchmark_engines(bars, depth=12, deviation=5, backstep=3, pip_size=0.0001, repeat=3, engines=None):
+    """
+    {engine: {seconds, bars_per_second, pivots, exact, speedup}} for each ZigZag engine on bars:
+    seconds is the best of repeat runs, exact whether its pivots equal the reference engine's and
+    speedup the reference time over the engine's.
+    """
+    names = list(engines or ZIGZAG_ENGINES)
+    if "reference" in names:
+        names.remove("reference")
+    names.insert(0, "reference")
+    results = {}
+    expected = None
+    for name in names:
+        best = None
+        pivots = None
+        for _ in range(max(int(repeat), 1)):
+            run = ZIGZAG_ENGINES[name](bars, depth, deviation, backstep, pip_size)
+            t0 = time.perf_counter()
+            pivots = run()
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        if expected is None:
+            expected = pivots
+        results[name] = {
+            "seconds": best,
+            "bars_per_second": len(bars) / best if best > 0 else None,
+            "pivots": len(pivots),
+            "exact": same_pivots(pivots, expected),
+            "speedup": results["reference"]["seconds"] / best if name != "reference" and best > 0 else 1.0,
+        }
+        logger.info(f"{name}: {len(bars)} bars in {best:.4f}s, exact={results[name]['exact']}")
+    return results
+
+def run_benchmark(csv_path=None, sizes=(100000,), depth=12, deviation=5, backstep=3, pip_size=0.0001,
+                  repeat=1, engines=None, seed=0):
+    """
+    benchmark_engines on csv_path (when given) and on a synthetic series of each size, keyed by series name.
+    The defaults are sized for CI; timing runs pass larger sizes and repeats (e.g. 100000,1000000 x 3).
+    """
+    series = {}
+    if csv_path:
+        series[os.path.basename(csv_path)] = load_bars(csv_path)
+    for n in sizes:
+        series[f"synthetic_{n}"] = synthetic_bars(int(n), seed=seed, pip_size=pip_size)
+    return {
+        name: {"bars": len(bars), "engines": benchmark_engines(bars, depth, deviation, backstep, pip_size, repeat, engines)}
+        for name, bars in series.items()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Conformance of the Python ZigZag with MT4 exports, and ZigZag engine benchmark.")
+    parser.add_argument('--csv_path', type=str, default=None, help='Bar data (MT4 CSV or HST) the exports were made from')
+    parser.add_argument('--mt4_pivots', type=str, default=None, help='MT4 pivot export (ZigZagExport_Pivots.csv)')
+    parser.add_argument('--mt4_waves', type=str, default=None, help='MT4 wave export (ZigZagExport_Waves.csv)')
+    parser.add_argument('--depth', type=int, default=12, help='ZigZag Depth')
+    parser.add_argument('--deviation', type=float, default=5, help='ZigZag Deviation')
+    parser.add_argument('--backstep', type=int, default=3, help='ZigZag Backstep')
+    parser.add_argument('--pip_size', type=float, default=0.0001, help='Pip size (0.01 for JPY pairs)')
+    parser.add_argument('--mt4_point', type=float, default=0.00001, help='Price unit of the pips column in the MT4 wave export')
+    parser.add_argument('--time_tolerance_minutes', type=float, default=0, help='Max time difference for pivots/waves to pair')
+    parser.add_argument('--price_tolerance', type=float, default=0.000005, help='Max pivot price difference for a match')
+    parser.add_argument('--pips_tolerance', type=float, default=0.1, help='Max wave pips difference for a match')
+    parser.add_argument('--bars_tolerance', type=float, default=0, help='Max wave bars difference for a match')
+    parser.add_argument('--bar_minutes', type=float, default=None, help='Bar length in minutes (default: inferred from the data)')
+    parser.add_argument('--start_date', type=str, default=None, help='Analysis start date (YYYY-MM-DD HH:MM)')
+    parser.add_argument('--end_date', type=str, default=None, help='Analysis end date (YYYY-MM-DD HH:MM)')
+    parser.add_argument('--no_clip', action='store_true', help='Compare the full exports, not only the time span both sides cover')
+    parser.add_argument('--diff_dir', type=str, default=None, help='Directory for pivot_diff.csv and wave_diff.csv')
+    parser.add_argument('--min_match_rate', type=float, default=None, help='Fail when the pivot or wave match rate is below this')
+    parser.add_argument('--benchmark', action='store_true', help='Time the ZigZag engines and check them against the reference')
+    parser.add_argument('--sizes', type=str, default="100000",
+                        help='Synthetic series lengths for --benchmark; the default is a quick CI check, '
+                             'pass e.g. "100000,1000000" with --repeat 3 for a full timing run')
+    parser.add_argument('--engines', type=str, default="", help='Comma-separated engines for --benchmark (default all)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per engine; the best is reported')
+    parser.add_argument('--report_json', type=str, default=None, help='Also write the report to this JSON file')
+    args = parser.parse_args()
+
+    output = {}
+    failures = []
+    try:
+        if args.mt4_pivots:
+            if not args.csv_path:
+                raise ValueError("--csv_path is required with --mt4_pivots")
+            output["conformance"] = run_conformance(
+                args.csv_path, args.mt4_pivots, args.mt4_waves, args.depth, args.deviation, args.backstep,
+                pip_size=args.pip_size, mt4_point=args.mt4_point,
+                time_tolerance=pd.Timedelta(minutes=args.time_tolerance_minutes),
+                price_tolerance=args.price_tolerance, pips_tolerance=args.pips_tolerance,
+                bars_tolerance=args.bars_tolerance, bar_minutes=args.bar_minutes, start_date=args.start_date, end_date=args.end_date,
+                clip=not args.no_clip, diff_dir=args.diff_dir
+            )
+            if args.min_match_rate is not None:
+                for kind in ["pivots", "waves"]:
+                    rate = output["conformance"].get(kind, {}).get("match_rate")
+                    if rate is not None and rate < args.min_match_rate:
+                        failures.append(f"{kind} match rate {rate:.4f} below {args.min_match_rate}")
+        if args.benchmark:
+            engines = [e.strip() for e in args.engines.split(",") if e.strip()] or None
+            unknown = sorted(set(engines or []) - set(ZIGZAG_ENGINES))
+            if unknown:
+                raise ValueError(f"Unknown engines: {', '.join(unknown)}")
+            sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+            output["benchmark"] = run_benchmark(
+                args.csv_path, sizes, args.depth, args.deviation, args.backstep, args.pip_size, args.repeat, engines
+            )
+            for series, result in output["benchmark"].items():
+                for engine, stats in result["engines"].items():
+                    if not stats["exact"]:
+                        failures.append(f"{engine} pivots differ from the reference on {series}")
+        if not args.mt4_pivots and not args.benchmark:
+            raise ValueError("Nothing to do: give --mt4_pivots and/or --benchmark")
+        output["success"] = not failures
+        output["error"] = "; ".join(failures)
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    if args.report_json:
+        with open(args.report_json, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2)
+    print(json.dumps(output))
+    if not output["success"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+import argparse
+import json
+import os
+import tempfile
+import logging
+
+import numpy as np
+
+from bar_store import load_bars
+from wave_analysis import zigzag_extremum_buffers, wave_columns, wave_records, wave_band_stats_mt4, infer_bar_minutes
+
+logger = logging.getLogger(__name__)
+
+# Bump when the saved state layout changes; older states are rebuilt from scratch
+STATE_VERSION = 1
+
+BAND_NAMES = ["Normal", "Medium", "Rare"]
+PIVOT_TYPES = {1: 'High', -1: 'Low'}
+PIVOT_CODES = {'High': 1, 'Low': -1}
+
+def _pass2(ExtLowBuffer, ExtHighBuffer, lows, highs, candidates, sync=None):
+    """
+    The zigzag_pivots_from_buffers state machine over candidates (descending bar indices),
+    recording after every candidate the state row (whatlookfor, lastlow, lasthigh, last pivot bar,
+    pivot count). sync(i, row) returning True stops the walk after bar i.
+    Returns (build, rows, stopped) where build holds (bar, price, 'High'/'Low') newest first.
+    """
+    build = []
+    rows = []
+    whatlookfor = 0
+    lastlow = 0.0
+    lasthigh = 0.0
+    for i in candidates:
+        low_i = ExtLowBuffer[i]
+        high_i = ExtHighBuffer[i]
+        if whatlookfor == 0:
+            if lastlow == 0.0 and lasthigh == 0.0:
+                if high_i != 0.0:
+                    lasthigh = highs[i]
+                    whatlookfor = -1
+                    build.append((i, lasthigh, 'High'))
+                if low_i != 0.0:
+                    lastlow = lows[i]
+                    whatlookfor = 1
+                    build.append((i, lastlow, 'Low'))
+        elif whatlookfor == 1:  # look for peak
+            if low_i != 0.0 and low_i < lastlow and high_i == 0.0:
+                lastlow = low_i
+                build[-1] = (i, lastlow, 'Low')
+            if high_i != 0.0 and low_i == 0.0:
+                lasthigh = high_i
+                whatlookfor = -1
+                build.append((i, lasthigh, 'High'))
+        elif whatlookfor == -1:  # look for lawn
+            if high_i != 0.0 and high_i > lasthigh and low_i == 0.0:
+                lasthigh = high_i
+                build[-1] = (i, lasthigh, 'High')
+            if low_i != 0.0 and high_i == 0.0:
+                lastlow = low_i
+                whatlookfor = 1
+                build.append((i, lastlow, 'Low'))
+        row = (whatlookfor, lastlow, lasthigh, build[-1][0] if build else -1, len(build))
+        rows.append(row)
+        if sync is not None and sync(i, row):
+            return build, rows, True
+    return build, rows, False
+
+def _filter_wave_indices(waves, percentage, force_factor, deviation, start=0, state=None):
+    """
+    filter_waves as indices into waves, resumable: state is the snapshot
+    (prev_type, prev_pips, filtered indices) after wave start-1.
+    Returns (filtered indices, one snapshot per wave from start on).
+    """
+    if percentage == 0.0 and force_factor == 0:
+        return list(range(len(waves))), []
+    prev_type, prev_pips, filtered = state if state is not None else (None, None, [])
+    filtered = list(filtered)
+    snapshots = []
+    for k in range(start, len(waves)):
+        wave = waves[k]
+        this_type = wave['type']
+        pips = wave['pips']
+        if prev_type == this_type:
+            percentage_ok = (prev_pips is None or pips >= prev_pips * (percentage / 100.0))
+            force_ok = pips >= (force_factor * deviation)
+            if percentage_ok and force_ok:
+                filtered.append(k)
+                prev_type = this_type
+                prev_pips = pips
+            else:
+                if filtered:
+                    filtered[-1] = k
+        else:
+            filtered.append(k)
+            prev_type = this_type
+            prev_pips = pips
+        snapshots.append((prev_type, prev_pips, len(filtered), filtered[-1] if filtered else -1))
+    return filtered, snapshots
+
+class IncrementalZigZag:
+    """
+    MT4 ZigZag pivots, waves, filtered waves and band stats of a growing bar history.
+    update() takes the latest bars (the full history or any tail that overlaps the stored one)
+    and recomputes only what the new or changed bars can affect:
+    - pass 1 buffers from the first bar whose depth window or backstep reach saw a change;
+    - pass 2 (which walks from the newest bar back) until its state matches the trace of the
+      previous run at the same bar, then reuses the older pivots as they were;
+    - waves after the last unchanged pivot, and the wave filter from its snapshot before them.
+    Results are identical to a full recompute with zigzag_mt4_pivots, filter_waves and wave_band_stats_mt4.
+    bar_minutes=None infers the bar length from the stored bars, as wave_analysis_profile does.
+    """
+
+    def __init__(self, depth=12, deviation=5, backstep=3, percentage=50.0, force_factor=3, normal_wave=80, medium_wave=15,
+                 pip_size=0.0001, bar_minutes=None):
+        self.params = {
+            "depth": int(depth), "deviation": float(deviation), "backstep": int(backstep),
+            "percentage": float(percentage), "force_factor": float(force_factor),
+            "normal_wave": float(normal_wave), "medium_wave": float(medium_wave),
+            # 0: inferred from the bars on each update
+            "pip_size": float(pip_size), "bar_minutes": float(bar_minutes or 0),
+        }
+        self.times = np.empty(0, dtype="datetime64[ns]")
+        self.lows = np.empty(0)
+        self.highs = np.empty(0)
+        self.ext_low = np.empty(0)
+        self.ext_high = np.empty(0)
+        # Pass 2 trace, ascending by bar: state after each candidate bar
+        self.trace_bars = np.empty(0, dtype=np.int64)
+        self.trace_what = np.empty(0, dtype=np.int8)
+        self.trace_low = np.empty(0)
+        self.trace_high = np.empty(0)
+        self.trace_last = np.empty(0, dtype=np.int64)
+        self.trace_count = np.empty(0, dtype=np.int64)
+        self.build = []
+        self.waves = []
+        self.wave_pairs = []
+        self.filtered = []
+        self.filter_snapshots = []
+        self.band_stats = None
+        self.last_update = {}
+
+    @property
+    def pivots(self):
+        """[(datetime64, price, 'High'/'Low')], oldest first, as zigzag_mt4_pivots returns them."""
+        return [(self.times[bar], price, kind) for bar, price, kind in reversed(self.build)]
+
+    @property
+    def filtered_waves(self):
+        return [self.waves[k] for k in self.filtered]
+
+    def _merge_bars(self, bars):
+        """Stores the incoming bars; returns the index of the first new or changed bar (None when nothing changed)."""
+        times = bars['datetime'].values.astype("datetime64[ns]")
+        lows = bars['low'].to_numpy(dtype=np.float64)
+        highs = bars['high'].to_numpy(dtype=np.float64)
+        old_n = len(self.times)
+        if not len(times):
+            return None
+        if old_n and times[0] < self.times[0]:
+            raise ValueError("bars start before the stored history")
+        if old_n and times[0] > self.times[-1]:
+            # A gap would be stored as if the bars were consecutive; resend at least the last stored bar
+            raise ValueError("bars do not overlap the stored history")
+        pos = int(np.searchsorted(self.times, times[0]))
+        overlap = min(old_n - pos, len(times))
+        if not np.array_equal(self.times[pos:pos + overlap], times[:overlap]):
+            raise ValueError("bars do not line up with the stored history")
+        changed = np.flatnonzero(
+            (self.lows[pos:pos + overlap] != lows[:overlap]) | (self.highs[pos:pos + overlap] != highs[:overlap])
+        )
+        if changed.size:
+            first = pos + int(changed[0])
+        elif pos + len(times) > old_n:
+            first = old_n
+        else:
+            return None
+        cut = first - pos
+        self.times = np.concatenate([self.times[:first], times[cut:]])
+        self.lows = np.concatenate([self.lows[:first], lows[cut:]])
+        self.highs = np.concatenate([self.highs[:first], highs[cut:]])
+        return first
+
+    def update(self, bars):
+        """
+        Brings the state up to date with bars (DataFrame with datetime, low, high).
+        Bars from the first changed one on replace the stored tail. Once history is stored, bars must
+        start at or before its last bar (ValueError otherwise). Returns True when anything changed.
+        """
+        old_n = len(self.times)
+        first = self._merge_bars(bars)
+        if first is None:
+            self.last_update = {"changed": False}
+            return False
+        depth = self.params["depth"]
+        backstep = max(self.params["backstep"], 0)
+        deviation = self.params["deviation"]
+        n = len(self.times)
+        old_limit = old_n - depth
+        limit = n - depth
+
+        # Pass 1: buffers below dirty are untouched by bars >= first
+        dirty = max(0, min(old_limit - 1, first - depth)) if old_limit > 0 else 0
+        start = max(0, dirty - backstep)
+        ext_low = np.zeros(n)
+        ext_high = np.zeros(n)
+        ext_low[:dirty] = self.ext_low[:dirty]
+        ext_high[:dirty] = self.ext_high[:dirty]
+        if limit > 0:
+            low_part, high_part, _ = zigzag_extremum_buffers(
+                self.lows[start:], self.highs[start:], depth, deviation, backstep, pip_size=self.params["pip_size"]
+            )
+            ext_low[dirty:] = low_part[dirty - start:]
+            ext_high[dirty:] = high_part[dirty - start:]
+
+        # Pass 2: walk from the newest candidate until the state matches the previous run
+        if limit > 0:
+            candidates = np.flatnonzero((ext_low[:limit] != 0.0) | (ext_high[:limit] != 0.0))
+        else:
+            candidates = np.empty(0, dtype=np.int64)
+        old_bars = self.trace_bars
+        match = {}
+
+        def sync(i, row):
+            if i > dirty:
+                return False
+            k = int(np.searchsorted(old_bars, i))
+            if k >= len(old_bars) or old_bars[k] != i:
+                return False
+            old_row = (int(self.trace_what[k]), self.trace_low[k], self.trace_high[k], int(self.trace_last[k]))
+            if row[:4] != old_row:
+                return False
+            match["k"] = k
+            return True
+
+        build, rows, stopped = _pass2(
+            ext_low, ext_high, self.lows, self.highs, candidates[::-1].tolist(), sync if old_n else None
+        )
+        new_bars = candidates[len(candidates) - len(rows):]
+        if stopped:
+            k = match["k"]
+            count = int(self.trace_count[k])
+            reused = self.build[count:] if not build else self.build[count - 1:]
+            head = build[:-1] if build else []
+            shift = len(head) - count + (1 if build else 0)
+            self.build = head + reused
+            self.trace_bars = np.concatenate([old_bars[:k], new_bars])
+            self.trace_what = np.concatenate([self.trace_what[:k], np.array([r[0] for r in rows[::-1]], dtype=np.int8)])
+            self.trace_low = np.concatenate([self.trace_low[:k], np.array([r[1] for r in rows[::-1]], dtype=np.float64)])
+            self.trace_high = np.concatenate([self.trace_high[:k], np.array([r[2] for r in rows[::-1]], dtype=np.float64)])
+            self.trace_last = np.concatenate([self.trace_last[:k], np.array([r[3] for r in rows[::-1]], dtype=np.int64)])
+            self.trace_count = np.concatenate([self.trace_count[:k] + shift, np.array([r[4] for r in rows[::-1]], dtype=np.int64)])
+        else:
+            self.build = build
+            self._set_trace(new_bars, rows[::-1])
+        self.ext_low = ext_low
+        self.ext_high = ext_high
+
+        reused_waves = self._update_waves()
+        self.last_update = {
+            "changed": True, "first_changed_bar": first, "pass1_from_bar": dirty,
+            "pass2_steps": len(rows), "pass2_synced": stopped, "reused_waves": reused_waves,
+        }
+        logger.info(f"ZigZag update: {n - old_n:+d} bars, pass 2 walked {len(rows)} of {len(candidates)} candidates")
+        return True
+
+    def _set_trace(self, trace_bars, rows):
+        self.trace_bars = np.asarray(trace_bars, dtype=np.int64)
+        self.trace_what = np.array([r[0] for r in rows], dtype=np.int8)
+        self.trace_low = np.array([r[1] for r in rows], dtype=np.float64)
+        self.trace_high = np.array([r[2] for r in rows], dtype=np.float64)
+        self.trace_last = np.array([r[3] for r in rows], dtype=np.int64)
+        self.trace_count = np.array([r[4] for r in rows], dtype=np.int64)
+
+    def _update_waves(self, old_pivots=None):
+        """Waves after the last unchanged pivot, the wave filter from its snapshot, band stats when the filtered waves changed."""
+        old_filtered = [id(w) for w in self.filtered_waves]
+        if old_pivots is None:
+            old_pivots = getattr(self, "_pivot_keys", [])
+        keys = [(bar, price, kind) for bar, price, kind in reversed(self.build)]
+        common = 0
+        for a, b in zip(old_pivots, keys):
+            if a != b:
+                break
+            common += 1
+        self._pivot_keys = keys
+        # An inferred bar length that moved with the new bars changes every wave's bar count
+        bar_minutes = self.params["bar_minutes"] or infer_bar_minutes(self.times)
+        if bar_minutes != getattr(self, "_bar_minutes", bar_minutes):
+            common = 0
+        self._bar_minutes = bar_minutes
+
+        # Wave of pair p joins pivots p-1 and p; pairs below common are unchanged
+        keep = 0
+        while keep < len(self.wave_pairs) and self.wave_pairs[keep] < common:
+            keep += 1
+        waves = self.waves[:keep]
+        wave_pairs = self.wave_pairs[:keep]
+        first = max(common, 1)
+        if first < len(keys):
+            tail = keys[first - 1:]
+            columns = wave_columns(
+                self.times[[p[0] for p in tail]], [p[1] for p in tail], [p[2] for p in tail],
+                pip_size=self.params["pip_size"], bar_minutes=bar_minutes
+            )
+            waves.extend(wave_records(columns))
+            wave_pairs.extend((columns["pivot"] + first - 1).tolist())
+        self.waves = waves
+        self.wave_pairs = wave_pairs
+
+        params = self.params
+        state = None
+        if keep and keep <= len(self.filter_snapshots):
+            prev_type, prev_pips, count, last = self.filter_snapshots[keep - 1]
+            state = (prev_type, prev_pips, self.filtered[:count - 1] + [last] if count else [])
+        filtered, snapshots = _filter_wave_indices(
+            waves, params["percentage"], params["force_factor"], params["deviation"],
+            start=keep if state is not None else 0, state=state
+        )
+        self.filter_snapshots = (self.filter_snapshots[:keep] if state is not None else []) + snapshots
+        self.filtered = filtered
+
+        if [id(w) for w in self.filtered_waves] != old_filtered or self.band_stats is None:
+            if filtered:
+                percentiles = [params["normal_wave"], params["normal_wave"] + params["medium_wave"]]
+                self.band_stats = wave_band_stats_mt4(self.filtered_waves, percentiles)
+            else:
+                self.band_stats = None
+        return keep
+
+    def save(self, state_path):
+        """Writes the state (bars, pass 1 buffers, pass 2 trace, pivots) to an .npz file, atomically."""
+        meta = dict(self.params, version=STATE_VERSION)
+        directory = os.path.dirname(os.path.abspath(state_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".npz")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(
+                    f,
+                    meta=np.array(json.dumps(meta)),
+                    times=self.times.astype("datetime64[ns]").view(np.int64),
+                    lows=self.lows, highs=self.highs, ext_low=self.ext_low, ext_high=self.ext_high,
+                    trace_bars=self.trace_bars, trace_what=self.trace_what, trace_low=self.trace_low,
+                    trace_high=self.trace_high, trace_last=self.trace_last, trace_count=self.trace_count,
+                    pivot_bars=np.array([p[0] for p in self.build], dtype=np.int64),
+                    pivot_prices=np.array([p[1] for p in self.build], dtype=np.float64),
+                    pivot_types=np.array([PIVOT_CODES[p[2]] for p in self.build], dtype=np.int8),
+                )
+            os.replace(tmp_path, state_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, state_path):
+        """State saved by save(); waves, filtered waves and band stats are derived again from the pivots."""
+        with np.load(state_path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.pop("version", None) != STATE_VERSION:
+                raise ValueError(f"{state_path} has an unsupported state version")
+            zz = cls(**meta)
+            zz.times = data["times"].view("datetime64[ns]")
+            for name in ["lows", "highs", "ext_low", "ext_high", "trace_bars", "trace_what", "trace_low",
+                         "trace_high", "trace_last", "trace_count"]:
+                setattr(zz, name, data[name])
+            zz.build = [
+                (int(bar), price, PIVOT_TYPES[int(kind)])
+                for bar, price, kind in zip(data["pivot_bars"], data["pivot_prices"], data["pivot_types"])
+            ]
+        zz._update_waves()
+        return zz
+
+def load_or_create(state_path, **params):
+    """The saved state when it exists and was built with the same parameters, a fresh one otherwise."""
+    fresh = IncrementalZigZag(**params)
+    if state_path and os.path.exists(state_path):
+        try:
+            zz = IncrementalZigZag.load(state_path)
+            if zz.params == fresh.params:
+                return zz
+            logger.info(f"{state_path} was built with other parameters, starting over")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable ZigZag state {state_path}: {e}")
+    return fresh
+
+def main():
+    parser = argparse.ArgumentParser(description="Incremental ZigZag wave analysis: only new bars are processed on each run.")
+    parser.add_argument('--csv_path', type=str, required=True, help='Path to MT4 CSV or HST file')
+    parser.add_argument('--state_path', type=str, required=True, help='ZigZag state file (.npz), created on the first run')
+    parser.add_argument('--depth', type=int, default=12, help='ZigZag Depth')
+    parser.add_argument('--deviation', type=float, default=5, help='ZigZag Deviation')
+    parser.add_argument('--backstep', type=int, default=3, help='ZigZag Backstep')
+    parser.add_argument('--percentage', type=float, default=50.0, help='Filter percentage')
+    parser.add_argument('--force_factor', type=float, default=3, help='Filter force factor')
+    parser.add_argument('--normal_wave', type=float, default=80, help='Normal Wave percentile')
+    parser.add_argument('--medium_wave', type=float, default=15, help='Medium Wave percentile')
+    parser.add_argument('--pip_size', type=float, default=0.0001, help='Pip size (0.01 for JPY pairs)')
+    parser.add_argument('--bar_minutes', type=float, default=None, help='Bar length in minutes (default: inferred from the data)')
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        zz = load_or_create(
+            args.state_path, depth=args.depth, deviation=args.deviation, backstep=args.backstep,
+            percentage=args.percentage, force_factor=args.force_factor,
+            normal_wave=args.normal_wave, medium_wave=args.medium_wave,
+            pip_size=args.pip_size, bar_minutes=args.bar_minutes
+        )
+        if zz.update(load_bars(args.csv_path)):
+            zz.save(args.state_path)
+        output.update({k: (v.item() if isinstance(v, np.generic) else v) for k, v in zz.last_update.items()})
+        output["bars"] = len(zz.times)
+        output["pivots"] = len(zz.build)
+        output["waves"] = len(zz.filtered)
+        output["bands"] = {
+            name: {k: float(v) for k, v in stats.items()}
+            for name, stats in zip(BAND_NAMES, zz.band_stats or [])
+        }
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    main()
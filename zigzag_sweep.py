@@ -0,0 +1,179 @@
+import argparse
+import itertools
+import json
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from bar_store import load_bars
+from wave_analysis import (
+    filter_bars_by_date_range, _rolling_extremum, zigzag_extremum_buffers,
+    zigzag_pivots_from_buffers, pivot_arrays, wave_columns, filter_wave_indices, wave_band_stats_columns,
+    infer_bar_minutes
+)
+
+logger = logging.getLogger(__name__)
+
+BAND_NAMES = ["Normal", "Medium", "Rare"]
+STAT_COLUMNS = ["count", "total_bars", "total_pips", "avg_bars", "avg_pips", "longest_bars", "longest_pips",
+                "shortest_bars", "shortest_pips", "min_pips", "max_pips"]
+
+_bars = None
+
+def _init_worker(lows, highs, times):
+    global _bars
+    _bars = (lows, highs, times)
+
+def sweep_depth(depth, deviations, backsteps, percentages, force_factors, percentiles, bars=None, bar_minutes=None,
+                pip_size=0.0001):
+    """
+    All combinations for one depth. The rolling extrema are computed once for the depth,
+    pivots and waves once per (deviation, backstep), and only the wave filter runs per
+    (percentage, force_factor). Returns tidy rows (one per combination and band).
+    bar_minutes: bar length for wave durations; None takes it from the bar times.
+    pip_size: deviation and wave pip unit (0.01 for JPY pairs).
+    """
+    lows, highs, times = bars if bars is not None else _bars
+    if not bar_minutes:
+        bar_minutes = infer_bar_minutes(times)
+    limit = len(lows) - depth
+    low_windows = high_windows = None
+    if limit > 0:
+        low_windows = _rolling_extremum(lows, depth, limit, np.minimum)
+        high_windows = _rolling_extremum(highs, depth, limit, np.maximum)
+    rows = []
+    for deviation, backstep in itertools.product(deviations, backsteps):
+        ext_low, ext_high, limit = zigzag_extremum_buffers(
+            lows, highs, depth, deviation, backstep, low_windows=low_windows, high_windows=high_windows,
+            pip_size=pip_size
+        )
+        pivots = zigzag_pivots_from_buffers(ext_low, ext_high, lows, highs, times, limit)
+        waves = wave_columns(*pivot_arrays(pivots), pip_size=pip_size, bar_minutes=bar_minutes)
+        for percentage, force_factor in itertools.product(percentages, force_factors):
+            combo = {"depth": depth, "deviation": deviation, "backstep": backstep,
+                     "percentage": percentage, "force_factor": force_factor, "pivots": len(pivots)}
+            keep = filter_wave_indices(waves["type"], waves["pips"], percentage, force_factor, deviation)
+            combo["waves"] = len(keep)
+            if not len(keep):
+                rows.append(dict(combo, band=None))
+                continue
+            band_stats = wave_band_stats_columns(waves["bars"][keep], waves["pips"][keep], percentiles)
+            for name, stats in zip(BAND_NAMES, band_stats):
+                rows.append(dict(combo, band=name, **{k: stats[k] for k in STAT_COLUMNS}))
+    return rows
+
+def run_zigzag_sweep(
+    csv_path,
+    depths,
+    deviations,
+    backsteps,
+    percentages=(50.0,),
+    force_factors=(3,),
+    normal_wave=80,
+    medium_wave=15,
+    start_date=None,
+    end_date=None,
+    workers=None,
+    bar_minutes=None,
+    pip_size=0.0001
+):
+    """
+    Evaluates every depth/deviation/backstep/percentage/force_factor combination on one bar
+    history, which is read once. Depths are spread over a process pool.
+    bar_minutes: bar length for wave durations; None infers it from the bars.
+    pip_size: deviation and wave pip unit (0.01 for JPY pairs).
+    Returns a DataFrame with one row per combination and band (Normal/Medium/Rare).
+    """
+    bars = load_bars(csv_path)
+    if start_date and end_date:
+        bars = filter_bars_by_date_range(
+            bars, datetime.strptime(start_date, "%Y-%m-%d %H:%M"), datetime.strptime(end_date, "%Y-%m-%d %H:%M")
+        )
+    arrays = (
+        bars['low'].to_numpy(dtype=np.float64),
+        bars['high'].to_numpy(dtype=np.float64),
+        bars['datetime'].values,
+    )
+    if not bar_minutes:
+        bar_minutes = infer_bar_minutes(arrays[2])
+    percentiles = [normal_wave, normal_wave + medium_wave]
+    args = (list(deviations), list(backsteps), list(percentages), list(force_factors), percentiles)
+    depths = list(dict.fromkeys(depths))
+    workers = min(workers or os.cpu_count() or 1, len(depths))
+
+    rows = []
+    if workers <= 1:
+        for depth in depths:
+            rows.extend(sweep_depth(depth, *args, bars=arrays, bar_minutes=bar_minutes, pip_size=pip_size))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=arrays) as executor:
+            futures = [executor.submit(sweep_depth, depth, *args, bar_minutes=bar_minutes, pip_size=pip_size) for depth in depths]
+            for future in futures:
+                rows.extend(future.result())
+    columns = ["depth", "deviation", "backstep", "percentage", "force_factor", "pivots", "waves", "band"] + STAT_COLUMNS
+    return pd.DataFrame(rows, columns=columns)
+
+def _grid(text, cast):
+    """"12,24,36" or "5:30:5" (start:end:step, inclusive) -> list."""
+    values = []
+    for part in text.split(","):
+        part = part.strip()
+        if ":" in part:
+            start, end, step = (cast(x) for x in part.split(":"))
+            v = start
+            while v <= end + (step * 1e-9 if cast is float else 0):
+                values.append(round(v, 10) if cast is float else v)
+                v += step
+        elif part:
+            values.append(cast(part))
+    return values
+
+def main():
+    parser = argparse.ArgumentParser(description="ZigZag parameter sweep: band stats for every depth/deviation/backstep/percentage/force_factor combination.")
+    parser.add_argument('--csv_path', type=str, required=True, help='Path to MT4 CSV file')
+    parser.add_argument('--depth', type=str, default="12", help='Depths, e.g. "8,12,24" or "6:36:6"')
+    parser.add_argument('--deviation', type=str, default="5", help='Deviations, e.g. "3,5,8"')
+    parser.add_argument('--backstep', type=str, default="3", help='Backsteps, e.g. "2:5:1"')
+    parser.add_argument('--percentage', type=str, default="50", help='Filter percentages')
+    parser.add_argument('--force_factor', type=str, default="3", help='Filter force factors')
+    parser.add_argument('--normal_wave', type=float, default=80, help='Normal Wave percentile')
+    parser.add_argument('--medium_wave', type=float, default=15, help='Medium Wave percentile')
+    parser.add_argument('--start_date', type=str, default=None, help='Analysis start date (YYYY-MM-DD HH:MM)')
+    parser.add_argument('--end_date', type=str, default=None, help='Analysis end date (YYYY-MM-DD HH:MM)')
+    parser.add_argument('--pip_size', type=float, default=0.0001, help='Pip size (0.01 for JPY pairs)')
+    parser.add_argument('--bar_minutes', type=float, default=None, help='Bar length in minutes (default: inferred from the data)')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--output', type=str, required=True, help='Result CSV (one row per combination and band)')
+    args = parser.parse_args()
+
+    output = {}
+    try:
+        started = time.perf_counter()
+        table = run_zigzag_sweep(
+            args.csv_path, _grid(args.depth, int), _grid(args.deviation, float), _grid(args.backstep, int),
+            _grid(args.percentage, float), _grid(args.force_factor, float),
+            normal_wave=args.normal_wave, medium_wave=args.medium_wave,
+            start_date=args.start_date, end_date=args.end_date, workers=args.workers,
+            bar_minutes=args.bar_minutes, pip_size=args.pip_size
+        )
+        table.to_csv(args.output, index=False)
+        output["rows"] = len(table)
+        output["combinations"] = int(table[["depth", "deviation", "backstep", "percentage", "force_factor"]].drop_duplicates().shape[0])
+        output["output"] = args.output
+        output["elapsed_sec"] = round(time.perf_counter() - started, 3)
+        output["success"] = True
+        output["error"] = ""
+    except Exception as e:
+        output["success"] = False
+        output["error"] = str(e)
+    print(json.dumps(output))
+
+if __name__ == "__main__":
+    import multiprocessing
+    multiprocessing.freeze_support()
+    main()